@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Compteurs de commandes par (restaurant, statut) et (zone, statut) côté MongoDB.
+
+Collection counters :
+  { _id: "restaurant:<rid>", statuts: { CREEE: 3, ANONCEE: 1, ... } }
+  { _id: "zone:<zone>",      statuts: { ... } }
+
+La création applique un $inc +1 dans la même transaction que l'insertion (replica
+set requis, comme pour les change streams). Les transitions (mongo_order_state)
+envoient le $inc -1/+1 sans accusé de réception (w=0) après le find_one_and_update :
+pas d'aller-retour de plus, un écart éventuel est corrigé par la réconciliation.
+Les dashboards lisent un seul document par _id.
+
+reconcile_counters() recalcule tout par agrégation ($group) et réécrit les
+documents faux, dans une transaction : une transition concurrente sur le même
+compteur provoque un conflit d'écriture et la réconciliation est rejouée.
+    python mongo_counters.py [--loop 300]
+"""
+
+import os, time, argparse
+from collections import defaultdict
+from pymongo import MongoClient, UpdateOne
+from pymongo.write_concern import WriteConcern
+
+STATUTS = ("CREEE", "ANONCEE", "ASSIGNEE", "EN_LIVRAISON", "LIVREE", "ANNULEE")
+
+def counter_ids(order: dict):
+    ids = []
+    rid = (order.get("restaurant") or {}).get("id")
+    if rid:
+        ids.append(f"restaurant:{rid}")
+    if order.get("zone"):
+        ids.append(f"zone:{order['zone']}")
+    return ids
+
+def _inc(old_statut, new_statut):
+    inc = {}
+    if old_statut:
+        inc[f"statuts.{old_statut}"] = -1
+    if new_statut:
+        inc[f"statuts.{new_statut}"] = inc.get(f"statuts.{new_statut}", 0) + 1
+    return inc
+
+def count_transition(db, order: dict, old_statut, new_statut, session=None):
+    """$inc sur les compteurs de la commande ; old_statut None = création."""
+    inc = _inc(old_statut, new_statut)
+    for cid in counter_ids(order):
+        db.counters.update_one({"_id": cid}, {"$inc": inc}, upsert=True, session=session)
+
+def count_transition_unacked(db, order: dict, old_statut, new_statut):
+    """Même $inc, en un seul bulk_write non acquitté (w=0) : l'appelant n'attend pas de réponse."""
+    if old_statut == new_statut:
+        return
+    ops = [UpdateOne({"_id": cid}, {"$inc": _inc(old_statut, new_statut)}, upsert=True) for cid in counter_ids(order)]
+    if ops:
+        db.counters.with_options(write_concern=WriteConcern(w=0)).bulk_write(ops, ordered=False)
+
+def restaurant_counts(db, rid) -> dict:
+    doc = db.counters.find_one({"_id": f"restaurant:{rid}"}) or {}
+    return doc.get("statuts") or {}
+
+def zone_count(db, zone, statut) -> int:
+    doc = db.counters.find_one({"_id": f"zone:{zone}"}, {f"statuts.{statut}": 1}) or {}
+    return (doc.get("statuts") or {}).get(statut, 0)
+
+def compute_counters(db, session=None) -> dict:
+    counts = defaultdict(dict)
+    for field, prefix in (("$restaurant.id", "restaurant"), ("$zone", "zone")):
+        pipeline = [
+            {"$match": {"statut": {"$in": list(STATUTS)}}},
+            {"$group": {"_id": {"k": field, "statut": "$statut"}, "nb": {"$sum": 1}}},
+        ]
+        for row in db.orders.aggregate(pipeline, session=session):
+            k = row["_id"].get("k")
+            if k:
+                counts[f"{prefix}:{k}"][row["_id"]["statut"]] = row["nb"]
+    return counts
+
+def reconcile_counters(client, db) -> int:
+    """Réécrit les compteurs faux ; retourne le nombre de documents corrigés."""
+    def txn(session):
+        counts = compute_counters(db, session=session)
+        fixed = []
+        stored_docs = {d["_id"]: d.get("statuts") or {} for d in db.counters.find({}, session=session)}
+        for cid in set(stored_docs) | set(counts):
+            wanted = counts.get(cid, {})
+            stored = {s: n for s, n in stored_docs.get(cid, {}).items() if n}
+            if wanted != stored:
+                db.counters.replace_one({"_id": cid}, {"_id": cid, "statuts": wanted},
+                                        upsert=True, session=session)
+                fixed.append((cid, wanted))
+        return fixed
+
+    with client.start_session() as s:
+        fixed = s.with_transaction(txn)
+    for cid, wanted in fixed:
+        print(f"🔧 {cid} -> {wanted}")
+    return len(fixed)
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+    ap = argparse.ArgumentParser(description="Vérifie et répare la collection counters depuis orders.")
+    ap.add_argument("--loop", type=float, default=0, help="Relance toutes les N secondes (0 = un seul passage)")
+    args = ap.parse_args()
+    client = MongoClient(os.getenv("MONGODB_URI") or os.getenv("MONGO_URI"))
+    db = client[os.getenv("DB_NAME", "ubereats_poc")]
+    while True:
+        print(f"✅ Compteurs vérifiés : {reconcile_counters(client, db)} corrigé(s)")
+        if not args.loop:
+            break
+        time.sleep(args.loop)
+
+if __name__ == "__main__":
+    main()
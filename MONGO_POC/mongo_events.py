@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Flux d'événements de commande du POC MongoDB : un seul change stream par processus.
+
+  - event_source(db) : source de common.event_hub.EventHub (un thread lecteur, files
+    bornées par client SSE) au lieu d'un curseur watch() par client ;
+  - WATCH_PIPELINE : $match des opérations utiles puis $project des seuls champs lus
+    par map_change_to_event (plus de lignes, événements ni intérêts dans le flux) ;
+  - journal order_events (collection plafonnée) : chaque événement y est écrit avec
+    pour _id le jeton de reprise du change stream (`_data`, croissant) ; il sert
+      * de Last-Event-ID : replay_events() rejoue ce qu'un navigateur a manqué,
+      * de jeton persistant : au redémarrage, le watcher reprend après la dernière
+        entrée (resume_after), sans trou ; jeton trop ancien => reprise à maintenant.
+    Plusieurs processus écrivent les mêmes _id : les doublons sont ignorés.
+
+Les mises à jour ne transportent que les champs modifiés ; les champs de portée
+(zone, client, restaurant...) viennent donc encore de full_document='updateLookup',
+mais une seule fois par changement et par processus, et projetés.
+"""
+
+import time
+from pymongo.errors import CollectionInvalid, DuplicateKeyError, OperationFailure
+
+EVENTS_COLLECTION = "order_events"
+EVENTS_MAX = 10000
+EVENTS_SIZE = 16 * 1024 * 1024        # octets, plafond de la collection
+
+def _updated(field):
+    return {"$getField": {"field": field, "input": "$updateDescription.updatedFields"}}
+
+WATCH_PIPELINE = [
+    {"$match": {"operationType": {"$in": ["insert", "update"]}}},
+    {"$project": {
+        "operationType": 1,
+        "clusterTime": 1,
+        "documentKey": 1,                              # _id = id de commande
+        "nouveau_statut": _updated("statut"),          # absent si inchangé
+        "nouveau_livreur": _updated("id_livreur_assigne"),
+        "fullDocument.statut": 1,
+        "fullDocument.zone": 1,
+        "fullDocument.client.id": 1,
+        "fullDocument.restaurant.id": 1,
+        "fullDocument.id_livreur_assigne": 1,
+        "fullDocument.remuneration": 1,
+        "fullDocument.motif_annulation": 1,
+        "fullDocument.livree_par_livreur": 1,
+    }},
+]
+
+def ensure_event_log(db):
+    try:
+        db.create_collection(EVENTS_COLLECTION, capped=True, size=EVENTS_SIZE, max=EVENTS_MAX)
+    except CollectionInvalid:
+        pass                                   # existe déjà
+
+def map_change_to_event(change: dict) -> dict:
+    """
+    Change stream (projeté par WATCH_PIPELINE) -> événement au schéma commun :
+      {"id": <jeton>, "event": "<created|published|assigned|cancelled|updated|delivered>",
+       "channel": "orders.<...>", "payload": {...}, "ts": <epoch>}
+    """
+    order = change.get("fullDocument") or {}
+    ct = change.get("clusterTime")
+    ts = ct.time if ct is not None else int(time.time())
+
+    # champs de portée (common.event_scopes) dans tous les payloads
+    ev, channel = "updated", "orders.updated"
+    payload = {
+        "id": (change.get("documentKey") or {}).get("_id"),
+        "statut": order.get("statut"),
+        "zone": order.get("zone"),
+        "id_client": (order.get("client") or {}).get("id"),
+        "id_restaurant": (order.get("restaurant") or {}).get("id"),
+        "id_livreur_assigne": order.get("id_livreur_assigne"),
+    }
+
+    new_status = change.get("nouveau_statut")
+    if change.get("operationType") == "insert":
+        ev, channel = "created", "orders.created"
+    elif new_status == "ANONCEE":
+        ev, channel = "published", "orders.published"
+        payload["remuneration"] = order.get("remuneration", 0)
+    elif new_status == "ASSIGNEE" or (new_status is None and "nouveau_livreur" in change):
+        ev, channel = "assigned", "orders.assigned"
+        payload["livreur"] = change.get("nouveau_livreur") or order.get("id_livreur_assigne")
+    elif new_status == "ANNULEE":
+        ev, channel = "cancelled", "orders.cancelled"
+        payload["motif"] = order.get("motif_annulation")
+    elif new_status == "LIVREE":
+        ev = "delivered"
+        payload["livreur"] = order.get("livree_par_livreur")
+    if new_status:
+        payload["statut"] = new_status
+
+    return {"id": change["_id"]["_data"], "event": ev, "channel": channel, "payload": payload, "ts": ts}
+
+def log_event(db, event):
+    doc = dict(event)
+    doc["_id"] = doc.pop("id")
+    try:
+        db[EVENTS_COLLECTION].insert_one(doc)
+    except DuplicateKeyError:
+        pass                                   # déjà journalisé par un autre processus
+
+def _to_event(doc):
+    doc = dict(doc)
+    doc["id"] = doc.pop("_id")
+    return doc
+
+def last_event_id(db):
+    last = db[EVENTS_COLLECTION].find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    return last["_id"] if last else None
+
+def replay_events(db, after_id, limit=1000):
+    """Événements journalisés strictement après after_id (rattrapage d'un client SSE)."""
+    cur = db[EVENTS_COLLECTION].find({"_id": {"$gt": after_id}}).sort("_id", 1).limit(limit)
+    return [_to_event(d) for d in cur]
+
+def event_source(db):
+    """Source pour EventHub : change stream repris après last_id (ou la dernière entrée du journal)."""
+    def source(last_id):
+        token = last_id or last_event_id(db)
+        try:
+            stream = db.orders.watch(WATCH_PIPELINE, full_document="updateLookup",
+                                     resume_after={"_data": token} if token else None)
+        except OperationFailure as e:
+            print(f"⚠️ Reprise du change stream impossible ({e}) : lecture à partir de maintenant")
+            stream = db.orders.watch(WATCH_PIPELINE, full_document="updateLookup")
+        with stream:
+            for change in stream:
+                event = map_change_to_event(change)
+                log_event(db, event)
+                yield event
+    return source
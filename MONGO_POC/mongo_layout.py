@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Schéma « à plat » des collections orders et users du POC MongoDB.
+
+Avant (calqué sur les valeurs Redis) :
+  orders : { key: "order:<id>", order: { id, statut, zone, client: {...}, ... } }
+  users  : { key: "user:<ROLE>:<uid>", user: { id, role, username, ... } }
+Après :
+  orders : { _id: <id>, statut, zone, client: {...}, ... }
+  users  : { _id: "<ROLE>:<uid>", id, role, username, ... }
+
+L'id de commande est la clé primaire (plus d'index unique order.id redondant avec
+_id), les requêtes et index portent sur des champs de premier niveau.
+order_from_doc() redonne aux routes et templates le dict habituel (avec `id`).
+
+Noms de champs courts (COMPACT_FIELDS) : mesurés par --bench, non utilisés par
+l'application ; à n'adopter que si le gain de taille l'emporte sur la lisibilité
+des requêtes, des index et des projections.
+
+    python mongo_layout.py --migrer [--lot 1000]      # copie puis bascule (renameCollection)
+    python mongo_layout.py --bench [--n 2000]         # imbriqué vs à plat vs à plat + noms courts
+
+⚠️ --migrer se lance application ARRÊTÉE (tous les processus mongo_poc) : la copie ne
+bloque pas les écritures, une écriture pendant la copie ne serait que dans l'ancienne
+version, et une écriture entre les deux renommages recréerait `orders` vide. Garde-fous :
+refus si le nombre de documents source change pendant la copie, refus de la bascule si
+la collection a été recréée entre-temps (rien n'est perdu : *_nested et *_flat restent).
+"""
+
+import os, time, argparse
+from pymongo import MongoClient, ASCENDING, DESCENDING, InsertOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+def order_doc(order: dict) -> dict:
+    """Commande (dict avec `id`) -> document à plat."""
+    doc = {k: v for k, v in order.items() if k != "id"}
+    doc["_id"] = order["id"]
+    return doc
+
+def order_from_doc(doc: dict) -> dict:
+    """Document à plat -> commande avec `id` (routes, templates, compteurs)."""
+    if not doc:
+        return {}
+    o = {k: v for k, v in doc.items() if k != "_id"}
+    o["id"] = doc.get("_id")
+    return o
+
+def user_doc(user: dict) -> dict:
+    return {**user, "_id": f"{user.get('role')}:{user.get('id')}"}
+
+COMPACT_FIELDS = {
+    "statut": "s", "version": "v", "timestamps": "t", "creation": "c", "publiee": "p",
+    "assignee": "a", "cloture": "x", "demarrage": "d", "zone": "z", "livraison": "l",
+    "adresse": "ad", "client": "cl", "restaurant": "r", "nom": "n",
+    "livreur_assigne": "la", "livreur_assigne_nom": "ln", "livree_par": "lp",
+    "id_livreur_assigne": "il", "livree_par_livreur": "lpl", "remuneration": "rm",
+    "montant_total_client": "m", "lignes": "li", "annule_par": "ap", "motif_annulation": "ma",
+    "interets": "i", "events": "e", "type": "ty", "acteur_role": "ar", "acteur_id": "ai",
+    "details": "de", "id_plat": "ip", "qty": "q", "pu": "pu", "date_cloture": "dc",
+}
+
+def compact(value):
+    if isinstance(value, dict):
+        return {COMPACT_FIELDS.get(k, k): compact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [compact(v) for v in value]
+    return value
+
+
+# -----------------------------
+# Migration
+# -----------------------------
+def _copy(src, dst, convert, batch):
+    ops, n = [], 0
+    for d in src.find({}):
+        ops.append(InsertOne(convert(d)))
+        if len(ops) >= batch:
+            n += _flush(dst, ops)
+            ops = []
+    if ops:
+        n += _flush(dst, ops)
+    return n
+
+def _flush(dst, ops):
+    try:
+        return dst.bulk_write(ops, ordered=False).inserted_count
+    except BulkWriteError as e:               # doublons d'id : premier gardé
+        return e.details.get("nInserted", 0)
+
+def _order(d):
+    return order_doc(d["order"]) if "order" in d else d      # déjà à plat : tel quel
+
+def _user(d):
+    return user_doc(d["user"]) if "user" in d else d
+
+def migrate(db, batch=1000):
+    """
+    orders / users imbriqués -> collections *_flat, puis renameCollection :
+    l'ancienne version reste en *_nested (à supprimer une fois vérifiée).
+    Application arrêtée (cf. en-tête) ; RuntimeError si une écriture est détectée.
+    Les index sont recréés par mongo_poc au démarrage.
+    """
+    for name, envelope, convert in (("orders", "order", _order), ("users", "user", _user)):
+        if name not in db.list_collection_names():
+            continue
+        if not db[name].find_one({envelope: {"$exists": True}}):
+            print(f"✅ {name} déjà à plat")
+            continue
+        t0 = time.monotonic()
+        before = db[name].count_documents({})
+        db[f"{name}_flat"].drop()
+        n = _copy(db[name], db[f"{name}_flat"], convert, batch)
+        if db[name].count_documents({}) != before:
+            db[f"{name}_flat"].drop()
+            raise RuntimeError(f"{name} modifiée pendant la copie : arrêter l'application puis relancer --migrer")
+        if n != before:
+            print(f"⚠️ {name} : {before - n} document(s) en doublon d'id non copiés")
+        db[f"{name}_nested"].drop()
+        db[name].rename(f"{name}_nested")
+        try:
+            db[f"{name}_flat"].rename(name)       # échoue si une écriture a recréé `name`
+        except OperationFailure as e:
+            raise RuntimeError(f"{name} recréée pendant la bascule (application active ?) : "
+                               f"original dans {name}_nested, copie dans {name}_flat ({e})")
+        print(f"🔀 {name} : {n} documents à plat en {time.monotonic() - t0:.1f}s (ancienne version : {name}_nested)")
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+def _timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best * 1000
+
+def bench(db, n=2000, repeat=5):
+    """Taille moyenne de document, taille d'index, latence de requêtes : imbriqué / à plat / noms courts."""
+    source = [d["order"] if "order" in d else order_from_doc(d) for d in db.orders.find({}, limit=n)]
+    if not source:
+        print("⚠️ Aucune commande à mesurer")
+        return
+    C = COMPACT_FIELDS
+    layouts = {
+        # nom : (documents, chemins de id, restaurant.id, statut, timestamps.creation)
+        "imbriqué": ([{"key": f"order:{o['id']}", "order": o} for o in source],
+                     "order.id", "order.restaurant.id", "order.statut", "order.timestamps.creation"),
+        "à plat": ([order_doc(o) for o in source], "_id", "restaurant.id", "statut", "timestamps.creation"),
+        "noms courts": ([compact(order_doc(o)) for o in source],
+                        "_id", f"{C['restaurant']}.id", C["statut"], f"{C['timestamps']}.{C['creation']}"),
+    }
+    rid = (source[0].get("restaurant") or {}).get("id")
+    oid = source[-1]["id"]
+    print(f"📏 {len(source)} commandes")
+    print(f"{'schéma':<12}{'octets/doc':>12}{'index (Ko)':>12}{'get id ms':>12}{'liste ms':>12}")
+    for i, (name, (docs, id_path, rest_path, statut_path, ts_path)) in enumerate(layouts.items()):
+        coll = db[f"bench_layout_{i}"]
+        coll.drop()
+        coll.insert_many(docs)
+        if id_path != "_id":
+            coll.create_index([(id_path, ASCENDING)], unique=True)
+        coll.create_index([(rest_path, ASCENDING), (statut_path, ASCENDING), (ts_path, DESCENDING)])
+        stats = db.command("collStats", coll.name)
+        get = _timed(lambda: coll.find_one({id_path: oid}), repeat)
+        lst = _timed(lambda: list(coll.find({rest_path: rid}, {ts_path: 1, statut_path: 1})
+                                  .sort(ts_path, DESCENDING).limit(20)), repeat)
+        print(f"{name:<12}{stats['avgObjSize']:>12.0f}{stats['totalIndexSize'] / 1024:>12.0f}{get:>12.2f}{lst:>12.2f}")
+        coll.drop()
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+    ap = argparse.ArgumentParser(description="Schéma à plat des commandes / utilisateurs MongoDB.")
+    ap.add_argument("--migrer", action="store_true", help="Convertit orders et users en documents à plat")
+    ap.add_argument("--bench", action="store_true", help="Compare les schémas (taille, index, latence)")
+    ap.add_argument("--lot", type=int, default=1000)
+    ap.add_argument("--n", type=int, default=2000, help="Commandes mesurées par --bench")
+    args = ap.parse_args()
+    client = MongoClient(os.getenv("MONGODB_URI") or os.getenv("MONGO_URI"))
+    db = client[os.getenv("DB_NAME", "ubereats_poc")]
+    if args.migrer:
+        migrate(db, args.lot)
+    if args.bench:
+        bench(db, args.n)
+    if not (args.migrer or args.bench):
+        ap.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Machine à états des commandes (POC MongoDB).
+
+    CREEE -> ANONCEE -> ASSIGNEE -> EN_LIVRAISON -> LIVREE
+      \\________\\___________\\______________________> ANNULEE
+
+Même table de transitions que SQL_POC/order_state.py et REDIS_POC/redis_order_state.py.
+Chaque transition est UN find_one_and_update (un aller-retour, sans find_one préalable) :
+  - filtre : id, statut source ($in), propriétaire, et version si l'appelant la fournit ;
+  - mise à jour en pipeline d'agrégation ($set) : champs de la transition, version + 1,
+    événement ajouté au tableau events avec le statut de départ (`de`), tout calculé
+    sur le même état du document ;
+  - ReturnDocument.AFTER : la commande à jour, ou None si la transition est refusée.
+Les valeurs saisies passent par $literal (une chaîne commençant par « $ » reste du texte).
+
+Intérêts des livreurs : $push / $pull conditionnels sur le tableau interets
+(borné à MAX_INTERESTS entrées), jamais de réécriture du tableau entier ; deux
+livreurs qui cliquent en même temps sont tous deux enregistrés. L'index multikey
+sur interets.id_livreur sert interested_order_ids().
+
+Compteurs (mongo_counters) : $inc envoyé sans accusé de réception (w=0) juste
+après, sans aller-retour supplémentaire ; reconcile_counters corrige un écart.
+"""
+
+import time
+from pymongo import ReturnDocument
+
+from mongo_counters import count_transition_unacked
+from mongo_layout import order_from_doc
+
+TRANSITIONS = {
+    # action : statuts source, statut cible, rôle acteur, chemin du propriétaire, champs, événement
+    # valeurs spéciales : "$param" (paramètre de l'action), "$ts", "$acteur", "$date" (date_cloture texte)
+    "publier": {
+        "from": ("CREEE",), "to": "ANONCEE", "role": "RESTAURANT", "owner": "restaurant.id",
+        "set": {"remuneration": "$param", "timestamps.publiee": "$ts"}, "event": "PUBLICATION",
+    },
+    "assigner": {
+        "from": ("ANONCEE",), "to": "ASSIGNEE", "role": "RESTAURANT", "owner": "restaurant.id",
+        "set": {"id_livreur_assigne": "$param", "timestamps.assignee": "$ts"}, "event": "ASSIGNATION",
+    },
+    "demarrer": {
+        "from": ("ASSIGNEE",), "to": "EN_LIVRAISON", "role": "LIVREUR", "owner": "id_livreur_assigne",
+        "set": {"timestamps.demarrage": "$ts"}, "event": "DEPART_LIVRAISON",
+    },
+    "livrer": {
+        "from": ("EN_LIVRAISON",), "to": "LIVREE", "role": "LIVREUR", "owner": "id_livreur_assigne",
+        "set": {"timestamps.cloture": "$ts", "livree_par_livreur": "$acteur", "date_cloture": "$date"},
+        "event": "LIVRAISON",
+    },
+    "annuler_client": {
+        "from": ("CREEE", "ANONCEE"), "to": "ANNULEE", "role": "CLIENT", "owner": "client.id",
+        "set": {"annule_par": "CLIENT", "motif_annulation": "$param", "timestamps.cloture": "$ts"},
+        "event": "ANNULATION",
+    },
+    "annuler_restaurant": {
+        "from": ("CREEE", "ANONCEE", "ASSIGNEE"), "to": "ANNULEE", "role": "RESTAURANT", "owner": "restaurant.id",
+        "set": {"annule_par": "RESTAURANT", "motif_annulation": "$param", "timestamps.cloture": "$ts"},
+        "event": "ANNULATION",
+    },
+}
+
+MAX_INTERESTS = 20
+
+# champs relus après la transition (vue, compteurs, flash)
+PROJECTION = {"statut": 1, "version": 1, "zone": 1, "restaurant.id": 1, "events": {"$slice": -1}}
+
+def _value(v, param, acteur_id, ts):
+    if v == "$param":
+        return param
+    if v == "$ts":
+        return ts
+    if v == "$acteur":
+        return acteur_id
+    if v == "$date":
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+    return v
+
+def transition(db, id_commande, action, acteur_id, param=None, version=None, details=None, ts=None):
+    """
+    Applique `action` si la commande est dans un statut source, appartient à acteur_id
+    et, si `version` est donnée, n'a pas changé depuis sa lecture.
+    Retourne la commande après transition (champs projetés, avec `id`), None sinon
+    (y compris pour une version non numérique).
+    """
+    t = TRANSITIONS[action]
+    ts = ts or int(time.time())
+    flt = {"_id": id_commande, "statut": {"$in": list(t["from"])}, t["owner"]: acteur_id}
+    if version not in (None, ""):
+        try:
+            flt["version"] = int(version)
+        except (TypeError, ValueError):
+            return None                 # version de formulaire invalide : transition refusée
+    changes = {k: {"$literal": _value(v, param, acteur_id, ts)} for k, v in t["set"].items()}
+    event = {
+        "type": t["event"],
+        "acteur_role": t["role"],
+        "acteur_id": {"$literal": acteur_id},
+        "details": {"$literal": (details or "")[:255]},
+        "ts": ts,
+        "de": "$statut",                # statut avant la transition (même étape $set)
+    }
+    doc = db.orders.find_one_and_update(
+        flt,
+        [{"$set": {
+            **changes,
+            "statut": t["to"],
+            "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+            "events": {"$concatArrays": [{"$ifNull": ["$events", []]}, [event]]},
+        }}],
+        projection=PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+    if not doc:
+        return None
+    order = order_from_doc(doc)
+    previous = ((order.get("events") or [{}])[-1]).get("de")
+    count_transition_unacked(db, order, previous, t["to"])
+    return order
+
+def add_interest(db, id_commande, id_livreur, temps_estime=None, commentaire=None, ts=None):
+    """
+    Intérêt d'un livreur si la commande est ANONCEE, qu'il ne l'a pas déjà déclaré et
+    que la liste n'est pas pleine (pas d'élément d'indice MAX_INTERESTS - 1) ; None sinon.
+    """
+    doc = db.orders.find_one_and_update(
+        {
+            "_id": id_commande,
+            "statut": "ANONCEE",
+            "interets.id_livreur": {"$ne": id_livreur},
+            f"interets.{MAX_INTERESTS - 1}": {"$exists": False},
+        },
+        {
+            "$push": {"interets": {
+                "id_livreur": id_livreur,
+                "ts": ts or int(time.time()),
+                "temps_estime": temps_estime or "",
+                "commentaire": commentaire or "",
+            }},
+            "$inc": {"version": 1},
+        },
+        projection={"version": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    return order_from_doc(doc) if doc else None
+
+def remove_interest(db, id_commande, id_livreur):
+    """Retire l'intérêt du livreur tant que la commande est ANONCEE ; None si absent."""
+    doc = db.orders.find_one_and_update(
+        {"_id": id_commande, "statut": "ANONCEE", "interets.id_livreur": id_livreur},
+        {"$pull": {"interets": {"id_livreur": id_livreur}}, "$inc": {"version": 1}},
+        projection={"version": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    return order_from_doc(doc) if doc else None
+
+def interested_order_ids(db, id_livreur, statut="ANONCEE"):
+    """Commandes où le livreur a déclaré un intérêt (index multikey interets.id_livreur)."""
+    cur = db.orders.find({"interets.id_livreur": id_livreur, "statut": statut}, {"_id": 1})
+    return {d["_id"] for d in cur}
@@ -7,10 +7,10 @@ POC UberEats — Version MongoDB (FULL, feature-parity with Redis POC)
 - Reuses shared frontend: ../frontend/templates + ../frontend/static
 - SSE events via MongoDB Change Streams (Atlas or local replica set)
 
-Collections (expected):
-  - users            : { key: "user:ROLE:uid", user: {...} }
+Collections (expected, schéma à plat : mongo_layout.py --migrer) :
+  - users            : { _id: "ROLE:uid", id, role, username, ... }
   - menus            : { restaurant: {...}, menu: [ {...}, ... ] }
-  - orders           : { key: "order:<id>", order: {...} }
+  - orders           : { _id: "<id commande>", statut, zone, client: {...}, ... }
   - carts (optional) : { user_id: "<client_id>", items: [ {...} ] }
 
 .env variables required:
@@ -19,14 +19,25 @@ Collections (expected):
   - APP_SECRET (default: "change-me-please")
 """
 
-import os, json, time, uuid, threading
+import os, sys, json, time, threading
 from functools import wraps
 from types import SimpleNamespace
 from flask import Flask, render_template, request, redirect, url_for, flash, make_response, Response
-from pymongo import MongoClient, ASCENDING
-from pymongo.errors import PyMongoError
+from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, PyMongoError
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.ids import new_order_id, set_node_allocator, NODE_COUNT
+from common.event_hub import EventHub
+from common.event_scopes import requested_scopes
+
+from mongo_search import ensure_search_indexes, backfill_search_terms, search_restaurants
+from mongo_counters import count_transition, restaurant_counts, zone_count, reconcile_counters
+import mongo_order_state as order_state
+from mongo_events import ensure_event_log, event_source, replay_events
+from mongo_layout import order_doc, order_from_doc
+
 # -----------------------------
 # Setup MongoDB + Flask
 # -----------------------------
@@ -50,17 +61,38 @@ app = Flask(
 )
 app.secret_key = APP_SECRET
 
+# un change stream par processus, diffusé aux clients /events (common.event_hub)
+EVENT_HUB = EventHub(event_source(db), name="mongo-event-hub", id_key=str)
+
 # -----------------------------
 # Helpers (time/ids/normalize)
 # -----------------------------
 def now() -> int:
     return int(time.time())
 
-def new_order_id() -> str:
-    return "cmd_" + uuid.uuid4().hex[:8]
+# Nœud des ids de commande (common.ids) : bail sur un document id_nodes (_id = nœud)
+def claim_id_node(owner, ttl):
+    try:
+        db.id_nodes.insert_many([{"_id": n, "owner": None, "expires": 0} for n in range(NODE_COUNT)],
+                                ordered=False)
+    except BulkWriteError:
+        pass                                   # nœuds déjà créés
+    d = db.id_nodes.find_one_and_update(
+        {"expires": {"$lt": now()}},
+        {"$set": {"owner": owner, "expires": now() + ttl}},
+        sort=[("_id", ASCENDING)],
+        projection={"_id": 1},
+    )
+    return d["_id"] if d else None
+
+def renew_id_node(node, owner, ttl):
+    return db.id_nodes.update_one({"_id": node, "owner": owner},
+                                  {"$set": {"expires": now() + ttl}}).matched_count == 1
+
+set_node_allocator(claim_id_node, renew_id_node)
 
 def norm_order_for_view(o: dict) -> dict:
-    """Normalize an order document (nested under 'order') into template-friendly dict."""
+    """Normalize an order (mongo_layout.order_from_doc) into template-friendly dict."""
     out = dict(o)  # shallow copy
     if "id_commande" not in out and "id" in out:
         out["id_commande"] = out["id"]
@@ -79,6 +111,67 @@ def norm_order_for_view(o: dict) -> dict:
             l["prix_unitaire"] = l["pu"]
     return out
 
+# -----------------------------
+# Listes paginées (keyset, comme SQL_POC/app.py)
+# -----------------------------
+PAGE_SIZE = 20
+
+# champs affichés par les listes : ni lignes, ni événements, ni intérêts
+LIST_PROJECTION = {
+    "statut": 1, "zone": 1, "livraison.adresse": 1,
+    "montant_total_client": 1, "remuneration": 1, "client.id": 1,
+    "restaurant.id": 1, "id_livreur_assigne": 1, "livreur.id": 1,
+    "timestamps": 1, "date_cloture": 1,
+}
+
+def parse_curseur(raw):
+    """'<timestamp>:<id commande>' -> (timestamp, id), None si absent ou invalide."""
+    if not raw:
+        return None
+    ts, _, oid = raw.partition(":")
+    try:
+        return int(ts), oid
+    except ValueError:
+        return None
+
+def page_orders(query, ts_field="creation"):
+    """
+    Une page de commandes : filtre, tri (timestamps.<ts_field> DESC, _id DESC),
+    curseur, limite PAGE_SIZE + 1 et projection sont poussés dans la requête ; l'index
+    (<champs du filtre>, timestamps.<ts_field>, _id) la sert sans tri en mémoire.
+    Retourne (lignes pour les templates, next_cursor).
+    """
+    path = f"timestamps.{ts_field}"
+    cur = parse_curseur(request.args.get("curseur"))
+    if cur:
+        query = {**query, "$or": [{path: {"$lt": cur[0]}}, {path: cur[0], "_id": {"$lt": cur[1]}}]}
+    docs = (db.orders.find(query, LIST_PROJECTION)
+            .sort([(path, DESCENDING), ("_id", DESCENDING)])
+            .limit(PAGE_SIZE + 1))
+    rows = [list_row(order_from_doc(d)) for d in docs]
+    if len(rows) <= PAGE_SIZE:
+        return rows, None
+    rows = rows[:PAGE_SIZE]
+    last_ts = rows[-1]["timestamps"].get(ts_field)
+    return rows, (f"{last_ts}:{rows[-1]['id_commande']}" if last_ts is not None else None)
+
+def list_row(o: dict) -> dict:
+    ts = o.get("timestamps") or {}
+    return {
+        "id_commande": o.get("id"),
+        "statut": o.get("statut"),
+        "zone": o.get("zone"),
+        "livraison_adresse": (o.get("livraison") or {}).get("adresse"),
+        "montant_total_client": o.get("montant_total_client"),
+        "remuneration": o.get("remuneration") or 0.0,
+        "id_client": (o.get("client") or {}).get("id"),
+        "id_restaurant": (o.get("restaurant") or {}).get("id"),
+        "id_livreur_assigne": o.get("id_livreur_assigne") or (o.get("livreur") or {}).get("id"),
+        "date_creation": ts.get("creation"),
+        "date_cloture": o.get("date_cloture"),
+        "timestamps": ts,
+    }
+
 # -----------------------------
 # Session / auth helpers
 # -----------------------------
@@ -129,14 +222,36 @@ def role_required(*roles):
 # -----------------------------
 # Indexes (recommended)
 # -----------------------------
+# schéma à plat requis (mongo_layout) : des documents encore imbriqués ne matchent aucune requête
+try:
+    for _coll, _envelope in (("orders", "order"), ("users", "user")):
+        if db[_coll].find_one({_envelope: {"$exists": True}}, {"_id": 1}):
+            print(f"⚠️ {_coll} contient encore des documents imbriqués ({_envelope}.*) : "
+                  f"arrêter l'application et lancer `python mongo_layout.py --migrer`")
+except PyMongoError as e:
+    print("⚠️ Vérification du schéma MongoDB impossible :", e)
+
 try:
-    db.users.create_index([("user.role", ASCENDING), ("user.username", ASCENDING)])
-    db.orders.create_index([("order.id", ASCENDING)], unique=True)
-    db.orders.create_index([("order.client.id", ASCENDING)])
-    db.orders.create_index([("order.restaurant.id", ASCENDING)])
-    db.orders.create_index([("order.zone", ASCENDING), ("order.statut", ASCENDING)])
+    # _id = id de commande (mongo_layout) : pas d'index unique supplémentaire
+    db.users.create_index([("role", ASCENDING), ("username", ASCENDING)])
+    # un index par liste (page_orders) : champs du filtre, puis clé de tri (timestamp, id)
+    CREATION = [("timestamps.creation", DESCENDING), ("_id", DESCENDING)]
+    db.orders.create_index([("client.id", ASCENDING), *CREATION])
+    db.orders.create_index([("restaurant.id", ASCENDING), *CREATION])
+    db.orders.create_index([("restaurant.id", ASCENDING), ("statut", ASCENDING), *CREATION])
+    db.orders.create_index([("zone", ASCENDING), ("statut", ASCENDING), *CREATION])
+    db.orders.create_index([("id_livreur_assigne", ASCENDING), *CREATION])
+    db.orders.create_index([("statut", ASCENDING), ("livree_par_livreur", ASCENDING),
+                            ("timestamps.cloture", DESCENDING), ("_id", DESCENDING)])
+    # multikey : une entrée par livreur intéressé (mongo_order_state.interested_order_ids)
+    db.orders.create_index([("interets.id_livreur", ASCENDING), ("statut", ASCENDING)])
     db.menus.create_index([("restaurant.id", ASCENDING)], unique=True)
     db.carts.create_index([("user_id", ASCENDING)], unique=True)
+    ensure_search_indexes(db)
+    ensure_event_log(db)
+    backfill_search_terms(db)
+    if db.counters.estimated_document_count() == 0:
+        reconcile_counters(client, db)   # première initialisation des compteurs
 except Exception:
     # Best effort; not fatal for dev
     pass
@@ -157,17 +272,16 @@ def login():
     username = request.form["username"].strip()
     password = request.form["password"].strip()
 
-    # Users are stored like: { key, user: { id, role, username, password, ... } }
-    doc = db.users.find_one({
-        "user.role": role,
-        "user.username": username,
-        "user.password": password
+    # Users are stored flat: { _id: "ROLE:uid", id, role, username, password, ... }
+    u = db.users.find_one({
+        "role": role,
+        "username": username,
+        "password": password
     })
-    if not doc or "user" not in doc:
+    if not u:
         flash("Identifiants invalides.")
         return render_template("login.html")
 
-    u = doc["user"]
     auth_data = {
         "id": u.get("id"),
         "role": u.get("role"),
@@ -200,11 +314,10 @@ def logout():
 # -----------------------------
 @app.get("/orders/<string:oid>/json")
 def order_json(oid):
-    d = db.orders.find_one({"order.id": oid}, {"_id": 0})
+    d = db.orders.find_one({"_id": oid})
     if not d:
         return {"error": "Commande introuvable"}, 404
-    o = d.get("order") or {}
-    out = norm_order_for_view(o)
+    out = norm_order_for_view(order_from_doc(d))
     return out
 
 @app.get("/orders/<string:oid>")
@@ -218,17 +331,18 @@ def order_json_alias(oid):
 @require_login
 @role_required("CLIENT")
 def client_restaurants():
-    q = (request.args.get("q") or "").lower()
+    q = (request.args.get("q") or "").strip()
+    # Text index + prefix terms (mongo_search) when searching, plain listing otherwise
+    docs = search_restaurants(db, q) if q else db.menus.find({}, {"_id": 0, "restaurant": 1})
     restaurants = []
-    for m in db.menus.find({}, {"_id": 0}):
+    for m in docs:
         r = m.get("restaurant") or {}
-        if not q or q in (r.get("nom") or "").lower() or q in (r.get("zone") or "").lower():
-            # Keep same fields used by frontend
-            restaurants.append({
-                "id_restaurant": r.get("id"),  # compatibility with Redis front list
-                "nom": r.get("nom"),
-                "zone": r.get("zone"),
-            })
+        # Keep same fields used by frontend
+        restaurants.append({
+            "id_restaurant": r.get("id"),  # compatibility with Redis front list
+            "nom": r.get("nom"),
+            "zone": r.get("zone"),
+        })
     return render_template("client/restaurants.html", restaurants=restaurants)
 
 @app.route("/client/restaurant/<string:restaurant_id>")
@@ -438,8 +552,12 @@ def client_cart():
                 "ts": now()
             }]
         }
-        # Schéma attendu par le reste du code : doc { key, order: {...} }
-        db.orders.insert_one({"key": f"order:{oid}", "order": order})
+        # document à plat, _id = id de commande (mongo_layout)
+        def create(session):
+            db.orders.insert_one(order_doc(order), session=session)
+            count_transition(db, order, None, order["statut"], session=session)
+        with client.start_session() as s:
+            s.with_transaction(create)
 
         # Nettoyer le panier
         db.carts.update_one({"user_id": user_id}, {"$set": {"items": []}}, upsert=True)
@@ -457,40 +575,17 @@ def client_cart():
 @require_login
 @role_required("CLIENT")
 def client_orders():
-    my_id = request.user["id"]
-    docs = db.orders.find({"order.client.id": my_id}, {"_id": 0})
-    commandes = []
-    for d in docs:
-        o = norm_order_for_view(d.get("order") or {})
-        commandes.append(o)
-    commandes.sort(key=lambda x: (x.get("timestamps") or {}).get("creation", 0), reverse=True)
-    return render_template("client/orders.html", commandes=commandes)
+    commandes, next_cursor = page_orders({"client.id": request.user["id"]})
+    return render_template("client/orders.html", commandes=commandes, next_cursor=next_cursor)
 
 @app.post("/client/cancel/<string:order_id>")
 @require_login
 @role_required("CLIENT")
 def client_cancel(order_id):
     """Client may cancel if status allows; persists motif + who cancelled."""
-    d = db.orders.find_one({"order.id": order_id}, {"_id": 0})
-    if not d:
-        flash("Commande introuvable.")
-        return redirect(url_for("client_orders"))
-    o = d.get("order") or {}
-    # ensure ownership
-    if (o.get("client") or {}).get("id") != request.user["id"]:
-        flash("Vous ne pouvez pas annuler cette commande.")
-        return redirect(url_for("client_orders"))
-    if o.get("statut") in ("CREEE", "ANONCEE"):
-        motif = request.form.get("motif", "Annulée par le client")
-        db.orders.update_one(
-            {"order.id": order_id},
-            {"$set": {
-                "order.statut": "ANNULEE",
-                "order.motif_annulation": motif,
-                "order.annule_par": "CLIENT",
-                "order.timestamps.cloture": now()
-            }}
-        )
+    # statut, propriétaire et écriture vérifiés dans un seul find_one_and_update
+    motif = request.form.get("motif", "Annulée par le client")
+    if order_state.transition(db, order_id, "annuler_client", request.user["id"], motif, details=motif):
         flash("Commande annulée avec succès.")
     else:
         flash("Impossible d'annuler cette commande (déjà en cours ou livrée).")
@@ -507,38 +602,24 @@ def restaurant_dashboard():
     wanted = (request.args.get("statut") or "").strip()
     rid = request.user["id"]
 
-    docs = db.orders.find({"order.restaurant.id": rid}, {"_id": 0})
-    commandes = []
-    for d in docs:
-        o = d.get("order") or {}
-        row = {
-            "id_commande": o.get("id") or o.get("id_commande"),
-            "zone": o.get("zone"),
-            "livraison_adresse": (o.get("livraison") or {}).get("adresse"),
-            "montant_total_client": o.get("montant_total_client"),
-            "statut": o.get("statut"),
-            "id_livreur_assigne": o.get("id_livreur_assigne") or (o.get("livreur") or {}).get("id"),
-            "date_creation": (o.get("timestamps") or {}).get("creation") or o.get("date_creation"),
-            "id_client": (o.get("client") or {}).get("id"),
-        }
-        if wanted and row["statut"] != wanted:
-            continue
-        commandes.append(row)
-
-    commandes.sort(key=lambda x: x.get("date_creation") or 0, reverse=True)
-    return render_template("restaurant/dashboard.html", orders=commandes)
+    query = {"restaurant.id": rid}
+    if wanted:
+        query["statut"] = wanted
+    commandes, next_cursor = page_orders(query)
+    return render_template("restaurant/dashboard.html", orders=commandes, next_cursor=next_cursor,
+                           compteurs=restaurant_counts(db, rid))
 
 @app.route("/restaurant/order/<string:order_id>")
 @app.route("/restaurant/order/<string:order_id>")
 @require_login
 @role_required("RESTAURANT")
 def restaurant_order_details(order_id):
-    d = db.orders.find_one({"order.id": order_id}, {"_id": 0})
+    d = db.orders.find_one({"_id": order_id})
     if not d:
         flash("Commande introuvable.")
         return redirect(url_for("restaurant_dashboard"))
 
-    o = norm_order_for_view(d.get("order") or {})
+    o = norm_order_for_view(order_from_doc(d))
     lignes = o.get("lignes", [])
     interets = o.get("interets") or []
 
@@ -575,37 +656,24 @@ def restaurant_order_details(order_id):
 @role_required("RESTAURANT")
 def restaurant_publish(order_id):
     """Mark order ANONCEE + remuneration; visible to couriers by zone."""
-    d = db.orders.find_one({"order.id": order_id}, {"_id": 0})
-    if not d:
-        flash("Commande introuvable.")
-        return redirect(url_for("restaurant_dashboard"))
     remuneration = float(request.form.get("remuneration") or 0)
-    db.orders.update_one(
-        {"order.id": order_id},
-        {"$set": {"order.statut": "ANONCEE", "order.remuneration": remuneration}}
-    )
-    flash(f"Commande {order_id} publiée avec rémunération {remuneration:.2f} €.")
+    if order_state.transition(db, order_id, "publier", request.user["id"], remuneration,
+                              version=request.form.get("version"), details=f"Rémunération {remuneration:.2f} €"):
+        flash(f"Commande {order_id} publiée avec rémunération {remuneration:.2f} €.")
+    else:
+        flash("Publication impossible (commande introuvable, déjà publiée ou modifiée entre-temps).")
     return redirect(url_for("restaurant_order_details", order_id=order_id))
 
 @app.post("/restaurant/order/<string:order_id>/cancel")
 @require_login
 @role_required("RESTAURANT")
 def restaurant_cancel(order_id):
-    d = db.orders.find_one({"order.id": order_id}, {"_id": 0})
-    if not d:
-        flash("Commande introuvable.")
-        return redirect(url_for("restaurant_dashboard"))
     motif = request.form.get("motif", "Annulation par le restaurant")
-    db.orders.update_one(
-        {"order.id": order_id},
-        {"$set": {
-            "order.statut": "ANNULEE",
-            "order.motif_annulation": motif,
-            "order.annule_par": "RESTAURANT",
-            "order.timestamps.cloture": now()
-        }}
-    )
-    flash(f"Commande {order_id} annulée.")
+    if order_state.transition(db, order_id, "annuler_restaurant", request.user["id"], motif,
+                              version=request.form.get("version"), details=motif):
+        flash(f"Commande {order_id} annulée.")
+    else:
+        flash("Annulation impossible (commande introuvable, déjà en livraison ou modifiée entre-temps).")
     return redirect(url_for("restaurant_dashboard"))
 
 @app.post("/restaurant/order/<string:order_id>/assign")
@@ -617,15 +685,10 @@ def restaurant_assign(order_id):
         flash("Aucun livreur sélectionné.")
         return redirect(url_for("restaurant_order_details", order_id=order_id))
 
-    d = db.orders.find_one({"order.id": order_id}, {"_id": 0})
-    if not d:
-        flash("Commande introuvable.")
-        return redirect(url_for("restaurant_dashboard"))
-
-    db.orders.update_one(
-        {"order.id": order_id},
-        {"$set": {"order.id_livreur_assigne": livreur_id, "order.statut": "ASSIGNEE"}}
-    )
+    if not order_state.transition(db, order_id, "assigner", request.user["id"], livreur_id,
+                                  version=request.form.get("version"), details=f"Livreur {livreur_id}"):
+        flash("Assignation impossible (commande introuvable, non publiée ou modifiée entre-temps).")
+        return redirect(url_for("restaurant_order_details", order_id=order_id))
     flash(f"Livreur {livreur_id} assigné à la commande {order_id}.")
     return redirect(url_for("restaurant_order_details", order_id=order_id))
 
@@ -643,19 +706,12 @@ def livreur_dashboard():
 @role_required("LIVREUR")
 def livreur_annonces():
     zone = request.user.get("zone")
-    docs = db.orders.find({"order.statut": "ANONCEE", "order.zone": zone}, {"_id": 0})
-    annonces = []
-    for d in docs:
-        o = d.get("order") or {}
-        annonces.append({
-            "id_commande": o.get("id") or o.get("id_commande"),
-            "livraison_adresse": (o.get("livraison") or {}).get("adresse"),
-            "remuneration": o.get("remuneration", 0.0),
-            "statut": o.get("statut"),
-            "zone": o.get("zone"),
-        })
-    annonces.sort(key=lambda x: x.get("id_commande") or "", reverse=True)
-    return render_template("livreur/annonces.html", orders=annonces, zone=zone)
+    annonces, next_cursor = page_orders({"zone": zone, "statut": "ANONCEE"})
+    mes_interets = order_state.interested_order_ids(db, request.user["id"])
+    for a in annonces:
+        a["interesse"] = a["id_commande"] in mes_interets
+    return render_template("livreur/annonces.html", orders=annonces, zone=zone, next_cursor=next_cursor,
+                           nb_annonces=zone_count(db, zone, "ANONCEE"))
 
 @app.post("/livreur/interet/<string:order_id>")
 @require_login
@@ -664,28 +720,14 @@ def livreur_interet(order_id):
     action = request.form.get("action")  # 'ajouter' or 'retirer'
     livreur_id = request.user["id"]
 
-    d = db.orders.find_one({"order.id": order_id}, {"_id": 0})
-    if not d:
-        flash("Commande introuvable.")
-        return redirect(url_for("livreur_annonces"))
-    o = d.get("order") or {}
-    interets = o.get("interets") or []
-
     if action == "ajouter":
-        if any(i.get("id_livreur") == livreur_id for i in interets):
-            flash("Vous avez déjà manifesté votre intérêt.")
-        else:
-            interets.append({
-                "id_livreur": livreur_id,
-                "ts": now(),
-                "temps_estime": request.form.get("temps_estime") or "",
-                "commentaire": request.form.get("commentaire") or "",
-            })
-            db.orders.update_one({"order.id": order_id}, {"$set": {"order.interets": interets}})
+        if order_state.add_interest(db, order_id, livreur_id, request.form.get("temps_estime"),
+                                    request.form.get("commentaire")):
             flash("Intérêt ajouté.")
+        else:
+            flash("Intérêt non ajouté (déjà manifesté ou commande plus disponible).")
     elif action == "retirer":
-        interets = [i for i in interets if i.get("id_livreur") != livreur_id]
-        db.orders.update_one({"order.id": order_id}, {"$set": {"order.interets": interets}})
+        order_state.remove_interest(db, order_id, livreur_id)
         flash("Intérêt retiré.")
 
     return redirect(url_for("livreur_annonces"))
@@ -694,164 +736,72 @@ def livreur_interet(order_id):
 @require_login
 @role_required("LIVREUR")
 def livreur_mes_courses():
-    lid = request.user["id"]
-    docs = db.orders.find({"order.id_livreur_assigne": lid}, {"_id": 0})
-    courses = []
-    for d in docs:
-        o = d.get("order") or {}
-        courses.append({
-            "id_commande": o.get("id") or o.get("id_commande"),
-            "livraison_adresse": (o.get("livraison") or {}).get("adresse"),
-            "statut": o.get("statut"),
-        })
-    courses.sort(key=lambda x: x.get("id_commande") or "", reverse=True)
-    return render_template("livreur/mes_courses.html", orders=courses)
+    courses, next_cursor = page_orders({"id_livreur_assigne": request.user["id"]})
+    return render_template("livreur/mes_courses.html", orders=courses, next_cursor=next_cursor)
 
 @app.post("/livreur/demarrer/<string:order_id>")
 @require_login
 @role_required("LIVREUR")
 def livreur_demarrer(order_id):
-    d = db.orders.find_one({"order.id": order_id}, {"_id": 0})
-    if not d:
-        flash("Commande introuvable.")
-        return redirect(url_for("livreur_mes_courses"))
-    db.orders.update_one(
-        {"order.id": order_id},
-        {"$set": {"order.statut": "EN_LIVRAISON", "order.timestamps.demarrage": now()}}
-    )
-    flash("Livraison démarrée.")
+    if order_state.transition(db, order_id, "demarrer", request.user["id"], details="Départ en livraison"):
+        flash("Livraison démarrée.")
+    else:
+        flash("Impossible de démarrer cette livraison.")
     return redirect(url_for("livreur_mes_courses"))
 
 @app.post("/livreur/terminer/<string:order_id>")
 @require_login
 @role_required("LIVREUR")
 def livreur_terminer(order_id):
-    d = db.orders.find_one({"order.id": order_id}, {"_id": 0})
-    if not d:
-        flash("Commande introuvable.")
-        return redirect(url_for("livreur_mes_courses"))
-    db.orders.update_one(
-        {"order.id": order_id},
-        {"$set": {
-            "order.statut": "LIVREE",
-            "order.timestamps.cloture": now(),
-            "order.livree_par_livreur": request.user["id"],
-            "order.date_cloture": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now()))
-        }}
-    )
-    flash("Commande livrée avec succès.")
+    if order_state.transition(db, order_id, "livrer", request.user["id"], details="Commande livrée"):
+        flash("Commande livrée avec succès.")
+    else:
+        flash("Impossible de terminer cette livraison.")
     return redirect(url_for("livreur_mes_courses"))
 
 @app.route("/livreur/historique")
 @require_login
 @role_required("LIVREUR")
 def livreur_historique():
-    lid = request.user["id"]
-    docs = db.orders.find({"order.statut": "LIVREE", "order.livree_par_livreur": lid}, {"_id": 0})
-    histo = []
-    for d in docs:
-        o = d.get("order") or {}
-        histo.append({
-            "id_commande": o.get("id") or o.get("id_commande"),
-            "livraison_adresse": (o.get("livraison") or {}).get("adresse"),
-            "statut": o.get("statut"),
-            "date_cloture": o.get("date_cloture"),
-        })
-    histo.sort(key=lambda x: x.get("date_cloture") or "", reverse=True)
-    return render_template("livreur/historique.html", orders=histo)
+    histo, next_cursor = page_orders({"statut": "LIVREE", "livree_par_livreur": request.user["id"]},
+                                     ts_field="cloture")
+    return render_template("livreur/historique.html", orders=histo, next_cursor=next_cursor)
 
 # -----------------------------
 # SSE EVENTS via Mongo Change Streams
 # -----------------------------
-def map_change_to_event(change: dict) -> dict:
-    """
-    Map Mongo change stream doc to the event schema used by your frontend.
-    We keep structured events similar to your Redis Pub/Sub schema.
-
-    Returns:
-      {
-        "event": "<created|published|assigned|cancelled|updated|delivered>",
-        "channel": "orders.<...>",
-        "payload": {...},
-        "ts": <epoch>
-      }
-    """
-    ts = now()
-    full = (change.get("fullDocument") or {})
-    order = full.get("order") or {}
-    op = change.get("operationType")
-
-    # Defaults
-    ev = "updated"
-    channel = "orders.updated"
-    payload = {"id": order.get("id")}
-
-    if op == "insert":
-        ev = "created"
-        channel = "orders.created"
-        payload.update({
-            "zone": order.get("zone"),
-            "id_client": (order.get("client") or {}).get("id"),
-            "id_restaurant": (order.get("restaurant") or {}).get("id"),
-        })
-    elif op == "update":
-        upd = change.get("updateDescription", {})
-        setf = (upd.get("updatedFields") or {}).keys()
-        # Heuristics on the updated fields to pick the semantic event
-        if "order.statut" in setf:
-            new_status = (upd.get("updatedFields") or {}).get("order.statut")
-            if new_status == "ANONCEE":
-                ev = "published"; channel = "orders.published"
-                payload.update({"zone": order.get("zone"), "remuneration": order.get("remuneration", 0)})
-            elif new_status == "ASSIGNEE":
-                ev = "assigned"; channel = "orders.assigned"
-                payload.update({"livreur": order.get("id_livreur_assigne")})
-            elif new_status == "ANNULEE":
-                ev = "cancelled"; channel = "orders.cancelled"
-                payload.update({"motif": order.get("motif_annulation")})
-            elif new_status == "LIVREE":
-                ev = "delivered"; channel = "orders.updated"
-                payload.update({"livreur": order.get("livree_par_livreur")})
-            else:
-                ev = "updated"; channel = "orders.updated"
-        elif "order.id_livreur_assigne" in setf:
-            ev = "assigned"; channel = "orders.assigned"
-            payload.update({"livreur": order.get("id_livreur_assigne")})
-        else:
-            ev = "updated"; channel = "orders.updated"
-    else:
-        ev = "updated"; channel = "orders.updated"
-
-    return {
-        "event": ev,
-        "channel": channel,
-        "payload": payload,
-        "ts": ts
-    }
+def order_parties(oid):
+    """Client, restaurant et livreur assigné d'une commande (contrôle de ?order= sur /events)."""
+    d = db.orders.find_one({"_id": oid}, {"client.id": 1, "restaurant.id": 1, "id_livreur_assigne": 1})
+    if not d:
+        return None
+    return {"id_client": (d.get("client") or {}).get("id"),
+            "id_restaurant": (d.get("restaurant") or {}).get("id"),
+            "id_livreur_assigne": d.get("id_livreur_assigne")}
 
 @app.route("/events")
 def events():
     """
-    Server-Sent Events stream backed by MongoDB change streams.
+    SSE des événements de commande, limités aux portées de l'utilisateur connecté,
+    éventuellement restreintes par ?zone=&restaurant=&client=&livreur=&order= (common.event_scopes).
+    Un seul change stream par processus (mongo_events) ; chaque message porte
+    `id: <jeton>` : à la reconnexion, Last-Event-ID rejoue le journal order_events.
     Requires Mongo Atlas or a local replica set (change streams need that).
     """
-    def stream():
-        try:
-            pipeline = [
-                {"$match": {"operationType": {"$in": ["insert", "update"]}}}
-            ]
-            with db.orders.watch(pipeline, full_document='updateLookup') as change_stream:
-                for change in change_stream:
-                    try:
-                        event = map_change_to_event(change)
-                        yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
-                    except Exception as ex:
-                        yield f"data: {json.dumps({'event':'error','payload':str(ex),'ts':now()})}\n\n"
-        except PyMongoError as e:
-            # If change streams not available, degrade gracefully
-            yield f"data: {json.dumps({'event':'error','payload':'Change streams unavailable','ts':now()})}\n\n"
-
-    return Response(stream(), mimetype="text/event-stream")
+    if not request.user:
+        return Response("Connexion requise", status=401)
+    scopes = requested_scopes(request.args, request.user, order_parties)
+    if not scopes:
+        return Response("Portée non autorisée", status=403)
+    sub = EVENT_HUB.subscribe(scopes)
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_id")
+    replay = replay_events(db, last_id) if last_id else ()
+    return Response(EVENT_HUB.stream(sub, replay), mimetype="text/event-stream")
+
+@app.route("/events/metrics")
+def events_metrics():
+    """Clients SSE connectés, événements diffusés / perdus, clients coupés."""
+    return EVENT_HUB.stats()
 
 # -----------------------------
 # Run
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Recherche de restaurants côté MongoDB (collection menus).
+
+Deux index :
+  - menus_text         : index texte (restaurant.nom x10, restaurant.zone x2, langue french),
+                         insensible aux accents, fournit le score de pertinence ($meta textScore) ;
+  - menus_search_terms : index multikey sur search_terms = préfixes pliés des tokens
+                         (common.search), pour la recherche par préfixe.
+
+Une requête exige tous ses tokens (search_terms $all) : d'abord les restaurants dont
+les mots complets correspondent (triés par textScore), puis les simples correspondances
+de préfixe, jusqu'à `limit` résultats.
+"""
+
+import os, sys
+from pymongo import ASCENDING, TEXT
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.search import tokens, search_terms, MAX_PREFIX_LEN, SEARCH_LIMIT
+
+PROJECTION = {"_id": 0, "restaurant.id": 1, "restaurant.nom": 1, "restaurant.zone": 1}
+
+def ensure_search_indexes(db):
+    db.menus.create_index(
+        [("restaurant.nom", TEXT), ("restaurant.zone", TEXT)],
+        weights={"restaurant.nom": 10, "restaurant.zone": 2},
+        default_language="french",
+        name="menus_text",
+    )
+    db.menus.create_index([("search_terms", ASCENDING)], name="menus_search_terms")
+
+def restaurant_search_terms(restaurant: dict) -> list:
+    return search_terms(restaurant.get("nom") or "", restaurant.get("zone") or "")
+
+def backfill_search_terms(db):
+    """Calcule search_terms pour les menus importés sans ce champ."""
+    for m in db.menus.find({"search_terms": {"$exists": False}}, {"_id": 1, "restaurant": 1}):
+        db.menus.update_one(
+            {"_id": m["_id"]},
+            {"$set": {"search_terms": restaurant_search_terms(m.get("restaurant") or {})}},
+        )
+
+def search_restaurants(db, q, limit=SEARCH_LIMIT) -> list:
+    """Documents {restaurant: {id, nom, zone}} correspondant à q, par pertinence."""
+    toks = [t[:MAX_PREFIX_LEN] for t in tokens(q)]
+    if not toks:
+        return []
+    match_all = {"search_terms": {"$all": toks}}
+
+    ranked = list(
+        db.menus.find(
+            {"$text": {"$search": " ".join(toks)}, **match_all},
+            {**PROJECTION, "score": {"$meta": "textScore"}},
+        ).sort([("score", {"$meta": "textScore"})]).limit(limit)
+    )
+    if len(ranked) < limit:
+        seen = [(d.get("restaurant") or {}).get("id") for d in ranked]
+        ranked += list(
+            db.menus.find({**match_all, "restaurant.id": {"$nin": seen}}, PROJECTION)
+            .sort("restaurant.nom", ASCENDING)
+            .limit(limit - len(ranked))
+        )
+    return ranked
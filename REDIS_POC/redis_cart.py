@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Panier client en HASH Redis (au lieu d'une liste JSON relue / réécrite à chaque action).
+
+Clé cart:{id_client}, HASH :
+  restaurant, restaurant_name     restaurant du panier (un seul par panier)
+  q:{id_plat}                     quantité (HINCRBY)
+  i:{id_plat}                     [pu, nom] en JSON compact, écrit à l'ajout
+
+Quantité et prix sont dans deux champs pour que HINCRBY s'applique directement à la
+quantité. Chaque écriture ou lecture repousse l'expiration (CART_TTL, TTL glissant) :
+un panier abandonné disparaît seul. Un panier sans ligne est supprimé.
+
+Ajout, mise à jour et retrait sont des scripts Lua (EVALSHA, comme redis_order_state) :
+la contrainte « un seul restaurant par panier » est vérifiée dans le script, sans
+fenêtre entre lecture et écriture. checkout() lit le panier sous WATCH et crée la
+commande + supprime le panier dans le même MULTI : un panier ne donne qu'une commande.
+"""
+
+import json
+from redis.exceptions import NoScriptError, WatchError
+
+CART_TTL = 7 * 24 * 3600
+MAX_QTY = 99
+
+OK, CONFLICT, EMPTY = 1, 0, -1
+
+def k_cart(uid): return f"cart:{uid}"
+
+CART_PATTERNS = ["cart:*"]
+
+# Supprime le panier s'il n'a plus de ligne, sinon repousse l'expiration
+PRELUDE_LUA = """
+local function settle(ttl)
+  for _, f in ipairs(redis.call('HKEYS', KEYS[1])) do
+    if string.sub(f, 1, 2) == 'q:' then
+      redis.call('EXPIRE', KEYS[1], ttl)
+      return 1
+    end
+  end
+  redis.call('DEL', KEYS[1])
+  return -1
+end
+"""
+
+SCRIPTS = {
+    # ARGV : ttl, max, id_restaurant, nom restaurant, id_plat, qty, [pu, nom]
+    "ajouter": PRELUDE_LUA + """
+local rid = redis.call('HGET', KEYS[1], 'restaurant')
+if rid and ARGV[3] ~= '' and rid ~= ARGV[3] and settle(ARGV[1]) == 1 then return 0 end
+if ARGV[3] ~= '' and rid ~= ARGV[3] then
+  redis.call('HSET', KEYS[1], 'restaurant', ARGV[3], 'restaurant_name', ARGV[4])
+end
+local q = redis.call('HINCRBY', KEYS[1], 'q:' .. ARGV[5], ARGV[6])
+if q > tonumber(ARGV[2]) then redis.call('HSET', KEYS[1], 'q:' .. ARGV[5], ARGV[2]) end
+if q <= 0 then
+  redis.call('HDEL', KEYS[1], 'q:' .. ARGV[5], 'i:' .. ARGV[5])
+else
+  redis.call('HSET', KEYS[1], 'i:' .. ARGV[5], ARGV[7])
+end
+return settle(ARGV[1])
+""",
+    # ARGV : ttl, max, puis couples id_plat, qty (qty <= 0 : ligne retirée)
+    "quantites": PRELUDE_LUA + """
+for n = 3, #ARGV, 2 do
+  local id, q = ARGV[n], math.min(tonumber(ARGV[n + 1]) or 0, tonumber(ARGV[2]))
+  if q <= 0 then
+    redis.call('HDEL', KEYS[1], 'q:' .. id, 'i:' .. id)
+  elseif redis.call('HEXISTS', KEYS[1], 'i:' .. id) == 1 then
+    redis.call('HSET', KEYS[1], 'q:' .. id, q)
+  end
+end
+return settle(ARGV[1])
+""",
+}
+
+_shas = {}
+
+def load_scripts(r):
+    for name, src in SCRIPTS.items():
+        _shas[name] = r.script_load(src)
+    return dict(_shas)
+
+def _run(r, name, uid, *args):
+    if name not in _shas:
+        load_scripts(r)
+    args = (CART_TTL, MAX_QTY, *args)
+    try:
+        return int(r.evalsha(_shas[name], 1, k_cart(uid), *args))
+    except NoScriptError:
+        load_scripts(r)
+        return int(r.evalsha(_shas[name], 1, k_cart(uid), *args))
+
+def lines_from_hash(h: dict):
+    """HASH du panier -> lignes {id_plat, nom, pu, qty, id_restaurant, restaurant_name}."""
+    lines = []
+    for field, qty in h.items():
+        if not field.startswith("q:"):
+            continue
+        id_plat = field[2:]
+        pu, nom = json.loads(h.get(f"i:{id_plat}") or "[0, null]")
+        lines.append({
+            "id_plat": id_plat,
+            "nom": nom or id_plat,
+            "pu": float(pu),
+            "qty": int(qty),
+            "id_restaurant": h.get("restaurant"),
+            "restaurant_name": h.get("restaurant_name") or "Restaurant",
+        })
+    return sorted(lines, key=lambda l: l["nom"])
+
+def load_cart(r, uid):
+    """Lignes du panier ; la lecture repousse aussi l'expiration."""
+    pipe = r.pipeline(transaction=False)
+    pipe.hgetall(k_cart(uid))
+    pipe.expire(k_cart(uid), CART_TTL)
+    return lines_from_hash(pipe.execute()[0])
+
+def add_line(r, uid, id_restaurant, restaurant_name, id_plat, nom, pu, qty=1) -> int:
+    """OK, CONFLICT (panier d'un autre restaurant) ou EMPTY (quantité ramenée à 0)."""
+    packed = json.dumps([float(pu), nom], ensure_ascii=False, separators=(",", ":"))
+    return _run(r, "ajouter", uid, id_restaurant or "", restaurant_name or "", id_plat, int(qty), packed)
+
+def set_quantities(r, uid, quantities: dict) -> int:
+    """{id_plat: qty} ; qty <= 0 retire la ligne. EMPTY si le panier est vide après coup."""
+    pairs = [v for id_plat, qty in quantities.items() for v in (id_plat, int(qty))]
+    return _run(r, "quantites", uid, *pairs)
+
+def remove_lines(r, uid, id_plats) -> int:
+    return set_quantities(r, uid, {id_plat: 0 for id_plat in id_plats})
+
+def clear_cart(r, uid):
+    r.delete(k_cart(uid))
+
+def checkout(r, uid, place):
+    """
+    Consomme le panier : place(pipe, lignes) met en file l'écriture de la commande
+    (pipeline déjà en MULTI) et retourne son résultat ; la suppression du panier part
+    dans la même transaction. Rejoué si le panier change entre lecture et EXEC.
+    None si le panier est vide.
+    """
+    key = k_cart(uid)
+    with r.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                pipe.watch(key)
+                lines = lines_from_hash(pipe.hgetall(key))
+                if not lines:
+                    pipe.unwatch()
+                    return None
+                pipe.multi()
+                result = place(pipe, lines)
+                pipe.delete(key)
+                pipe.execute()
+                return result
+            except WatchError:
+                continue
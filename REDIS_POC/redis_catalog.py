@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Catalogue des restaurants côté Redis, maintenu à l'écriture des menus.
+
+Clés :
+  restaurants:all                 ZSET  id_restaurant (score 0 : ordre des ids)
+  restaurants:zone:{zone}         ZSET  idem, restaurants de la zone
+  catalog:restaurant:{rid}        HASH  id_restaurant, nom, zone, adresse, telephone, nb_plats
+  dish:{id_plat}                  HASH  id_restaurant, nom, pu   (index inverse plat -> restaurant)
+
+La liste des restaurants = ZRANGE + HMGET en pipeline (plus de SCAN menu:* ni
+de décodage des menus) ; retrouver le restaurant d'une ligne de panier = un HGET.
+save_menu() est le point d'entrée de toute écriture de menu (chargeur, édition) :
+menu:{rid}, restaurant:{rid}, fiche, index et recherche partent dans le même MULTI.
+"""
+
+from redis_codec import get_value, set_value
+from redis_search import index_restaurant, unindex_restaurant
+
+SUMMARY_FIELDS = ("id_restaurant", "nom", "zone", "adresse", "telephone", "nb_plats")
+
+K_ALL = "restaurants:all"
+def k_zone(zone): return f"restaurants:zone:{zone}"
+def k_summary(rid): return f"catalog:restaurant:{rid}"
+def k_dish(id_plat): return f"dish:{id_plat}"
+
+CATALOG_PATTERNS = [K_ALL, "restaurants:zone:*", "catalog:restaurant:*", "dish:*"]
+
+def catalog_restaurant(pipe, restaurant: dict, menu, old_zone=None, old_dishes=()):
+    """Fiche + index zone + index inverse des plats ; `pipe` est un pipeline ou un client."""
+    rid = restaurant.get("id") or restaurant.get("id_restaurant")
+    zone = restaurant.get("zone") or "inconnue"
+    summary = {
+        "id_restaurant": rid,
+        "nom": restaurant.get("nom") or rid,
+        "zone": zone,
+        "adresse": restaurant.get("adresse") or "",
+        "telephone": restaurant.get("telephone") or "",
+        "nb_plats": len(menu or []),
+    }
+    pipe.hset(k_summary(rid), mapping=summary)
+    pipe.zadd(K_ALL, {rid: 0})
+    if old_zone and old_zone != zone:
+        pipe.zrem(k_zone(old_zone), rid)
+    pipe.zadd(k_zone(zone), {rid: 0})
+    current = set()
+    for p in menu or []:
+        if not p.get("id_plat"):
+            continue
+        current.add(p["id_plat"])
+        pipe.hset(k_dish(p["id_plat"]), mapping={
+            "id_restaurant": rid,
+            "nom": p.get("nom") or "",
+            "pu": p.get("pu", p.get("prix", 0)),
+        })
+    for id_plat in set(old_dishes) - current:
+        pipe.delete(k_dish(id_plat))
+
+def save_menu(r, restaurant: dict, menu):
+    """Écrit restaurant:{rid} + menu:{rid} et met le catalogue à jour, atomiquement."""
+    rid = restaurant.get("id") or restaurant.get("id_restaurant")
+    old_zone = r.hget(k_summary(rid), "zone")
+    old_menu = get_value(r, f"menu:{rid}") or []
+    unindex_restaurant(r, rid)          # nom / zone ont pu changer
+    pipe = r.pipeline(transaction=True)
+    set_value(pipe, f"restaurant:{rid}", restaurant)
+    set_value(pipe, f"menu:{rid}", menu or [])
+    catalog_restaurant(pipe, restaurant, menu, old_zone,
+                       [p.get("id_plat") for p in old_menu if isinstance(p, dict) and p.get("id_plat")])
+    index_restaurant(pipe, restaurant)
+    pipe.execute()
+
+def fetch_restaurants(r, ids):
+    """Fiches des restaurants (un aller-retour), dans l'ordre des ids."""
+    pipe = r.pipeline(transaction=False)
+    for rid in ids:
+        pipe.hmget(k_summary(rid), SUMMARY_FIELDS)
+    out = []
+    for rid, values in zip(ids, pipe.execute()):
+        s = dict(zip(SUMMARY_FIELDS, values))
+        out.append({**s, "id_restaurant": rid, "nom": s.get("nom") or rid, "zone": s.get("zone") or "inconnue"})
+    return out
+
+def list_restaurants(r, zone=None):
+    return fetch_restaurants(r, r.zrange(k_zone(zone) if zone else K_ALL, 0, -1))
+
+def dish_restaurants(r, id_plats):
+    """id_plat -> id_restaurant (None si inconnu), un aller-retour."""
+    pipe = r.pipeline(transaction=False)
+    for id_plat in id_plats:
+        pipe.hget(k_dish(id_plat), "id_restaurant")
+    return dict(zip(id_plats, pipe.execute()))
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Codec des valeurs Redis stockées en document : menu, restaurant,
+utilisateur, lignes de commande.
+
+Format : 1er octet = version du format, puis le corps.
+  0x01  JSON compact (séparateurs sans espace, clés abrégées)
+  0x02  msgpack (clés abrégées) — dépendance optionnelle `msgpack`
+  +0x80 corps compressé zlib (si le document dépasse ZLIB_MIN_BYTES et que ça réduit)
+Une valeur qui commence par un caractère JSON ('{', '[', ...) est l'ancien format
+texte : les deux cohabitent pendant la migration, decode() lit les deux et
+chaque réécriture passe au codec courant (VALUE_CODEC).
+
+Clés abrégées : les noms de champs répétés dans chaque document (nom, id_plat,
+restaurant_name...) sont remplacés par "~" + code court (KEY_ALIASES) ; "~" ne
+s'échappe pas en JSON et ne commence aucun nom de champ du POC. Changer la table
+impose un nouveau numéro de format.
+
+Les réponses binaires imposent un client sans decode_responses : binary(r)
+fournit ce jumeau (même serveur, même base) pour les lectures.
+
+    python redis_codec.py --bench ./REDIS_POC/out/orders.jsonl
+"""
+
+import json, zlib, time, argparse
+
+try:
+    import msgpack
+except ImportError:         # optionnel : sans msgpack, codec "compact" seulement
+    msgpack = None
+
+VALUE_CODEC = "compact"      # "json" (ancien format texte), "compact" ou "msgpack"
+ZLIB_MIN_BYTES = 512
+ZLIB_LEVEL = 6
+
+FORMAT_COMPACT = 0x01
+FORMAT_MSGPACK = 0x02
+FLAG_ZLIB = 0x80
+
+KEY_ALIASES = {
+    "id": "i", "nom": "n", "zone": "z", "adresse": "a", "telephone": "t",
+    "id_plat": "p", "pu": "u", "prix": "x", "qty": "q", "quantite": "qt", "prix_unitaire": "px",
+    "total": "tt", "disponible": "d",
+    "id_restaurant": "r", "restaurant_name": "rn",
+    "username": "un", "password": "pw", "role": "ro",
+}
+_ALIAS = {k: "~" + v for k, v in KEY_ALIASES.items()}
+_UNALIAS = {v: k for k, v in _ALIAS.items()}
+
+def _shorten(obj):
+    if isinstance(obj, dict):
+        return {_ALIAS.get(k, k): _shorten(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_shorten(v) for v in obj]
+    return obj
+
+def _expand(obj):
+    if isinstance(obj, dict):
+        return {_UNALIAS.get(k, k): _expand(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_expand(v) for v in obj]
+    return obj
+
+def encode(obj, codec=None) -> bytes:
+    codec = codec or VALUE_CODEC
+    if codec == "json":
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    if codec == "compact":
+        fmt, body = FORMAT_COMPACT, json.dumps(_shorten(obj), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    elif codec == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("Codec msgpack demandé mais le paquet `msgpack` n'est pas installé")
+        fmt, body = FORMAT_MSGPACK, msgpack.packb(_shorten(obj), use_bin_type=True)
+    else:
+        raise ValueError(f"Codec inconnu : {codec}")
+    if len(body) >= ZLIB_MIN_BYTES:
+        packed = zlib.compress(body, ZLIB_LEVEL)
+        if len(packed) < len(body):
+            fmt, body = fmt | FLAG_ZLIB, packed
+    return bytes([fmt]) + body
+
+def decode(raw):
+    """Valeur Redis (bytes ou str, ancien ou nouveau format) -> objet ; None si absente."""
+    if raw is None or raw == b"" or raw == "":
+        return None
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+    fmt = raw[0]
+    if fmt not in (FORMAT_COMPACT, FORMAT_MSGPACK, FORMAT_COMPACT | FLAG_ZLIB, FORMAT_MSGPACK | FLAG_ZLIB):
+        return json.loads(raw)                      # ancien format texte
+    body = raw[1:]
+    if fmt & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    if fmt & ~FLAG_ZLIB == FORMAT_MSGPACK:
+        if msgpack is None:
+            raise RuntimeError("Valeur msgpack lue mais le paquet `msgpack` n'est pas installé")
+        return _expand(msgpack.unpackb(body, raw=False))
+    return _expand(json.loads(body))
+
+_binary = {}
+
+def binary(r):
+    """Client jumeau sans decode_responses (même pool de paramètres), pour lire les valeurs codées."""
+    kwargs = r.connection_pool.connection_kwargs
+    if not kwargs.get("decode_responses"):
+        return r
+    key = id(r.connection_pool)
+    if key not in _binary:
+        _binary[key] = type(r)(**{**kwargs, "decode_responses": False})
+    return _binary[key]
+
+def get_value(r, key):
+    return decode(binary(r).get(key))
+
+def mget_values(r, keys):
+    return [decode(v) for v in binary(r).mget(keys)] if keys else []
+
+def set_value(pipe, key, obj):
+    """SET de la valeur codée ; `pipe` est un client ou un pipeline (MULTI)."""
+    return pipe.set(key, encode(obj))
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+def bench(path, limit=1000, repeat=5):
+    """Octets par document et ns d'encodage / décodage pour chaque codec."""
+    docs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                docs.append(row.get("order") or row.get("menu") or row.get("user") or row)
+            if len(docs) >= limit:
+                break
+    if not docs:
+        print("⚠️ Aucun document")
+        return
+    codecs = ["json", "compact"] + (["msgpack"] if msgpack else [])
+    print(f"📏 {len(docs)} documents de {path}")
+    print(f"{'codec':<10}{'octets/doc':>12}{'encode ns':>12}{'decode ns':>12}")
+    for codec in codecs:
+        encoded = [encode(d, codec) for d in docs]
+        size = sum(map(len, encoded)) / len(docs)
+        best_enc = best_dec = float("inf")
+        for _ in range(repeat):
+            t = time.perf_counter_ns()
+            for d in docs:
+                encode(d, codec)
+            best_enc = min(best_enc, (time.perf_counter_ns() - t) / len(docs))
+            t = time.perf_counter_ns()
+            for e in encoded:
+                decode(e)
+            best_dec = min(best_dec, (time.perf_counter_ns() - t) / len(docs))
+        print(f"{codec:<10}{size:>12.0f}{best_enc:>12.0f}{best_dec:>12.0f}")
+    if msgpack is None:
+        print("ℹ️ msgpack non installé : codec non mesuré")
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare les codecs de valeurs Redis (taille, temps).")
+    ap.add_argument("--bench", required=True, help="Fichier JSONL (orders.jsonl, restaurants_menus.jsonl...)")
+    ap.add_argument("--limit", type=int, default=1000)
+    args = ap.parse_args()
+    bench(args.bench, args.limit)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Compteurs de commandes par (restaurant, statut) et (zone, statut) côté Redis.
+
+Clés :
+  counters:restaurant:{rid}   HASH  statut -> nb
+  counters:zone:{zone}        HASH  statut -> nb
+
+Chaque écriture de commande (redis_poc) applique ses HINCRBY -1/+1 dans la même
+opération atomique que la commande : compteur et commande bougent ensemble.
+Les dashboards lisent un HGETALL / HGET au lieu de parcourir order:*.
+
+reconcile_counters() recalcule tout depuis order:* et réécrit les hashes
+(WATCH sur les compteurs : une transition concurrente fait recommencer le calcul).
+    python redis_counters.py [--loop 300]
+"""
+
+import time, argparse
+from collections import defaultdict
+from redis import Redis, WatchError
+
+from redis_orders import iter_orders
+
+def k_counters_restaurant(rid): return f"counters:restaurant:{rid}"
+def k_counters_zone(zone): return f"counters:zone:{zone}"
+
+def counter_keys(order: dict):
+    keys = []
+    if order.get("id_restaurant"):
+        keys.append(k_counters_restaurant(order["id_restaurant"]))
+    if order.get("zone"):
+        keys.append(k_counters_zone(order["zone"]))
+    return keys
+
+def counter_ops(order: dict, old_statut, new_statut):
+    """[(clé, statut, delta)] ; old_statut None = création."""
+    if old_statut == new_statut:
+        return []
+    ops = []
+    for key in counter_keys(order):
+        if old_statut:
+            ops.append((key, old_statut, -1))
+        if new_statut:
+            ops.append((key, new_statut, 1))
+    return ops
+
+def count_transition(pipe, order: dict, old_statut, new_statut):
+    """HINCRBY sur les compteurs de la commande ; old_statut None = création."""
+    for key, statut, delta in counter_ops(order, old_statut, new_statut):
+        pipe.hincrby(key, statut, delta)
+
+def restaurant_counts(r, rid) -> dict:
+    return {s: int(n) for s, n in r.hgetall(k_counters_restaurant(rid)).items()}
+
+def zone_count(r, zone, statut) -> int:
+    return int(r.hget(k_counters_zone(zone), statut) or 0)
+
+def compute_counters(r) -> dict:
+    """clé de compteur -> {statut: nb}, recalculé depuis toutes les commandes."""
+    counts = defaultdict(lambda: defaultdict(int))
+    for o in iter_orders(r, fields=("statut", "id_restaurant", "zone")):
+        if not o.get("statut"):
+            continue
+        for key in counter_keys(o):
+            counts[key][o["statut"]] += 1
+    return counts
+
+def reconcile_counters(r, max_attempts=5) -> int:
+    """Réécrit les compteurs faux ; retourne le nombre de hashes corrigés."""
+    for _ in range(max_attempts):
+        existing = list(r.scan_iter("counters:*", count=500))
+        with r.pipeline(transaction=True) as pipe:
+            try:
+                if existing:
+                    pipe.watch(*existing)
+                counts = compute_counters(r)
+                fixes = {}
+                for key in set(existing) | set(counts):
+                    wanted = {s: n for s, n in counts.get(key, {}).items() if n}
+                    stored = {s: int(n) for s, n in r.hgetall(key).items() if int(n)}
+                    if wanted != stored:
+                        fixes[key] = wanted
+                pipe.multi()
+                for key, wanted in fixes.items():
+                    pipe.delete(key)
+                    if wanted:
+                        pipe.hset(key, mapping=wanted)
+                pipe.execute()
+            except WatchError:
+                continue
+        for key, wanted in fixes.items():
+            print(f"🔧 {key} -> {wanted}")
+        return len(fixes)
+    print("⚠️ Compteurs : trop d'écritures concurrentes, réconciliation abandonnée")
+    return 0
+
+def main():
+    ap = argparse.ArgumentParser(description="Vérifie et répare les compteurs counters:* depuis order:*.")
+    ap.add_argument("--loop", type=float, default=0, help="Relance toutes les N secondes (0 = un seul passage)")
+    args = ap.parse_args()
+    r = Redis(host="127.0.0.1", port=6379, decode_responses=True)
+    while True:
+        print(f"✅ Compteurs vérifiés : {reconcile_counters(r)} corrigé(s)")
+        if not args.loop:
+            break
+        time.sleep(args.loop)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Journal global des événements de commande : stream Redis orders:events.
+
+Remplace le PUBLISH « fire-and-forget » : chaque événement est un XADD (MAXLEN ~
+EVENTS_MAXLEN) avec les champs de l'ancienne enveloppe Pub/Sub
+  event, channel, payload (JSON), ts
+écrit dans la même opération atomique que la commande (MULTI de création,
+scripts Lua de redis_order_state).
+
+Lecteurs :
+  - SSE /events : un seul XREAD BLOCK par processus (event_source) alimente le
+    hub common.event_hub ; un client qui revient avec Last-Event-ID rattrape les
+    entrées manquées par XRANGE (replay_events) tant qu'elles n'ont pas été
+    élaguées par MAXLEN ;
+  - workers : groupes de consommateurs (XREADGROUP), traitement au moins une fois.
+    Les effets Redis du handler et le XACK partent dans le même MULTI ; les
+    messages restés en attente chez un worker mort sont repris par XAUTOCLAIM.
+        python redis_events.py --group analytics [--consumer w1]
+"""
+
+import json, os, socket, time, argparse
+from redis import Redis
+from redis.exceptions import ResponseError
+
+EVENTS_STREAM = "orders:events"
+EVENTS_MAXLEN = 10000             # élagage approximatif (~) : historique rejouable
+BLOCK_MS = 15000                  # XREAD / XREADGROUP BLOCK
+CLAIM_IDLE_MS = 60000             # message en attente depuis plus longtemps => repris
+
+def event_fields(channel, event_type, payload, ts=None) -> dict:
+    return {
+        "event": event_type,
+        "channel": channel,
+        "payload": json.dumps(payload, ensure_ascii=False),
+        "ts": int(ts or time.time()),
+    }
+
+def emit(pipe, channel, event_type, payload, ts=None):
+    """XADD de l'événement ; `pipe` est un pipeline (MULTI de l'écriture) ou un client."""
+    return pipe.xadd(EVENTS_STREAM, event_fields(channel, event_type, payload, ts),
+                     maxlen=EVENTS_MAXLEN, approximate=True)
+
+def decode_event(entry_id, fields) -> dict:
+    try:
+        payload = json.loads(fields.get("payload") or "null")
+    except ValueError:
+        payload = fields.get("payload")
+    return {
+        "id": entry_id,
+        "event": fields.get("event"),
+        "channel": fields.get("channel"),
+        "payload": payload,
+        "ts": int(fields.get("ts") or 0),
+    }
+
+def last_event_id(r) -> str:
+    """Id de la dernière entrée (point de départ d'un nouveau lecteur) ; "0-0" si vide."""
+    last = r.xrevrange(EVENTS_STREAM, count=1)
+    return last[0][0] if last else "0-0"
+
+def read_events(r, last_id, block=BLOCK_MS, count=100):
+    """
+    Événements postérieurs à last_id. Retourne [] à l'expiration du BLOCK
+    (l'appelant envoie un heartbeat et relit depuis le même id : pas de "$"
+    entre deux appels, sinon les entrées ajoutées entre-temps seraient sautées).
+    """
+    res = r.xread({EVENTS_STREAM: last_id}, count=count, block=block)
+    if not res:
+        return []
+    return [decode_event(eid, fields) for eid, fields in res[0][1]]
+
+def stream_id_key(entry_id):
+    """Clé de tri d'un id de stream "ms-seq"."""
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+def replay_events(r, after_id, count=1000):
+    """
+    Entrées strictement postérieures à after_id (rattrapage d'un client SSE).
+    Id mal formé (Last-Event-ID / ?last_id= fournis par le client) : pas de rattrapage.
+    """
+    try:
+        ms, seq = stream_id_key(after_id)
+    except (AttributeError, ValueError):
+        return []
+    if ms < 0 or seq < 0:
+        return []
+    return [decode_event(eid, fields) for eid, fields in r.xrange(EVENTS_STREAM, f"({ms}-{seq}", "+", count=count)]
+
+def event_source(r):
+    """Source pour EventHub : lit orders:events en continu depuis last_id (ou la fin)."""
+    def source(last_id):
+        cursor = last_id or last_event_id(r)
+        while True:
+            for event in read_events(r, cursor):
+                cursor = event["id"]
+                yield event
+    return source
+
+
+# -----------------------------
+# Groupes de consommateurs
+# -----------------------------
+def ensure_group(r, group, start_id="$"):
+    """Crée le groupe (et le stream) s'il n'existe pas ; start_id "0" = rejouer l'historique."""
+    try:
+        r.xgroup_create(EVENTS_STREAM, group, id=start_id, mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+def _handle(r, group, handler, entries):
+    for eid, fields in entries:
+        if not fields:          # entrée élaguée entre-temps : rien à traiter
+            r.xack(EVENTS_STREAM, group, eid)
+            continue
+        pipe = r.pipeline(transaction=True)
+        handler(pipe, decode_event(eid, fields))
+        pipe.xack(EVENTS_STREAM, group, eid)
+        pipe.execute()
+
+def consume(r, group, consumer, handler, count=50, block=BLOCK_MS, claim_idle_ms=CLAIM_IDLE_MS, once=False):
+    """
+    Boucle de worker : handler(pipe, event) ajoute ses écritures au MULTI qui
+    porte aussi le XACK. Une exception laisse le message en attente (PEL) :
+    il sera relu au redémarrage ("0") ou repris par un autre consommateur.
+    """
+    ensure_group(r, group)
+    # 1) ce que ce consommateur avait lu sans l'acquitter (crash précédent)
+    res = r.xreadgroup(group, consumer, {EVENTS_STREAM: "0"}, count=count)
+    if res:
+        _handle(r, group, handler, res[0][1])
+    while True:
+        # 2) messages abandonnés par des consommateurs morts
+        _, claimed, *_ = r.xautoclaim(EVENTS_STREAM, group, consumer, claim_idle_ms, "0-0", count=count)
+        if claimed:
+            _handle(r, group, handler, claimed)
+        # 3) nouveaux messages
+        res = r.xreadgroup(group, consumer, {EVENTS_STREAM: ">"}, count=count, block=block)
+        if res:
+            _handle(r, group, handler, res[0][1])
+        if once:
+            return
+
+
+# -----------------------------
+# Handlers fournis
+# -----------------------------
+def analytics_handler(pipe, event):
+    """Nombre d'événements par type et par jour : stats:events:{AAAAMMJJ}."""
+    day = time.strftime("%Y%m%d", time.localtime(event["ts"] or time.time()))
+    pipe.hincrby(f"stats:events:{day}", event["event"] or "inconnu", 1)
+
+def notifications_handler(pipe, event):
+    """Notification (POC : affichage) ; rejouée si le worker tombe avant l'ACK."""
+    p = event["payload"] if isinstance(event["payload"], dict) else {}
+    print(f"🔔 {event['event']} commande {p.get('id')} (statut {p.get('statut') or '-'})")
+
+HANDLERS = {
+    "analytics": analytics_handler,
+    "notifications": notifications_handler,
+}
+
+def main():
+    ap = argparse.ArgumentParser(description="Worker de groupe de consommateurs sur orders:events.")
+    ap.add_argument("--group", choices=sorted(HANDLERS), required=True)
+    ap.add_argument("--consumer", default=f"{socket.gethostname()}-{os.getpid()}")
+    ap.add_argument("--depuis-debut", action="store_true", help="Nouveau groupe : traiter tout l'historique du stream")
+    args = ap.parse_args()
+    r = Redis(host="127.0.0.1", port=6379, decode_responses=True)
+    if args.depuis_debut:
+        ensure_group(r, args.group, start_id="0")
+    print(f"✅ Worker {args.group}/{args.consumer} sur {EVENTS_STREAM}")
+    consume(r, args.group, args.consumer, HANDLERS[args.group])
+
+if __name__ == "__main__":
+    main()
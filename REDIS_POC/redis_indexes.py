@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Index secondaires des commandes côté Redis, maintenus à l'écriture.
+
+Clés (ZSET, membre = id de commande) :
+  idx:client:{cid}                  toutes les commandes du client       score = création
+  idx:restaurant:{rid}              toutes les commandes du restaurant   score = création
+  idx:restaurant:{rid}:{statut}     idem, par statut                     score = création
+  zone:{zone}:annonces              commandes ANONCEE de la zone         score = publication
+  courier:{lid}:assigned            commandes assignées au livreur       score = assignation
+  courier:{lid}:delivered           commandes LIVREE par le livreur      score = clôture
+
+index_diff(o, old) compare les entrées de l'ancienne et de la nouvelle version
+de la commande (champs du hash, cf. redis_orders) ; seule la différence (ZREM /
+ZADD) est appliquée, dans la même opération atomique que l'écriture de la
+commande (MULTI ou script Lua) : index et commande restent cohérents.
+Les listes se lisent ensuite par ZREVRANGE + MGET, sans SCAN order:*.
+À score égal, Redis trie par membre : les ids common.ids sont triés par date.
+
+Les chargeurs (redis_load_from_dir.py, mysql_to_redis.py) utilisent les mêmes
+fonctions ; reindex_all() reconstruit tout depuis order:*.
+"""
+
+from redis_orders import iter_orders
+
+def k_client_orders(cid): return f"idx:client:{cid}"
+def k_restaurant_orders(rid, statut=None):
+    return f"idx:restaurant:{rid}:{statut}" if statut else f"idx:restaurant:{rid}"
+def k_zone_annonces(zone): return f"zone:{zone}:annonces"
+def k_courier_assigned(lid): return f"courier:{lid}:assigned"
+def k_courier_delivered(lid): return f"courier:{lid}:delivered"
+
+INDEX_PATTERNS = ["idx:*", "zone:*:annonces", "courier:*:assigned", "courier:*:delivered"]
+
+def index_entries(o: dict) -> dict:
+    """{clé d'index: score} pour une version de commande (champs du hash)."""
+    if not o:
+        return {}
+    created = o.get("date_creation") or 0
+    statut = o.get("statut")
+    entries = {}
+    if o.get("id_client"):
+        entries[k_client_orders(o["id_client"])] = created
+    rid = o.get("id_restaurant")
+    if rid:
+        entries[k_restaurant_orders(rid)] = created
+        if statut:
+            entries[k_restaurant_orders(rid, statut)] = created
+    if statut == "ANONCEE" and o.get("zone"):
+        entries[k_zone_annonces(o["zone"])] = o.get("date_publiee") or created
+    if o.get("id_livreur_assigne"):
+        entries[k_courier_assigned(o["id_livreur_assigne"])] = o.get("date_assignee") or created
+    if statut == "LIVREE" and o.get("livree_par_livreur"):
+        entries[k_courier_delivered(o["livree_par_livreur"])] = o.get("date_cloture") or created
+    return entries
+
+def index_diff(o: dict, old: dict = None):
+    """(clés à quitter, {clé: score} à (ré)écrire) entre deux versions."""
+    before, after = index_entries(old), index_entries(o)
+    zrem = sorted(before.keys() - after.keys())
+    zadd = {k: s for k, s in after.items() if k not in before or before[k] != s}
+    return zrem, zadd
+
+def index_order(pipe, o: dict, old: dict = None):
+    """Applique index_diff ; `pipe` est un pipeline ou un client."""
+    oid = o["id_commande"]
+    zrem, zadd = index_diff(o, old)
+    for key in zrem:
+        pipe.zrem(key, oid)
+    for key, score in zadd.items():
+        pipe.zadd(key, {oid: score})
+
+def reindex_all(r):
+    """Purge et reconstruit tous les index depuis les commandes stockées."""
+    for pat in INDEX_PATTERNS:
+        for key in r.scan_iter(pat, count=500):
+            r.delete(key)
+    pipe = r.pipeline(transaction=False)
+    n = 0
+    for o in iter_orders(r):
+        index_order(pipe, o)
+        n += 1
+    pipe.execute()
+    return n
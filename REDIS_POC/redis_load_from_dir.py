@@ -8,17 +8,56 @@ Charge :
   - restaurants_menus.jsonl
   - orders.jsonl
 dans Redis, et reconstruit les index nécessaires.
+
+Chargement en flux : les fichiers sont lus par paquets de --lot lignes, chaque
+paquet part dans un pipeline (données + index + compteurs) ; --workers paquets
+sont envoyés en parallèle sur des connexions distinctes. La mémoire reste bornée
+(--workers x --lot lignes) quelle que soit la taille des fichiers ; la progression
+et le débit sont affichés au fil de l'eau.
+
+Bascule atomique (--staging-db N) : tout est chargé dans la base N (vidée au
+préalable), puis SWAPDB N <-> base cible : l'application passe d'un jeu de
+données complet à l'autre, sans état intermédiaire visible. L'ancien contenu
+reste dans la base N (sauf --vider-ancien). SWAPDB échange des bases entières :
+les clés hors POC de la base cible (groupes de consommateurs d'orders:events...)
+partent aussi dans la base N.
+
+    python redis_load_from_dir.py [--indir ./REDIS_POC/out] [--lot 1000] [--workers 4] [--staging-db 1]
 """
 
-import os, json
-from collections import defaultdict
-from typing import Dict, Any, List
+import os, json, time, argparse, fnmatch, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any
 from redis import Redis
 
+from redis_codec import set_value
+from redis_search import index_restaurant
+from redis_catalog import catalog_restaurant, CATALOG_PATTERNS
+from redis_cart import CART_PATTERNS
+from redis_counters import count_transition, reconcile_counters
+from redis_indexes import index_order, INDEX_PATTERNS
+from redis_orders import fields_from_document, interets_from_document, store_order
+
 # ========= CONFIG =========
-REDIS = Redis(host="127.0.0.1", port=6379, decode_responses=True)
+REDIS_CFG = dict(host="127.0.0.1", port=6379, decode_responses=True)
+TARGET_DB = 0
 INDIR = "./REDIS_POC/out"          # répertoire où se trouvent les fichiers JSONL
-FLUSH_FIRST = True       # True = purge avant rechargement
+FLUSH_FIRST = True       # True = purge avant rechargement (sans --staging-db)
+BATCH_SIZE = 1000        # lignes JSONL par pipeline
+WORKERS = 1              # pipelines envoyés en parallèle
+
+POC_PATTERNS = [
+    "order:*",
+    *INDEX_PATTERNS,
+    "interest:by_order:*", "interest:by_courier:*",    # anciens ensembles d'intérêts, purgés seulement
+    "user:*", "user:index:*",
+    "restaurant:*", "menu:*",
+    "search:rest:*",
+    *CATALOG_PATTERNS,
+    *CART_PATTERNS,
+    "counters:*",
+    "orders:events", "stats:events:*"
+]
 
 # ---------- helpers ----------
 def load_jsonl(path):
@@ -29,114 +68,194 @@ def load_jsonl(path):
             if line:
                 yield json.loads(line)
 
-def flush_prefixes(r: Redis):
-    """Supprime toutes les clés du POC"""
-    patterns = [
-        "order:*",
-        "zone:*:annonces",
-        "interest:by_order:*", "interest:by_courier:*",
-        "courier:*:assigned",
-        "user:*", "user:index:*",
-        "restaurant:*", "menu:*"
-    ]
-    for pat in patterns:
-        cursor = 0
-        while True:
-            cursor, keys = r.scan(cursor=cursor, match=pat, count=500)
-            if keys:
-                r.delete(*keys)
-            if cursor == 0:
-                break
-
-def k_zone_annonces(zone): return f"zone:{zone}:annonces"
-def k_interest_by_order(oid): return f"interest:by_order:{oid}"
-def k_interest_by_courier(lid): return f"interest:by_courier:{lid}"
-def k_courier_assigned(lid): return f"courier:{lid}:assigned"
-
-def rebuild_indexes_for_order(r: Redis, o: Dict[str, Any]):
-    """Reconstruit les index Redis à partir d'une commande"""
-    oid = o["id"]
-    ts = (o.get("timestamps") or {})
-    # annonces par zone
-    if o.get("statut") == "ANONCEE" and o.get("zone"):
-        score = ts.get("publiee") or ts.get("creation") or 0
-        r.zadd(k_zone_annonces(o["zone"]), {oid: score})
-    # intérêts
-    for liv in (o.get("interets") or {}).keys():
-        r.sadd(k_interest_by_order(oid), liv)
-        r.sadd(k_interest_by_courier(liv), oid)
-    # courses assignées
-    if o.get("livreur_assigne") and ts.get("assignee"):
-        r.zadd(k_courier_assigned(o["livreur_assigne"]), {oid: ts["assignee"]})
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def flush_prefixes(r: Redis, batch=BATCH_SIZE):
+    """Supprime toutes les clés du POC : un seul SCAN, UNLINK par paquets en pipeline."""
+    n = 0
+    pipe = r.pipeline(transaction=False)
+    pending = []
+    for key in r.scan_iter(count=5000):
+        if any(fnmatch.fnmatchcase(key, pat) for pat in POC_PATTERNS):
+            pending.append(key)
+            if len(pending) >= batch:
+                pipe.unlink(*pending)
+                n += len(pending)
+                pending = []
+                pipe.execute()
+    if pending:
+        pipe.unlink(*pending)
+        n += len(pending)
+    pipe.execute()
+    return n
+
+class Progress:
+    """Lignes traitées, débit moyen, affichage au plus toutes les `every` s."""
+
+    def __init__(self, label, every=2.0):
+        self.label = label
+        self.every = every
+        self.done = 0
+        self.start = time.monotonic()
+        self._last = self.start
+        self._lock = threading.Lock()
+
+    def add(self, n):
+        with self._lock:
+            self.done += n
+            t = time.monotonic()
+            if t - self._last >= self.every:
+                self._last = t
+                print(f"   … {self.label} : {self.done} lignes ({self.rate():.0f}/s)")
+
+    def rate(self):
+        elapsed = time.monotonic() - self.start
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def finish(self):
+        elapsed = time.monotonic() - self.start
+        print(f"✅ {self.label} : {self.done} lignes en {elapsed:.1f}s ({self.rate():.0f}/s)")
+
+def run_pipelined(r: Redis, label, rows, handler, batch=BATCH_SIZE, workers=WORKERS):
+    """
+    handler(pipe, chunk) ajoute les commandes d'un paquet au pipeline.
+    Au plus `workers` pipelines en vol (une connexion du pool chacun).
+    """
+    progress = Progress(label)
+
+    def send(chunk):
+        pipe = r.pipeline(transaction=False)
+        handler(pipe, chunk)
+        pipe.execute()
+        progress.add(len(chunk))
+
+    if workers <= 1:
+        for chunk in chunked(rows, batch):
+            send(chunk)
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="loader") as pool:
+            inflight = set()
+            for chunk in chunked(rows, batch):
+                if len(inflight) >= workers:
+                    finished, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                    for f in finished:
+                        f.result()
+                inflight.add(pool.submit(send, chunk))
+            for f in inflight:
+                f.result()
+    progress.finish()
+    return progress.done
+
+# ---------- handlers ----------
+def load_users(pipe, rows):
+    for row in rows:
+        if "user" in row:
+            # Exemple: {"key":"user:CLIENT:cli_001", "user":{...}}
+            set_value(pipe, row["key"], row["user"])
+        elif "mapping" in row and row["mapping"]:
+            # Exemple: {"key":"user:index:CLIENT", "mapping":{username:id}} -> un seul HSET
+            role = row["key"].split(":")[-1]
+            pipe.hset(f"user:index:{role}", mapping=row["mapping"])
+
+def load_restaurants(pipe, rows):
+    for row in rows:
+        rid = row["restaurant"]["id"]
+        set_value(pipe, f"restaurant:{rid}", row["restaurant"])
+        set_value(pipe, f"menu:{rid}", row.get("menu") or [])
+        index_restaurant(pipe, row["restaurant"])
+        catalog_restaurant(pipe, row["restaurant"], row.get("menu") or [])
+
+def rebuild_indexes_for_order(pipe, o: Dict[str, Any], fields=None):
+    """Index Redis d'une commande (pipeline ou client)"""
+    # client, restaurant (+statut), annonces par zone, courses du livreur (redis_indexes) ;
+    # les intérêts vivent dans le hash order:{id}:interets (redis_orders), sans index à part
+    index_order(pipe, fields or fields_from_document(o))
+
+def order_loader(count_inline):
+    def load_orders(pipe, rows):
+        for row in rows:
+            o = row["order"]
+            fields = fields_from_document(o)
+            # hash order:{id} + lignes + stream d'événements + intérêts (redis_orders)
+            store_order(pipe, fields, o.get("lignes"), o.get("events") or (), interets_from_document(o))
+            rebuild_indexes_for_order(pipe, o, fields)
+            if count_inline and fields.get("statut"):
+                count_transition(pipe, fields, None, fields["statut"])
+    return load_orders
 
 # ---------- main ----------
 def main():
-    if FLUSH_FIRST:
+    ap = argparse.ArgumentParser(description="Charge les JSONL du POC dans Redis (flux, pipelines, bascule atomique).")
+    ap.add_argument("--indir", default=INDIR)
+    ap.add_argument("--lot", type=int, default=BATCH_SIZE, help="Lignes JSONL par pipeline")
+    ap.add_argument("--workers", type=int, default=WORKERS, help="Pipelines envoyés en parallèle")
+    ap.add_argument("--db", type=int, default=TARGET_DB, help="Base Redis servie par l'application")
+    ap.add_argument("--staging-db", type=int, default=None, help="Charger dans cette base puis SWAPDB avec --db")
+    ap.add_argument("--vider-ancien", action="store_true", help="Après SWAPDB, vider la base qui contient l'ancien jeu")
+    args = ap.parse_args()
+
+    load_db = args.db if args.staging_db is None else args.staging_db
+    r = Redis(db=load_db, **REDIS_CFG)
+    t0 = time.monotonic()
+
+    fresh = True
+    if args.staging_db is not None:
+        if args.staging_db == args.db:
+            ap.error("--staging-db doit différer de --db")
+        print(f"🧹 Vidage de la base de staging {load_db}…")
+        r.flushdb()
+    elif FLUSH_FIRST:
         print("🧹 Purge des clés existantes…")
-        flush_prefixes(REDIS)
+        print(f"   {flush_prefixes(r, args.lot)} clés supprimées")
+    else:
+        fresh = False
 
-    users_path = os.path.join(INDIR, "users.jsonl")
-    rest_path  = os.path.join(INDIR, "restaurants_menus.jsonl")
-    orders_path = os.path.join(INDIR, "orders.jsonl")
+    users_path = os.path.join(args.indir, "users.jsonl")
+    rest_path  = os.path.join(args.indir, "restaurants_menus.jsonl")
+    orders_path = os.path.join(args.indir, "orders.jsonl")
 
     # ----- USERS -----
     if os.path.exists(users_path):
         print(f"📦 Chargement {users_path} …")
-        pipe = REDIS.pipeline()
-        role_indexes = defaultdict(dict)
-
-        for row in load_jsonl(users_path):
-            if "user" in row:
-                # Exemple: {"key":"user:CLIENT:cli_001", "user":{...}}
-                pipe.set(row["key"], json.dumps(row["user"], ensure_ascii=False))
-            elif "mapping" in row:
-                # Exemple: {"key":"user:index:CLIENT", "mapping":{username:id}}
-                role = row["key"].split(":")[-1]
-                role_indexes[role].update(row["mapping"])
-
-        pipe.execute()
-
-        # Créer les index hmap
-        for role, mapping in role_indexes.items():
-            if mapping:
-                for username, uid in mapping.items():
-                    REDIS.hset(f"user:index:{role}", username, uid)
-
-        print("✅ Utilisateurs + index chargés.")
+        run_pipelined(r, "utilisateurs", load_jsonl(users_path), load_users, args.lot, args.workers)
     else:
         print("⚠️ Fichier users.jsonl manquant.")
 
     # ----- RESTAURANTS + MENUS -----
     if os.path.exists(rest_path):
         print(f"📦 Chargement {rest_path} …")
-        pipe = REDIS.pipeline()
-        for row in load_jsonl(rest_path):
-            rid = row["restaurant"]["id"]
-            pipe.set(f"restaurant:{rid}", json.dumps(row["restaurant"], ensure_ascii=False))
-            pipe.set(f"menu:{rid}", json.dumps(row.get("menu") or [], ensure_ascii=False))
-        pipe.execute()
-        print("✅ Restaurants + menus chargés.")
+        run_pipelined(r, "restaurants + menus", load_jsonl(rest_path), load_restaurants, args.lot, args.workers)
     else:
         print("⚠️ Fichier restaurants_menus.jsonl manquant.")
 
     # ----- ORDERS -----
     if os.path.exists(orders_path):
         print(f"📦 Chargement {orders_path} …")
-        orders = []
-        pipe = REDIS.pipeline()
-        for row in load_jsonl(orders_path):
-            pipe.set(row["key"], json.dumps(row["order"], ensure_ascii=False))
-            orders.append(row["order"])
-        pipe.execute()
-        # Index Redis secondaires
-        for o in orders:
-            rebuild_indexes_for_order(REDIS, o)
-        print("✅ Commandes chargées + index reconstruits.")
+        # base vide : compteurs incrémentés au fil du chargement ; sinon recalcul complet
+        run_pipelined(r, "commandes", load_jsonl(orders_path), order_loader(fresh), args.lot, args.workers)
+        if not fresh:
+            reconcile_counters(r)
+        print("✅ Commandes chargées + index et compteurs.")
     else:
         print("⚠️ Fichier orders.jsonl manquant.")
 
-    print("🎯 Chargement terminé avec succès.")
-    print("🔍 Nombre total de clés:", REDIS.dbsize())
+    if args.staging_db is not None:
+        r.swapdb(args.db, args.staging_db)
+        print(f"🔀 SWAPDB {args.db} <-> {args.staging_db} : nouveau jeu en service")
+        if args.vider_ancien:
+            r.flushdb(asynchronous=True)
+            print(f"🧹 Ancien jeu (base {args.staging_db}) vidé")
+
+    print(f"🎯 Chargement terminé en {time.monotonic() - t0:.1f}s.")
+    print("🔍 Nombre total de clés:", Redis(db=args.db, **REDIS_CFG).dbsize())
 
 if __name__ == "__main__":
     main()
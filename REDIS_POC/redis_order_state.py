@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Machine à états des commandes (POC Redis), en scripts Lua côté serveur.
+
+    CREEE -> ANONCEE -> ASSIGNEE -> EN_LIVRAISON -> LIVREE
+      \\________\\___________\\______________________> ANNULEE
+
+Même table de transitions que SQL_POC/order_state.py. Chaque action est un script
+chargé une fois (SCRIPT LOAD) puis appelé par EVALSHA ; en un seul aller-retour
+et de façon atomique, le script :
+  - vérifie le statut source, le propriétaire et, si fournie, la version lue par
+    l'appelant (CAS : une page affichée périmée ne peut plus agir) ;
+  - écrit les champs du hash order:{id} et incrémente `version` ;
+  - met à jour les index secondaires (ZSET) et les compteurs (HINCRBY) ;
+  - ajoute l'événement au stream order:{id}:events (audit de la commande) ;
+  - l'ajoute au journal global orders:events (redis_events, même enveloppe que
+    redis_poc.rpub), lu par /events et par les groupes de consommateurs.
+
+Le prélude Lua reprend redis_indexes.index_entries et redis_counters.counter_keys :
+les clés d'index sont dérivées des champs de la commande dans le script (Redis
+seul, pas Redis Cluster). Toute modification des index doit être faite aux deux endroits.
+
+Codes retour : OK, REFUSED (statut, propriétaire ou version), NOT_FOUND, NOOP
+(intérêt déjà présent / absent).
+"""
+
+import json
+from collections import namedtuple
+from redis.exceptions import NoScriptError
+
+from redis_orders import k_order, k_order_events, k_order_interets
+from redis_events import EVENTS_STREAM, EVENTS_MAXLEN
+
+OK, REFUSED, NOT_FOUND, NOOP = 1, 0, -1, 2
+
+Outcome = namedtuple("Outcome", "code statut version")
+
+CHANNEL_ORDER_PUBLISHED = "orders.published"
+CHANNEL_ORDER_ASSIGNED  = "orders.assigned"
+CHANNEL_ORDER_CANCELLED = "orders.cancelled"
+CHANNEL_ORDER_UPDATED   = "orders.updated"
+
+# set : champ -> "$param" (paramètre de l'action), "$ts", "$acteur" ou valeur littérale
+TRANSITIONS = {
+    "publier": {
+        "from": ["CREEE"], "to": "ANONCEE", "role": "RESTAURANT", "owner": "id_restaurant",
+        "set": {"remuneration": "$param", "date_publiee": "$ts"}, "param": "remuneration",
+        "event": "PUBLICATION", "channel": CHANNEL_ORDER_PUBLISHED, "name": "published",
+    },
+    "assigner": {
+        "from": ["ANONCEE"], "to": "ASSIGNEE", "role": "RESTAURANT", "owner": "id_restaurant",
+        "set": {"id_livreur_assigne": "$param", "date_assignee": "$ts"}, "param": "livreur",
+        "event": "ASSIGNATION", "channel": CHANNEL_ORDER_ASSIGNED, "name": "assigned",
+    },
+    "demarrer": {
+        "from": ["ASSIGNEE"], "to": "EN_LIVRAISON", "role": "LIVREUR", "owner": "id_livreur_assigne",
+        "set": {"date_demarrage": "$ts"},
+        "event": "DEPART_LIVRAISON", "channel": CHANNEL_ORDER_UPDATED, "name": "delivery_started",
+    },
+    "livrer": {
+        "from": ["EN_LIVRAISON"], "to": "LIVREE", "role": "LIVREUR", "owner": "id_livreur_assigne",
+        "set": {"date_cloture": "$ts", "livree_par_livreur": "$acteur"},
+        "event": "LIVRAISON", "channel": CHANNEL_ORDER_UPDATED, "name": "delivered",
+    },
+    "annuler_client": {
+        "from": ["CREEE", "ANONCEE"], "to": "ANNULEE", "role": "CLIENT", "owner": "id_client",
+        "set": {"annule_par": "CLIENT", "motif_annulation": "$param", "date_cloture": "$ts"}, "param": "motif",
+        "event": "ANNULATION", "channel": CHANNEL_ORDER_CANCELLED, "name": "cancelled",
+    },
+    "annuler_restaurant": {
+        "from": ["CREEE", "ANONCEE", "ASSIGNEE"], "to": "ANNULEE", "role": "RESTAURANT", "owner": "id_restaurant",
+        "set": {"annule_par": "RESTAURANT", "motif_annulation": "$param", "date_cloture": "$ts"}, "param": "motif",
+        "event": "ANNULATION", "channel": CHANNEL_ORDER_CANCELLED, "name": "cancelled",
+    },
+}
+
+INTEREST_ACTIONS = {
+    "interet_ajouter": {"role": "LIVREUR", "event": "INTERET", "channel": CHANNEL_ORDER_UPDATED, "name": "interest_added"},
+    "interet_retirer": {"role": "LIVREUR", "event": "INTERET", "channel": CHANNEL_ORDER_UPDATED, "name": "interest_removed"},
+}
+
+# KEYS[1] order:{id}   KEYS[2] order:{id}:events   KEYS[3] order:{id}:interets   KEYS[4] orders:events
+# ARGV[1] version attendue ('' = pas de contrôle)   ARGV[2] id acteur   ARGV[3] ts
+# ARGV[4] détails de l'événement   ARGV[5], ARGV[6] paramètres de l'action   ARGV[7] id commande
+PRELUDE_LUA = """
+local oid = ARGV[7]
+local raw = redis.call('HGETALL', KEYS[1])
+if #raw == 0 then return {-1} end
+local o = {}
+for i = 1, #raw, 2 do
+  if raw[i + 1] ~= '' then o[raw[i]] = raw[i + 1] end
+end
+local version = tonumber(o.version or '0')
+local function refuse() return {0, o.statut or '', version} end
+if ARGV[1] ~= '' and tonumber(ARGV[1]) ~= version then return refuse() end
+
+-- cf. redis_indexes.index_entries
+local function index_entries(c)
+  local e = {}
+  local created = tonumber(c.date_creation or '0')
+  if c.id_client then e['idx:client:' .. c.id_client] = created end
+  if c.id_restaurant then
+    e['idx:restaurant:' .. c.id_restaurant] = created
+    if c.statut then e['idx:restaurant:' .. c.id_restaurant .. ':' .. c.statut] = created end
+  end
+  if c.statut == 'ANONCEE' and c.zone then
+    e['zone:' .. c.zone .. ':annonces'] = tonumber(c.date_publiee or created)
+  end
+  if c.id_livreur_assigne then
+    e['courier:' .. c.id_livreur_assigne .. ':assigned'] = tonumber(c.date_assignee or created)
+  end
+  if c.statut == 'LIVREE' and c.livree_par_livreur then
+    e['courier:' .. c.livree_par_livreur .. ':delivered'] = tonumber(c.date_cloture or created)
+  end
+  return e
+end
+
+-- cf. redis_counters.counter_keys
+local function counter_keys(c)
+  local k = {}
+  if c.id_restaurant then k[#k + 1] = 'counters:restaurant:' .. c.id_restaurant end
+  if c.zone then k[#k + 1] = 'counters:zone:' .. c.zone end
+  return k
+end
+
+local function commit(changes)
+  local n = {}
+  for f, v in pairs(o) do n[f] = v end
+  local hset = {}
+  for f, v in pairs(changes) do
+    n[f] = v
+    hset[#hset + 1] = f
+    hset[#hset + 1] = v
+  end
+  n.version = tostring(version + 1)
+  hset[#hset + 1] = 'version'
+  hset[#hset + 1] = n.version
+  redis.call('HSET', KEYS[1], unpack(hset))
+
+  local before, after = index_entries(o), index_entries(n)
+  for k in pairs(before) do
+    if after[k] == nil then redis.call('ZREM', k, oid) end
+  end
+  for k, s in pairs(after) do
+    if before[k] ~= s then redis.call('ZADD', k, s, oid) end
+  end
+  if n.statut ~= o.statut then
+    for _, k in ipairs(counter_keys(o)) do redis.call('HINCRBY', k, o.statut, -1) end
+    for _, k in ipairs(counter_keys(n)) do redis.call('HINCRBY', k, n.statut, 1) end
+  end
+
+  redis.call('XADD', KEYS[2], '*', 'type', T.event, 'acteur_role', T.role,
+             'acteur_id', ARGV[2], 'details', ARGV[4], 'ts', ARGV[3])
+  local payload = {id = oid, statut = n.statut, version = tonumber(n.version), zone = n.zone,
+                   id_client = n.id_client, id_restaurant = n.id_restaurant,
+                   id_livreur_assigne = n.id_livreur_assigne, acteur = ARGV[2]}
+  if T.param then payload[T.param] = ARGV[5] end
+  redis.call('XADD', KEYS[4], 'MAXLEN', '~', T.maxlen, '*', 'event', T.name, 'channel', T.channel,
+             'payload', cjson.encode(payload), 'ts', ARGV[3])
+  return {1, n.statut, tonumber(n.version)}
+end
+"""
+
+TRANSITION_LUA = """
+local allowed = false
+for _, s in ipairs(T.from) do
+  if s == o.statut then allowed = true end
+end
+if not allowed or o[T.owner] ~= ARGV[2] then return refuse() end
+local changes = {statut = T.to}
+for f, src in pairs(T.set) do
+  if src == '$param' then changes[f] = ARGV[5]
+  elseif src == '$ts' then changes[f] = ARGV[3]
+  elseif src == '$acteur' then changes[f] = ARGV[2]
+  else changes[f] = src end
+end
+return commit(changes)
+"""
+
+INTEREST_LUA = {
+    # ARGV[5] temps estimé, ARGV[6] commentaire
+    "interet_ajouter": """
+if o.statut ~= 'ANONCEE' then return refuse() end
+local entry = cjson.encode({id_livreur = ARGV[2], ts = tonumber(ARGV[3]),
+                            temps_estime = ARGV[5], commentaire = ARGV[6]})
+if redis.call('HSETNX', KEYS[3], ARGV[2], entry) == 0 then return {2, o.statut, version} end
+return commit({})
+""",
+    "interet_retirer": """
+if o.statut ~= 'ANONCEE' then return refuse() end
+if redis.call('HDEL', KEYS[3], ARGV[2]) == 0 then return {2, o.statut, version} end
+return commit({})
+""",
+}
+
+def _script(spec, body):
+    spec = {**spec, "maxlen": EVENTS_MAXLEN}
+    return f"local T = cjson.decode([==[{json.dumps(spec)}]==])\n" + PRELUDE_LUA + body
+
+SCRIPTS = {name: _script(spec, TRANSITION_LUA) for name, spec in TRANSITIONS.items()}
+SCRIPTS.update({name: _script(spec, INTEREST_LUA[name]) for name, spec in INTEREST_ACTIONS.items()})
+
+_shas = {}
+
+def load_scripts(r):
+    """SCRIPT LOAD de toute la bibliothèque (démarrage, ou après SCRIPT FLUSH / redémarrage Redis)."""
+    for name, src in SCRIPTS.items():
+        _shas[name] = r.script_load(src)
+    return dict(_shas)
+
+def _run(r, name, oid, acteur_id, ts, version=None, details="", *params):
+    if name not in _shas:
+        load_scripts(r)
+    keys = [k_order(oid), k_order_events(oid), k_order_interets(oid), EVENTS_STREAM]
+    args = ["" if version in (None, "") else int(version), acteur_id, ts, details or "",
+            *["" if p is None else p for p in params]]
+    args += [""] * (6 - len(args)) + [oid]      # ARGV[7] = id de commande
+    try:
+        res = r.evalsha(_shas[name], len(keys), *keys, *args)
+    except NoScriptError:
+        load_scripts(r)
+        res = r.evalsha(_shas[name], len(keys), *keys, *args)
+    return Outcome(int(res[0]), res[1] if len(res) > 1 else None, res[2] if len(res) > 2 else None)
+
+def transition(r, id_commande, action, acteur_id, ts, param=None, version=None, details=None) -> Outcome:
+    """
+    Applique `action` (clé de TRANSITIONS) si la commande est dans un statut source,
+    appartient à acteur_id et, si `version` est donnée, n'a pas changé depuis sa lecture.
+    param : rémunération, livreur ou motif selon l'action.
+    """
+    return _run(r, action, id_commande, acteur_id, ts, version, details, param)
+
+def add_interest(r, id_commande, id_livreur, ts, temps_estime=None, commentaire=None, version=None) -> Outcome:
+    """Intérêt d'un livreur, seulement si la commande est ANONCEE ; NOOP si déjà présent."""
+    return _run(r, "interet_ajouter", id_commande, id_livreur, ts, version,
+                f"ETA {temps_estime} min" if temps_estime else "", temps_estime, commentaire)
+
+def remove_interest(r, id_commande, id_livreur, ts, version=None) -> Outcome:
+    """Retire l'intérêt d'un livreur tant que la commande est ANONCEE ; NOOP si absent."""
+    return _run(r, "interet_retirer", id_commande, id_livreur, ts, version, "Intérêt retiré")
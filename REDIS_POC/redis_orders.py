@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Stockage d'une commande Redis en champs adressables (au lieu d'un blob JSON).
+
+Clés :
+  order:{id}            HASH    champs scalaires (FIELDS), noms identiques aux colonnes SQL
+  order:{id}:lignes     STRING  lignes (redis_codec), écrites une seule fois à la création
+  order:{id}:events     STREAM  événements (même clé que mysql_to_redis.stream_events_from_sql)
+  order:{id}:interets   HASH    id livreur -> JSON de l'intérêt (redis_order_state)
+
+Une transition ne touche que quelques champs du hash (HSET) : plus de relecture /
+réécriture du document complet avec ses lignes et événements. Les listes lisent
+seulement les champs affichés (HMGET, LIST_FIELDS).
+
+Les valeurs None ne sont pas stockées (champ absent du hash).
+"""
+
+import json
+
+from redis_codec import get_value, set_value
+
+FIELDS = (
+    "id_commande", "version", "statut", "zone",
+    "livraison_adresse", "livraison_lat", "livraison_lon",
+    "id_client", "nom_client", "id_restaurant", "nom_restaurant",
+    "id_livreur_assigne", "nom_livreur_assigne", "livree_par_livreur",
+    "remuneration", "montant_total_client", "annule_par", "motif_annulation",
+    "date_creation", "date_publiee", "date_assignee", "date_demarrage", "date_cloture",
+)
+INT_FIELDS = {"version", "date_creation", "date_publiee", "date_assignee", "date_demarrage", "date_cloture"}
+FLOAT_FIELDS = {"remuneration", "montant_total_client", "livraison_lat", "livraison_lon"}
+
+# Champs lus par les listes (dashboards, annonces, courses, historique)
+LIST_FIELDS = (
+    "id_commande", "statut", "zone", "livraison_adresse", "id_client", "id_restaurant",
+    "id_livreur_assigne", "remuneration", "montant_total_client", "date_creation", "date_cloture",
+)
+
+def k_order(oid): return f"order:{oid}"
+def k_order_lignes(oid): return f"order:{oid}:lignes"
+def k_order_events(oid): return f"order:{oid}:events"
+def k_order_interets(oid): return f"order:{oid}:interets"
+
+def decode(h: dict) -> dict:
+    """Valeurs du hash (str) -> types Python."""
+    out = {}
+    for f, v in h.items():
+        if v is None or v == "":
+            out[f] = None
+        elif f in INT_FIELDS:
+            out[f] = int(float(v))
+        elif f in FLOAT_FIELDS:
+            out[f] = float(v)
+        else:
+            out[f] = v
+    return out
+
+def encode(fields: dict) -> dict:
+    """Champs à écrire (None exclus)."""
+    return {f: (str(v) if not isinstance(v, str) else v) for f, v in fields.items() if v is not None}
+
+def fields_from_document(o: dict) -> dict:
+    """Ancien format document (export SQL / JSON imbriqué) -> champs du hash."""
+    ts = o.get("timestamps") or {}
+    livraison = o.get("livraison") or {}
+    client = o.get("client") or {}
+    restaurant = o.get("restaurant") or {}
+    date_cloture = ts.get("cloture")
+    return {
+        "id_commande": o.get("id") or o.get("id_commande"),
+        "version": o.get("version") or 1,
+        "statut": o.get("statut"),
+        "zone": o.get("zone"),
+        "livraison_adresse": livraison.get("adresse") or o.get("livraison_adresse"),
+        "livraison_lat": livraison.get("lat"),
+        "livraison_lon": livraison.get("lon"),
+        "id_client": client.get("id"),
+        "nom_client": client.get("nom"),
+        "id_restaurant": restaurant.get("id"),
+        "nom_restaurant": restaurant.get("nom"),
+        "id_livreur_assigne": o.get("id_livreur_assigne") or o.get("livreur_assigne"),
+        "nom_livreur_assigne": o.get("livreur_assigne_nom"),
+        "livree_par_livreur": o.get("livree_par_livreur") or o.get("livree_par"),
+        "remuneration": o.get("remuneration"),
+        "montant_total_client": o.get("montant_total_client"),
+        "annule_par": o.get("annule_par"),
+        "motif_annulation": o.get("motif_annulation"),
+        "date_creation": ts.get("creation"),
+        "date_publiee": ts.get("publiee"),
+        "date_assignee": ts.get("assignee"),
+        "date_demarrage": ts.get("demarrage"),
+        "date_cloture": date_cloture if isinstance(date_cloture, (int, float)) else None,
+    }
+
+def interets_from_document(o: dict) -> dict:
+    """Ancien format {livreur: {eta, comment, ts}} -> entrées de order:{id}:interets."""
+    return {
+        lid: {"id_livreur": lid, "ts": i.get("ts"), "temps_estime": i.get("eta"), "commentaire": i.get("comment")}
+        for lid, i in (o.get("interets") or {}).items()
+    }
+
+def store_order(pipe, fields: dict, lignes=None, events=(), interets=None):
+    """
+    Écrit une commande complète (création, chargement) ; à exécuter dans un MULTI.
+    Les clés de la commande sont d'abord supprimées : un rechargement sans purge
+    remplace hash, intérêts et stream d'événements au lieu de les dupliquer.
+    """
+    oid = fields["id_commande"]
+    pipe.delete(k_order(oid), k_order_interets(oid), k_order_events(oid))
+    pipe.hset(k_order(oid), mapping=encode(fields))
+    set_value(pipe, k_order_lignes(oid), lignes or [])
+    for e in events:
+        pipe.xadd(k_order_events(oid), encode(e))
+    if interets:
+        pipe.hset(k_order_interets(oid),
+                  mapping={lid: json.dumps(i, ensure_ascii=False) for lid, i in interets.items()})
+
+def load_order(r, oid):
+    """Hash décodé de la commande, None si absente."""
+    h = r.hgetall(k_order(oid))
+    return decode(h) if h else None
+
+def load_lignes(r, oid):
+    return get_value(r, k_order_lignes(oid)) or []
+
+def load_interets(r, oid):
+    """Intérêts des livreurs, du plus ancien au plus récent."""
+    interets = [json.loads(v) for v in r.hvals(k_order_interets(oid))]
+    return sorted(interets, key=lambda i: i.get("ts") or 0)
+
+def fetch_orders(r, ids, fields=LIST_FIELDS):
+    """HMGET des champs demandés pour chaque id (un seul aller-retour), dans l'ordre des ids."""
+    pipe = r.pipeline(transaction=False)
+    for oid in ids:
+        pipe.hmget(k_order(oid), fields)
+    out = []
+    for values in pipe.execute():
+        if values and values[0] is not None:
+            out.append(decode(dict(zip(fields, values))))
+    return out
+
+def iter_orders(r, fields=None):
+    """Parcourt toutes les commandes (réindexation, réconciliation) ; ignore les clés annexes."""
+    for key in r.scan_iter("order:*", count=500):
+        if key.count(":") != 1:       # order:{id}:lignes / :events / :interets
+            continue
+        if fields:
+            values = r.hmget(key, fields)
+            yield decode(dict(zip(fields, values)))
+        else:
+            yield decode(r.hgetall(key))
@@ -1,16 +1,35 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-POC UberEats — Version Redis (FULL, with structured Pub/Sub)
+POC UberEats — Version Redis (FULL, événements dans le stream orders:events)
 Front partagé : ../frontend/
+SSE /events : un lecteur du stream par processus, diffusé par common.event_hub.EventHub.
 """
 
-import os, json, time, uuid
+import os, sys, json, time
 from types import SimpleNamespace
 from functools import wraps
 from flask import Flask, render_template, request, redirect, url_for, flash, make_response, Response
 from redis import Redis
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.ids import new_order_id, set_node_allocator, NODE_COUNT
+from common.event_hub import EventHub
+from common.event_scopes import requested_scopes
+
+from redis_search import search_restaurants
+from redis_catalog import list_restaurants, fetch_restaurants, dish_restaurants, k_summary
+import redis_cart as cart
+from redis_counters import count_transition, restaurant_counts, zone_count
+from redis_indexes import (index_order, k_client_orders, k_restaurant_orders, k_zone_annonces,
+                           k_courier_assigned, k_courier_delivered)
+from redis_codec import get_value
+from redis_orders import (store_order, load_order, load_lignes, load_interets, fetch_orders,
+                          k_order, k_order_interets)
+import redis_order_state as order_state
+from redis_order_state import OK, NOT_FOUND, NOOP
+from redis_events import emit, event_source, replay_events, stream_id_key
+
 # -----------------------------
 # Config Redis & Flask
 # -----------------------------
@@ -29,18 +48,14 @@ app.secret_key = APP_SECRET
 
 
 # -----------------------------
-# Pub/Sub channels (constants)
+# Event channels (constants)
 # -----------------------------
 CHANNEL_ORDER_CREATED   = "orders.created"
-CHANNEL_ORDER_PUBLISHED = "orders.published"
-CHANNEL_ORDER_ASSIGNED  = "orders.assigned"
-CHANNEL_ORDER_CANCELLED = "orders.cancelled"
-CHANNEL_ORDER_UPDATED   = "orders.updated"   # generic fallback if needed
 
 
 def rpub(channel, event_type, payload):
     """
-    Publish structured events across Redis Pub/Sub.
+    Ajoute un événement structuré au journal orders:events (redis_events).
 
     event schema:
       {
@@ -49,33 +64,9 @@ def rpub(channel, event_type, payload):
         "payload": { ... },           # event-specific data
         "ts": <epoch seconds>         # server timestamp
       }
+    Les transitions écrivent le leur depuis leurs scripts Lua (redis_order_state).
     """
-    REDIS.publish(channel, json.dumps({
-        "event": event_type,
-        "channel": channel,
-        "payload": payload,
-        "ts": int(time.time())
-    }, ensure_ascii=False))
-
-
-def rsub(pattern="orders.*"):
-    """
-    Subscribe to a Pub/Sub pattern and yield structured events.
-    Intended to be used by SSE stream.
-    """
-    ps = REDIS.pubsub()
-    ps.psubscribe(pattern)
-    for msg in ps.listen():
-        if msg["type"] not in ("message", "pmessage"):
-            continue
-        data = msg["data"]
-        if isinstance(data, bytes):
-            data = data.decode("utf-8")
-        try:
-            yield json.loads(data)
-        except Exception:
-            # if legacy messages were published as plain JSON payloads
-            yield {"event": "raw", "channel": msg.get("channel") or msg.get("pattern"), "payload": data, "ts": int(time.time())}
+    emit(REDIS, channel, event_type, payload)
 
 
 # -----------------------------
@@ -100,19 +91,107 @@ def inject_session_user():
 # Redis Helpers
 # -----------------------------
 def now(): return int(time.time())
-def new_order_id(): return "cmd_" + uuid.uuid4().hex[:8]
 
 def k_user(role, uid): return f"user:{role}:{uid}"
 def k_user_index(role): return f"user:index:{role}"
 def k_menu(rid): return f"menu:{rid}"
-def k_order(oid): return f"order:{oid}"
 
 def load_json(k):
-    s = REDIS.get(k)
-    return json.loads(s) if s else None
+    return get_value(REDIS, k)
+
+# Nœud des ids de commande (common.ids) : bail ids:node:{n} pris par SET NX EX
+def k_id_node(n): return f"ids:node:{n}"
+
+RENEW_NODE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('EXPIRE', KEYS[1], ARGV[2]) end
+return 0
+"""
+
+def claim_id_node(owner, ttl):
+    for n in range(NODE_COUNT):
+        if REDIS.set(k_id_node(n), owner, nx=True, ex=ttl):
+            return n
+    return None
 
-def save_json(k, obj):
-    REDIS.set(k, json.dumps(obj, ensure_ascii=False))
+def renew_id_node(node, owner, ttl):
+    return bool(REDIS.eval(RENEW_NODE_LUA, 1, k_id_node(node), owner, ttl))
+
+set_node_allocator(claim_id_node, renew_id_node)
+
+def create_order(fields, lignes, event, pipe=None):
+    """
+    Hash + lignes + événements + compteurs + index de la nouvelle commande dans un MULTI.
+    Avec `pipe` (déjà en MULTI, cf. redis_cart.checkout), les commandes y sont seulement ajoutées.
+    """
+    own = pipe is None
+    if own:
+        pipe = REDIS.pipeline(transaction=True)
+    store_order(pipe, fields, lignes, [event])
+    count_transition(pipe, fields, None, fields["statut"])
+    index_order(pipe, fields)
+    emit(pipe, CHANNEL_ORDER_CREATED, "created", {
+        "id": fields["id_commande"], "statut": fields["statut"], "version": fields["version"],
+        "zone": fields["zone"], "id_client": fields["id_client"], "id_restaurant": fields["id_restaurant"],
+    }, fields["date_creation"])
+    if own:
+        pipe.execute()
+
+PAGE_SIZE = 20
+
+# Frais de livraison par zone (mêmes valeurs que DELIVERY_ZONES de client/cart.html et le POC MongoDB)
+ZONE_FEES = {
+    "paris-1": 2.5,
+    "paris-2": 2.5,
+    "paris-3": 3.0,
+    "paris-4": 3.0,
+    "paris-centre": 2.0,
+}
+
+def zone_fee(zone, montant_front, sous_total):
+    """
+    Frais de la zone : table ZONE_FEES, sinon écart entre le total posté par le
+    formulaire (frais inclus) et le sous-total du panier affiché ; 0 à défaut.
+    """
+    if zone.lower() in ZONE_FEES:
+        return ZONE_FEES[zone.lower()]
+    try:
+        return max(round(float(montant_front.replace(",", ".")) - sous_total, 2), 0.0)
+    except ValueError:
+        return 0.0
+
+def parse_curseur(raw):
+    """'<timestamp>:<id commande>' -> (timestamp, id), None si absent ou invalide."""
+    if not raw:
+        return None
+    ts, _, oid = raw.partition(":")
+    try:
+        return int(ts), oid
+    except ValueError:
+        return None
+
+def page_orders(index_key):
+    """
+    Une page d'un index, par curseur keyset '<score>:<id>' (comme les POC SQL et
+    MongoDB) : une commande ajoutée ou réindexée entre deux pages ne décale rien.
+    Dans le même aller-retour : les ids de même score que le curseur (départagés
+    par id, ordre ZREVRANGE) puis ZREVRANGEBYSCORE (score -inf ; ensuite HMGET des
+    champs affichés. Retourne (commandes, next_cursor).
+    """
+    cur = parse_curseur(request.args.get("curseur"))
+    if cur is None:
+        rows = REDIS.zrevrange(index_key, 0, PAGE_SIZE, withscores=True)   # PAGE_SIZE + 1 : page suivante ?
+    else:
+        ts, oid = cur
+        pipe = REDIS.pipeline(transaction=False)
+        pipe.zrevrangebyscore(index_key, ts, ts, withscores=True)
+        pipe.zrevrangebyscore(index_key, f"({ts}", "-inf", start=0, num=PAGE_SIZE + 1, withscores=True)
+        ties, older = pipe.execute()
+        rows = ([(m, sc) for m, sc in ties if m < oid] + older)[:PAGE_SIZE + 1]
+    next_cursor = None
+    if len(rows) > PAGE_SIZE:
+        rows = rows[:PAGE_SIZE]
+        next_cursor = f"{int(rows[-1][1])}:{rows[-1][0]}"
+    return fetch_orders(REDIS, [m for m, _ in rows]), next_cursor
 
 
 # -----------------------------
@@ -209,17 +288,11 @@ def logout():
 # -----------------------------
 @app.get("/orders/<string:oid>/json")
 def order_json(oid):
-    o = load_json(k_order(oid))
+    o = load_order(REDIS, oid)
     if not o:
         return {"error": "Commande introuvable"}, 404
-
-    # Provide a minimal normalized view for the frontend
-    out = o.copy()
-    if "id_commande" not in out and "id" in out:
-        out["id_commande"] = out["id"]
-    if "livraison_adresse" not in out and "livraison" in out:
-        out["livraison_adresse"] = (out.get("livraison") or {}).get("adresse")
-    return out
+    o["lignes"] = load_lignes(REDIS, oid)
+    return o
 
 @app.get("/orders/<string:oid>")
 def order_json_alias(oid):
@@ -233,19 +306,13 @@ def order_json_alias(oid):
 @require_login
 @role_required("CLIENT")
 def client_restaurants():
-    q = (request.args.get("q") or "").lower()
-    restaurants = []
-    for k in REDIS.scan_iter("menu:*"):
-        rid = k.split(":")[-1]
-        data = load_json(k)
-        if not data:
-            continue
-        if isinstance(data, dict) and "restaurant" in data:
-            r = data["restaurant"]
-        else:
-            r = {"id_restaurant": rid, "nom": rid, "zone": "inconnue"}
-        if not q or q in r.get("nom", "").lower() or q in r.get("zone", "").lower():
-            restaurants.append(r)
+    q = (request.args.get("q") or "").strip()
+    if q:
+        # Index inversé (redis_search) : préfixes, sans accents, classé, limité
+        restaurants = fetch_restaurants(REDIS, search_restaurants(REDIS, q))
+    else:
+        # Catalogue (redis_catalog) : ZRANGE + HMGET en pipeline, ?zone= pour filtrer
+        restaurants = list_restaurants(REDIS, (request.args.get("zone") or "").strip() or None)
     return render_template("client/restaurants.html", restaurants=restaurants)
 
 @app.route("/client/restaurant/<string:restaurant_id>")
@@ -261,7 +328,7 @@ def client_restaurant_menu(restaurant_id):
         restaurant = data.get("restaurant", {"id_restaurant": restaurant_id, "nom": f"Restaurant {restaurant_id}"})
         menu = data["menu"]
     else:
-        restaurant = {"id_restaurant": restaurant_id, "nom": f"Restaurant {restaurant_id}"}
+        restaurant = fetch_restaurants(REDIS, [restaurant_id])[0]
         menu = data if isinstance(data, list) else []
 
     # S'assurer que le restaurant a un nom
@@ -276,33 +343,20 @@ def client_restaurant_menu(restaurant_id):
             if "nom" not in p:
                 p["nom"] = p.get("label") or "Plat"
 
-    panier = load_json(f"panier:{request.user['id']}") or []
+    panier = cart.load_cart(REDIS, request.user["id"])
     return render_template("client/restaurant_menu.html", restaurant=restaurant, menu=menu, panier=panier)
 
 @app.route("/client/add_line", methods=["POST"])
 @require_login
 @role_required("CLIENT")
 def client_add_line():
-    panier_key = f"panier:{request.user['id']}"
-    panier = load_json(panier_key) or []
-
-    # Enforce single-restaurant cart
-    restaurant_id = request.form.get("id_restaurant")
-    if panier and restaurant_id:
-        for item in panier:
-            if item.get("id_restaurant") != restaurant_id:
-                flash("Vous ne pouvez commander que d'un seul restaurant à la fois. Videz votre panier pour changer de restaurant.")
-                return redirect(request.referrer or url_for("client_restaurants"))
-
-    panier.append({
-        "id_plat": request.form["id_plat"],
-        "nom": request.form["nom"],
-        "pu": float(request.form["pu"]),
-        "qty": int(request.form["qty"]),
-        "id_restaurant": restaurant_id,
-        "restaurant_name": request.form.get("restaurant_name", "Restaurant")
-    })
-    save_json(panier_key, panier)
+    # Un seul restaurant par panier : vérifié dans le script (redis_cart)
+    res = cart.add_line(REDIS, request.user["id"],
+                        request.form.get("id_restaurant"), request.form.get("restaurant_name", "Restaurant"),
+                        request.form["id_plat"], request.form["nom"], request.form["pu"], request.form["qty"])
+    if res == cart.CONFLICT:
+        flash("Vous ne pouvez commander que d'un seul restaurant à la fois. Videz votre panier pour changer de restaurant.")
+        return redirect(request.referrer or url_for("client_restaurants"))
     flash("Plat ajouté au panier.")
     return redirect(request.referrer or url_for("client_restaurants"))
 
@@ -311,13 +365,11 @@ def client_add_line():
 @role_required("CLIENT")
 def client_remove_line():
     """Supprimer un article du panier"""
-    panier_key = f"panier:{request.user['id']}"
-    panier = load_json(panier_key) or []
-
     item_name = request.form.get("item_name")
     if item_name:
-        panier = [item for item in panier if item.get("nom") != item_name]
-        save_json(panier_key, panier)
+        # le front désigne les lignes par leur nom
+        panier = cart.load_cart(REDIS, request.user["id"])
+        cart.remove_lines(REDIS, request.user["id"], [it["id_plat"] for it in panier if it["nom"] == item_name])
         flash(f"Article '{item_name}' supprimé du panier.")
     return redirect(url_for("client_cart"))
 
@@ -325,15 +377,15 @@ def client_remove_line():
 @require_login
 @role_required("CLIENT")
 def client_cart():
-    panier_key = f"panier:{request.user['id']}"
-    panier = load_json(panier_key) or []
+    uid = request.user["id"]
+    panier = cart.load_cart(REDIS, uid)
 
     if request.method == "POST":
         # Possible actions: clear | update | (else -> create order)
         action = (request.form.get("action") or "").strip().lower()
 
         if action == "clear":
-            save_json(panier_key, [])
+            cart.clear_cart(REDIS, uid)
             flash("Panier vidé avec succès", "success")
             return redirect(url_for("client_cart"))
 
@@ -343,30 +395,15 @@ def client_cart():
                 updates = json.loads(cart_data) if cart_data else []
             except Exception:
                 updates = []
-            # Preserve metadata by item name
-            by_name = {str(it.get("nom")): it for it in panier}
-            new_panier = []
+            # Lignes désignées par leur nom ; absentes de la mise à jour = retirées
+            quantities = {it["id_plat"]: 0 for it in panier}
+            by_name = {it["nom"]: it["id_plat"] for it in panier}
             for u in updates:
-                nom = str(u.get("nom"))
-                qty = int(u.get("qty", 0))
-                pu  = float(u.get("pu", 0))
-                if qty <= 0:
-                    continue
-                if nom in by_name:
-                    it = by_name[nom].copy()
-                    it["qty"] = qty
-                    it["pu"]  = pu
-                    new_panier.append(it)
-                else:
-                    new_panier.append({
-                        "id_plat": u.get("id_plat"),
-                        "nom": nom,
-                        "pu": pu,
-                        "qty": qty,
-                        "id_restaurant": (panier[0].get("id_restaurant") if panier else None),
-                        "restaurant_name": (panier[0].get("restaurant_name") if panier else None),
-                    })
-            save_json(panier_key, new_panier)
+                id_plat = by_name.get(str(u.get("nom")))
+                if id_plat:
+                    quantities[id_plat] = int(u.get("qty", 0))
+            if quantities:
+                cart.set_quantities(REDIS, uid, quantities)
             flash("Panier mis à jour avec succès", "success")
             return redirect(url_for("client_cart"))
 
@@ -380,79 +417,52 @@ def client_cart():
             flash("Votre panier est vide.")
             return redirect(url_for("client_cart"))
 
-        # Find restaurant from cart items
-        restaurant_id = None
-        restaurant_name = None
-        for item in panier:
-            if "id_restaurant" in item:
-                restaurant_id = item["id_restaurant"]
-                restaurant_name = item.get("restaurant_name", "Restaurant")
-                break
-
-        if not restaurant_id and panier:
-            # Deduce from menus in Redis if needed
-            for k in REDIS.scan_iter("menu:*"):
-                menu_data = load_json(k)
-                if menu_data and isinstance(menu_data, dict) and "menu" in menu_data:
-                    menu_items = menu_data["menu"]
-                    for menu_item in menu_items:
-                        for panier_item in panier:
-                            if (menu_item.get("id_plat") == panier_item.get("id_plat") or 
-                                menu_item.get("nom") == panier_item.get("nom")):
-                                restaurant_id = menu_data["restaurant"]["id"]
-                                restaurant_name = menu_data["restaurant"]["nom"]
-                                break
-                        if restaurant_id:
-                            break
-                if restaurant_id:
-                    break
+        # Restaurant du panier ; à défaut, index inverse plat -> restaurant (redis_catalog)
+        restaurant_id = panier[0].get("id_restaurant")
+        restaurant_name = panier[0].get("restaurant_name") or "Restaurant"
+        if not restaurant_id:
+            found = dish_restaurants(REDIS, [p["id_plat"] for p in panier if p.get("id_plat")])
+            restaurant_id = next((rid for rid in found.values() if rid), None)
+            if restaurant_id:
+                restaurant_name = REDIS.hget(k_summary(restaurant_id), "nom") or "Restaurant"
 
         if not restaurant_id:
             flash("Impossible de déterminer le restaurant. Veuillez réessayer.")
             return redirect(url_for("client_cart"))
 
         oid = new_order_id()
-        total_front = request.form.get("montant_total_client")
-        if total_front:
-            try:
-                total = float(total_front)
-            except ValueError:
-                total = round(sum(p["pu"] * p["qty"] for p in panier), 2)
-        else:
-            total = round(sum(p["pu"] * p["qty"] for p in panier), 2)
-
-    
-
-        o = {
-            "id": oid,
-            "version": 1,
-            "statut": "CREEE",
-            "timestamps": {"creation": now()},
-            "zone": zone,
-            "livraison": {"adresse": adresse},
-            "client": {"id": request.user["id"], "nom": request.user["nom"] or request.user["username"]},
-            "restaurant": {"id": restaurant_id, "nom": restaurant_name},
-            "livreur_assigne": None,
-            "livreur_assigne_nom": None,
-            "livree_par": None,
-            "remuneration": 0.0,
-            "montant_total_client": total,
-            "lignes": panier,
-            "annule_par": None,
-            "motif_annulation": None,
-            "interets": {},
-            "events": [{
+        frais = zone_fee(zone, (request.form.get("montant_total_client") or "").strip(),
+                         round(sum(p["pu"] * p["qty"] for p in panier), 2))
+
+        def place(pipe, lignes):
+            # lignes relues sous WATCH : le total porte exactement sur le panier consommé, frais de zone inclus
+            fields = {
+                "id_commande": oid,
+                "version": 1,
+                "statut": "CREEE",
+                "date_creation": now(),
+                "zone": zone,
+                "livraison_adresse": adresse,
+                "id_client": uid,
+                "nom_client": request.user["nom"] or request.user["username"],
+                "id_restaurant": lignes[0].get("id_restaurant") or restaurant_id,
+                "nom_restaurant": restaurant_name,
+                "remuneration": 0.0,
+                "montant_total_client": round(sum(p["pu"] * p["qty"] for p in lignes) + frais, 2),
+            }
+            create_order(fields, lignes, {
                 "type": "CREATION",
                 "acteur_role": "CLIENT",
-                "acteur_id": request.user["id"],
+                "acteur_id": uid,
                 "details": f"Commande créée par {request.user['nom'] or request.user['username']}",
                 "ts": now()
-            }]
-        }
-        save_json(k_order(oid), o)
-        save_json(panier_key, [])
-        # Pub/Sub
-        rpub(CHANNEL_ORDER_CREATED, "created", {"id": oid, "zone": zone, "id_client": request.user["id"], "id_restaurant": restaurant_id})
+            }, pipe)
+            return fields
+
+        # commande créée et panier supprimé dans la même transaction
+        if cart.checkout(REDIS, uid, place) is None:
+            flash("Votre panier est vide.")
+            return redirect(url_for("client_cart"))
         flash(f"Commande {oid} créée avec succès.")
         return redirect(url_for("client_orders"))
 
@@ -463,39 +473,18 @@ def client_cart():
 @require_login
 @role_required("CLIENT")
 def client_orders():
-    commandes = []
-    for k in REDIS.scan_iter("order:*"):
-        o = load_json(k)
-        if o and o.get("client", {}).get("id") == request.user["id"]:
-            if "id_commande" not in o and "id" in o:
-                o["id_commande"] = o["id"]
-            if "id_restaurant" not in o and "restaurant" in o:
-                o["id_restaurant"] = o["restaurant"].get("id")
-            commandes.append(o)
-    commandes.sort(key=lambda x: x.get("timestamps", {}).get("creation", 0), reverse=True)
-    return render_template("client/orders.html", commandes=commandes)
+    commandes, next_cursor = page_orders(k_client_orders(request.user["id"]))
+    return render_template("client/orders.html", commandes=commandes, next_cursor=next_cursor)
 
 @app.post("/client/cancel/<string:order_id>")
 @require_login
 @role_required("CLIENT")
 def client_cancel(order_id):
     """Permet au client d'annuler une commande s'il est autorisé."""
-    o = load_json(k_order(order_id))
-    if not o:
-        flash("Commande introuvable.")
-        return redirect(url_for("client_orders"))
-
-    if o.get("client", {}).get("id") != request.user["id"]:
-        flash("Vous ne pouvez pas annuler cette commande.")
-        return redirect(url_for("client_orders"))
-
-    if o.get("statut") in ("CREEE", "ANONCEE"):
-        o["statut"] = "ANNULEE"
-        o["motif_annulation"] = request.form.get("motif", "Annulée par le client")
-        o["timestamps"]["cloture"] = now()
-        o["annule_par"] = "CLIENT"
-        save_json(k_order(order_id), o)
-        rpub(CHANNEL_ORDER_CANCELLED, "cancelled", {"id": order_id, "client": request.user["id"], "motif": o["motif_annulation"]})
+    motif = request.form.get("motif", "Annulée par le client")
+    res = order_state.transition(REDIS, order_id, "annuler_client", request.user["id"], now(), motif,
+                                 details=motif)
+    if res.code == OK:
         flash("Commande annulée avec succès.")
     else:
         flash("Impossible d'annuler cette commande (déjà en cours ou livrée).")
@@ -511,62 +500,22 @@ def client_cancel(order_id):
 def restaurant_dashboard():
     """Tableau de bord du restaurant avec filtre par statut (compatible front SQL)."""
     wanted = (request.args.get("statut") or "").strip()  # ex: 'ANNULEE', 'CREEE', ...
-    commandes = []
-
-    for k in REDIS.scan_iter("order:*"):
-        o = load_json(k)
-        if not o:
-            continue
-
-        # Filtre par restaurant
-        rest_id = (o.get("restaurant") or {}).get("id")
-        if rest_id != request.user["id"]:
-            continue
-
-        # Normalisation -> format attendu par les templates SQL
-        row = {
-            "id_commande": o.get("id") or o.get("id_commande"),
-            "zone": o.get("zone"),
-            "livraison_adresse": (o.get("livraison") or {}).get("adresse"),
-            "montant_total_client": o.get("montant_total_client"),
-            "statut": o.get("statut"),
-            "id_livreur_assigne": (o.get("livreur") or {}).get("id") or o.get("id_livreur_assigne"),
-            "date_creation": (o.get("timestamps") or {}).get("creation") or o.get("date_creation"),
-            # Optionally expose client for list if your template wants it:
-            "id_client": (o.get("client") or {}).get("id"),
-        }
-
-        if wanted and row["statut"] != wanted:
-            continue
-        commandes.append(row)
-
-    commandes.sort(key=lambda x: x.get("date_creation") or 0, reverse=True)
-    return render_template("restaurant/dashboard.html", orders=commandes)
+    commandes, next_cursor = page_orders(k_restaurant_orders(request.user["id"], wanted or None))
+    return render_template("restaurant/dashboard.html", orders=commandes, next_cursor=next_cursor,
+                           compteurs=restaurant_counts(REDIS, request.user["id"]))
 
 @app.route("/restaurant/order/<string:order_id>")
 @require_login
 @role_required("RESTAURANT")
 def restaurant_order_details(order_id):
     """Détails complets d'une commande (vue restaurant)"""
-    o = load_json(k_order(order_id))
+    o = load_order(REDIS, order_id)
     if not o:
         flash("Commande introuvable.")
         return redirect(url_for("restaurant_dashboard"))
 
-    # Normalisation pour compatibilité front
-    if "id_commande" not in o and "id" in o:
-        o["id_commande"] = o["id"]
-    if "livraison_adresse" not in o and "livraison" in o:
-        o["livraison_adresse"] = (o.get("livraison") or {}).get("adresse")
-    if o.get("client"):
-        o["id_client"] = o["client"].get("id")
-        o["nom_client"] = o["client"].get("nom")
-    else:
-        o["id_client"] = None
-        o["nom_client"] = None
-
-    lignes = o.get("lignes", [])
-    interets = load_json(f"interets:{order_id}") or []
+    lignes = load_lignes(REDIS, order_id)
+    interets = load_interets(REDIS, order_id)
 
     # --- Calculs totaux pour affichage identique à app.py ---
     sous_total = 0.0
@@ -600,58 +549,55 @@ def restaurant_order_details(order_id):
 @role_required("RESTAURANT")
 def restaurant_publish(order_id):
     """Publier une commande pour les livreurs"""
-    o = load_json(k_order(order_id))
-    if not o:
+    remuneration = float(request.form.get("remuneration") or 0)
+    res = order_state.transition(REDIS, order_id, "publier", request.user["id"], now(), remuneration,
+                                 version=request.form.get("version"), details=f"Rémunération {remuneration} €")
+    if res.code == NOT_FOUND:
         flash("Commande introuvable.")
         return redirect(url_for("restaurant_dashboard"))
-
-    o["statut"] = "ANONCEE"
-    o["remuneration"] = float(request.form.get("remuneration") or 0)
-    save_json(k_order(order_id), o)
-    rpub(CHANNEL_ORDER_PUBLISHED, "published", {"id": order_id, "zone": o.get("zone"), "remuneration": o["remuneration"]})
-    flash(f"Commande {order_id} publiée avec rémunération {o['remuneration']} €.")
+    if res.code != OK:
+        flash(f"Publication impossible : la commande est {res.statut} (version {res.version}).")
+    else:
+        flash(f"Commande {order_id} publiée avec rémunération {remuneration} €.")
     return redirect(url_for("restaurant_order_details", order_id=order_id))
 
+
 @app.post("/restaurant/order/<string:order_id>/cancel")
 @require_login
 @role_required("RESTAURANT")
 def restaurant_cancel(order_id):
     """Annule une commande"""
-    o = load_json(k_order(order_id))
-    if not o:
+    motif = request.form.get("motif", "Annulation par le restaurant")
+    res = order_state.transition(REDIS, order_id, "annuler_restaurant", request.user["id"], now(), motif,
+                                 version=request.form.get("version"), details=motif)
+    if res.code == NOT_FOUND:
         flash("Commande introuvable.")
-        return redirect(url_for("restaurant_dashboard"))
-
-    o["statut"] = "ANNULEE"
-    o["motif_annulation"] = request.form.get("motif", "Annulation par le restaurant")
-    o["timestamps"] = o.get("timestamps") or {}
-    o["timestamps"]["cloture"] = now()
-    o["annule_par"] = "RESTAURANT"
-    save_json(k_order(order_id), o)
-    rpub(CHANNEL_ORDER_CANCELLED, "cancelled", {"id": order_id, "motif": o["motif_annulation"], "restaurant": request.user["id"]})
-    flash(f"Commande {order_id} annulée.")
+    elif res.code != OK:
+        flash(f"Annulation impossible : la commande est {res.statut} (version {res.version}).")
+    else:
+        flash(f"Commande {order_id} annulée.")
     return redirect(url_for("restaurant_dashboard"))
 
+
 @app.post("/restaurant/order/<string:order_id>/assign")
 @require_login
 @role_required("RESTAURANT")
 def restaurant_assign(order_id):
     """Assigne un livreur à la commande"""
-    o = load_json(k_order(order_id))
-    if not o:
-        flash("Commande introuvable.")
-        return redirect(url_for("restaurant_dashboard"))
-
     livreur_id = request.form.get("livreur_id")
     if not livreur_id:
         flash("Aucun livreur sélectionné.")
         return redirect(url_for("restaurant_order_details", order_id=order_id))
 
-    o["id_livreur_assigne"] = livreur_id
-    o["statut"] = "ASSIGNEE"
-    save_json(k_order(order_id), o)
-    rpub(CHANNEL_ORDER_ASSIGNED, "assigned", {"id": order_id, "livreur": livreur_id})
-    flash(f"Livreur {livreur_id} assigné à la commande {order_id}.")
+    res = order_state.transition(REDIS, order_id, "assigner", request.user["id"], now(), livreur_id,
+                                 version=request.form.get("version"), details=f"Livreur {livreur_id}")
+    if res.code == NOT_FOUND:
+        flash("Commande introuvable.")
+        return redirect(url_for("restaurant_dashboard"))
+    if res.code != OK:
+        flash(f"Assignation impossible : la commande a changé ({res.statut}, version {res.version}).")
+    else:
+        flash(f"Livreur {livreur_id} assigné à la commande {order_id}.")
     return redirect(url_for("restaurant_order_details", order_id=order_id))
 
 
@@ -671,25 +617,15 @@ def livreur_dashboard():
 def livreur_annonces():
     """Affiche les commandes ANONCÉES dans la zone du livreur"""
     zone = request.user.get("zone")
-    annonces = []
-
-    for k in REDIS.scan_iter("order:*"):
-        o = load_json(k)
-        if not o:
-            continue
-        if o.get("statut") == "ANONCEE" and o.get("zone") == zone:
-            # Normalisation pour compatibilité front
-            annonce = {
-                "id_commande": o.get("id") or o.get("id_commande"),
-                "livraison_adresse": (o.get("livraison") or {}).get("adresse"),
-                "remuneration": o.get("remuneration", 0.0),
-                "statut": o.get("statut"),
-                "zone": o.get("zone"),
-            }
-            annonces.append(annonce)
-
-    annonces.sort(key=lambda x: x.get("id_commande", ""), reverse=True)
-    return render_template("livreur/annonces.html", orders=annonces, zone=zone)
+    annonces, next_cursor = page_orders(k_zone_annonces(zone))
+    # intérêt déjà manifesté : un HEXISTS par annonce, dans un seul pipeline
+    pipe = REDIS.pipeline(transaction=False)
+    for o in annonces:
+        pipe.hexists(k_order_interets(o["id_commande"]), request.user["id"])
+    for o, interesse in zip(annonces, pipe.execute()):
+        o["interesse"] = bool(interesse)
+    return render_template("livreur/annonces.html", orders=annonces, zone=zone, next_cursor=next_cursor,
+                           nb_annonces=zone_count(REDIS, zone, "ANONCEE"))
 
 @app.post("/livreur/interet/<string:order_id>")
 @require_login
@@ -698,28 +634,24 @@ def livreur_interet(order_id):
     """Ajoute ou retire l'intérêt d'un livreur pour une commande ANONCÉE"""
     action = request.form.get("action")  # 'ajouter' ou 'retirer'
     livreur_id = request.user["id"]
-    interets_key = f"interets:{order_id}"
-    interets = load_json(interets_key) or []
 
     if action == "ajouter":
-        if any(i["id_livreur"] == livreur_id for i in interets):
+        res = order_state.add_interest(REDIS, order_id, livreur_id, now(),
+                                       request.form.get("temps_estime") or "",
+                                       request.form.get("commentaire") or "")
+        if res.code == OK:
+            flash("Intérêt ajouté.")
+        elif res.code == NOOP:
             flash("Vous avez déjà manifesté votre intérêt.")
         else:
-            interets.append({
-                "id_livreur": livreur_id,
-                "ts": now(),
-                "temps_estime": request.form.get("temps_estime") or "",
-                "commentaire": request.form.get("commentaire") or "",
-            })
-            save_json(interets_key, interets)
-            rpub(CHANNEL_ORDER_UPDATED, "interest_added", {"id": order_id, "livreur": livreur_id})
-            flash("Intérêt ajouté.")
+            flash("Cette commande n'est plus disponible.")
 
     elif action == "retirer":
-        interets = [i for i in interets if i["id_livreur"] != livreur_id]
-        save_json(interets_key, interets)
-        rpub(CHANNEL_ORDER_UPDATED, "interest_removed", {"id": order_id, "livreur": livreur_id})
-        flash("Intérêt retiré.")
+        res = order_state.remove_interest(REDIS, order_id, livreur_id, now())
+        if res.code in (OK, NOOP):
+            flash("Intérêt retiré.")
+        else:
+            flash("Cette commande n'est plus disponible.")
     return redirect(url_for("livreur_annonces"))
 
 @app.route("/livreur/mes_courses")
@@ -727,100 +659,91 @@ def livreur_interet(order_id):
 @role_required("LIVREUR")
 def livreur_mes_courses():
     """Commandes assignées à ce livreur"""
-    livreur_id = request.user["id"]
-    courses = []
-
-    for k in REDIS.scan_iter("order:*"):
-        o = load_json(k)
-        if not o:
-            continue
-        if o.get("id_livreur_assigne") == livreur_id:
-            course = {
-                "id_commande": o.get("id") or o.get("id_commande"),
-                "livraison_adresse": (o.get("livraison") or {}).get("adresse"),
-                "statut": o.get("statut"),
-            }
-            courses.append(course)
-
-    courses.sort(key=lambda x: x.get("id_commande", ""), reverse=True)
-    return render_template("livreur/mes_courses.html", orders=courses)
+    courses, next_cursor = page_orders(k_courier_assigned(request.user["id"]))
+    return render_template("livreur/mes_courses.html", orders=courses, next_cursor=next_cursor)
 
 @app.post("/livreur/demarrer/<string:order_id>")
 @require_login
 @role_required("LIVREUR")
 def livreur_demarrer(order_id):
     """Le livreur commence la livraison"""
-    o = load_json(k_order(order_id))
-    if not o:
+    res = order_state.transition(REDIS, order_id, "demarrer", request.user["id"], now())
+    if res.code == NOT_FOUND:
         flash("Commande introuvable.")
-        return redirect(url_for("livreur_mes_courses"))
-
-    o["statut"] = "EN_LIVRAISON"
-    o.setdefault("timestamps", {})["demarrage"] = now()
-    save_json(k_order(order_id), o)
-    rpub(CHANNEL_ORDER_UPDATED, "delivery_started", {"id": order_id, "livreur": request.user["id"]})
-    flash("Livraison démarrée.")
+    elif res.code != OK:
+        flash(f"Impossible de démarrer : la commande est {res.statut}.")
+    else:
+        flash("Livraison démarrée.")
     return redirect(url_for("livreur_mes_courses"))
 
+
 @app.post("/livreur/terminer/<string:order_id>")
 @require_login
 @role_required("LIVREUR")
 def livreur_terminer(order_id):
     """Le livreur marque la commande comme livrée"""
-    o = load_json(k_order(order_id))
-    if not o:
+    res = order_state.transition(REDIS, order_id, "livrer", request.user["id"], now())
+    if res.code == NOT_FOUND:
         flash("Commande introuvable.")
-        return redirect(url_for("livreur_mes_courses"))
-
-    o["statut"] = "LIVREE"
-    o.setdefault("timestamps", {})["cloture"] = now()
-    o["livree_par_livreur"] = request.user["id"]
-    o["date_cloture"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now()))
-    save_json(k_order(order_id), o)
-    rpub(CHANNEL_ORDER_UPDATED, "delivered", {"id": order_id, "livreur": request.user["id"]})
-    flash("Commande livrée avec succès.")
+    elif res.code != OK:
+        flash(f"Impossible de terminer : la commande est {res.statut}.")
+    else:
+        flash("Commande livrée avec succès.")
     return redirect(url_for("livreur_mes_courses"))
 
+
 @app.route("/livreur/historique")
 @require_login
 @role_required("LIVREUR")
 def livreur_historique():
     """Commandes livrées par ce livreur"""
-    livreur_id = request.user["id"]
-    histo = []
-
-    for k in REDIS.scan_iter("order:*"):
-        o = load_json(k)
-        if not o:
-            continue
-        if o.get("statut") == "LIVREE" and o.get("livree_par_livreur") == livreur_id:
-            histo.append({
-                "id_commande": o.get("id") or o.get("id_commande"),
-                "livraison_adresse": (o.get("livraison") or {}).get("adresse"),
-                "statut": o.get("statut"),
-                "date_cloture": o.get("date_cloture"),
-            })
-
-    histo.sort(key=lambda x: x.get("date_cloture") or "", reverse=True)
-    return render_template("livreur/historique.html", orders=histo)
+    histo, next_cursor = page_orders(k_courier_delivered(request.user["id"]))
+    for o in histo:
+        if o.get("date_cloture"):
+            o["date_cloture"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(o["date_cloture"]))
+    return render_template("livreur/historique.html", orders=histo, next_cursor=next_cursor)
 
 
 # -----------------------------
-# SSE EVENTS — Unified subscriber
+# SSE EVENTS — orders:events
 # -----------------------------
+# Un seul lecteur du stream par processus, diffusé aux clients SSE (common.event_hub)
+EVENT_HUB = EventHub(event_source(REDIS), name="redis-event-hub", id_key=stream_id_key)
+PARTY_FIELDS = ("id_client", "id_restaurant", "id_livreur_assigne")
+
+def order_parties(oid):
+    """Client, restaurant et livreur assigné d'une commande (contrôle de ?order= sur /events)."""
+    values = REDIS.hmget(k_order(oid), PARTY_FIELDS)
+    return dict(zip(PARTY_FIELDS, values)) if any(values) else None
+
 @app.route("/events")
 def events():
-    def stream():
-        for event in rsub("orders.*"):
-            try:
-                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
-            except Exception as e:
-                yield f"data: {json.dumps({'event': 'error', 'payload': str(e), 'ts': int(time.time())})}\n\n"
-    return Response(stream(), mimetype="text/event-stream")
+    """
+    SSE des événements de commande, limités aux portées de l'utilisateur connecté,
+    éventuellement restreintes par ?zone=&restaurant=&client=&livreur=&order= (common.event_scopes).
+    Chaque message porte `id: <id du stream>` : à la reconnexion, le navigateur
+    renvoie Last-Event-ID et rattrape les entrées manquées.
+    """
+    if not request.user:
+        return Response("Connexion requise", status=401)
+    scopes = requested_scopes(request.args, request.user, order_parties)
+    if not scopes:
+        return Response("Portée non autorisée", status=403)
+    sub = EVENT_HUB.subscribe(scopes)
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_id")
+    replay = replay_events(REDIS, last_id) if last_id else ()
+    return Response(EVENT_HUB.stream(sub, replay), mimetype="text/event-stream")
+
+@app.route("/events/metrics")
+def events_metrics():
+    """Clients SSE connectés, événements diffusés / perdus, clients lents coupés."""
+    return EVENT_HUB.stats()
 
 
 # -----------------------------
 # Run
 # -----------------------------
 if __name__ == "__main__":
+    order_state.load_scripts(REDIS)   # SCRIPT LOAD des transitions, appelées ensuite par EVALSHA
+    cart.load_scripts(REDIS)
     app.run(debug=True, port=5001)
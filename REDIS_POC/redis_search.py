@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Recherche de restaurants côté Redis : index inversé des préfixes de tokens.
+
+Clés :
+  search:rest:t:{terme}   ZSET  id_restaurant -> poids du terme pour ce restaurant
+  search:rest:doc:{rid}   SET   termes indexés pour le restaurant (pour désindexer)
+
+Poids : token complet du nom 3, préfixe du nom 1, token complet de la zone 1,
+préfixe de la zone 0.5. Une requête = intersection (ZINTERSTORE, SUM) des ZSET
+de ses tokens, puis ZREVRANGE 0..limit-1 : un seul aller-retour (MULTI).
+"""
+
+import os, sys, uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.search import tokens, prefixes, MAX_PREFIX_LEN, SEARCH_LIMIT
+
+def k_term(term): return f"search:rest:t:{term}"
+def k_doc_terms(rid): return f"search:rest:doc:{rid}"
+
+def term_weights(nom, zone):
+    """terme -> poids (max si le terme apparaît plusieurs fois)."""
+    weights = {}
+    def add(term, w):
+        if w > weights.get(term, 0):
+            weights[term] = w
+    for tok in tokens(nom):
+        for p in prefixes(tok):
+            add(p, 1.0)
+        add(tok[:MAX_PREFIX_LEN], 3.0)
+    for tok in tokens(zone):
+        for p in prefixes(tok):
+            add(p, 0.5)
+        add(tok[:MAX_PREFIX_LEN], 1.0)
+    return weights
+
+def index_restaurant(pipe, restaurant: dict):
+    """Ajoute (ou réindexe) un restaurant ; `pipe` peut être un pipeline ou un client."""
+    rid = restaurant.get("id") or restaurant.get("id_restaurant")
+    weights = term_weights(restaurant.get("nom") or "", restaurant.get("zone") or "")
+    for term, w in weights.items():
+        pipe.zadd(k_term(term), {rid: w})
+    pipe.delete(k_doc_terms(rid))
+    if weights:
+        pipe.sadd(k_doc_terms(rid), *weights.keys())
+
+def unindex_restaurant(r, rid):
+    """Retire un restaurant de l'index (avant renommage / suppression)."""
+    terms = r.smembers(k_doc_terms(rid))
+    pipe = r.pipeline()
+    for term in terms:
+        pipe.zrem(k_term(term), rid)
+    pipe.delete(k_doc_terms(rid))
+    pipe.execute()
+
+def search_restaurants(r, q, limit=SEARCH_LIMIT):
+    """Ids des restaurants correspondant à tous les tokens de q, par pertinence décroissante."""
+    keys = [k_term(t[:MAX_PREFIX_LEN]) for t in tokens(q)]
+    if not keys:
+        return []
+    if len(keys) == 1:
+        return r.zrevrange(keys[0], 0, limit - 1)
+    tmp = f"search:rest:tmp:{uuid.uuid4().hex}"
+    pipe = r.pipeline(transaction=True)
+    pipe.zinterstore(tmp, keys, aggregate="SUM")
+    pipe.zrevrange(tmp, 0, limit - 1)
+    pipe.delete(tmp)
+    _, ids, _ = pipe.execute()
+    return ids
@@ -5,13 +5,24 @@ POC UberEats — Version SQL
 Front partagé : ../frontend/
 """
 
-import os, time, json
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
-import mysql.connector
+import os, sys, time, json, atexit
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, g, Response
 from functools import wraps
 from werkzeug.exceptions import abort
 from decimal import Decimal
 
+import config
+from order_cache import OrderCache
+import order_state
+from event_journal import EventJournal, insert_events
+import event_feed
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.search import tokens, SEARCH_LIMIT
+from common.ids import new_order_id, set_node_allocator
+from common.event_hub import EventHub
+from common.event_scopes import requested_scopes
+
 # -----------------------------
 # Auth decorator
 # -----------------------------
@@ -45,15 +56,257 @@ app.secret_key = "change-me-please"
 # -----------------------------
 # MySQL connection helper
 # -----------------------------
+def get_db():
+    """Connexion du pool attachée à la requête courante (une seule par requête)."""
+    if "db" not in g:
+        g.db = config.acquire()
+    return g.db
+
 def get_cursor():
-    conn = mysql.connector.connect(
-        host="localhost", user="ubereats", password="M13012005i", database="ubereats"
-    )
+    conn = get_db()
     return conn, conn.cursor(dictionary=True)
 
+def commit():
+    """Valide la transaction de la requête puis confie ses événements au journal."""
+    conn = get_db()
+    conn.commit()
+    pending = g.pop("pending_events", None)
+    if pending:
+        overflow = [e for e in pending if not JOURNAL.submit(e)]
+        if overflow:
+            # file du journal pleine : on écrit nous-mêmes (contre-pression)
+            with conn.cursor() as cur:
+                insert_events(cur, overflow)
+            conn.commit()
+
+def rollback():
+    get_db().rollback()
+    g.pop("pending_events", None)
+
+@app.teardown_appcontext
+def release_db(exc):
+    """Rend la connexion au pool : commit si la requête a réussi, rollback sinon."""
+    if exc is None and g.get("pending_events"):
+        commit()
+    conn = g.pop("db", None)
+    if conn is not None:
+        config.release(conn, commit=exc is None)
+
+# -----------------------------
+# Identifiants de commande
+# -----------------------------
+# Nœud des ids de commande (common.ids) : bail sur une ligne de id_node (cf. sql.txt)
+def claim_id_node(owner, ttl):
+    now_ = int(time.time())
+    with config.get_cursor() as (con, cur):
+        # LAST_INSERT_ID(node) : le nœud pris est relu sur la même connexion
+        cur.execute("""
+            UPDATE id_node SET owner=%s, expires=%s, node=LAST_INSERT_ID(node)
+            WHERE expires < %s ORDER BY node LIMIT 1
+        """, (owner, now_ + ttl, now_))
+        if cur.rowcount != 1:
+            return None
+        cur.execute("SELECT LAST_INSERT_ID()")
+        return int(cur.fetchone()[0])
+
+def renew_id_node(node, owner, ttl):
+    with config.get_cursor() as (con, cur):
+        cur.execute("UPDATE id_node SET expires=%s WHERE node=%s AND owner=%s",
+                    (int(time.time()) + ttl, node, owner))
+        return cur.rowcount == 1
+
+set_node_allocator(claim_id_node, renew_id_node)
+
+# -----------------------------
+# Journal des événements (commande_evenement)
+# -----------------------------
+# True : les routes n'écrivent pas le journal elles-mêmes, les événements sont
+# écrits par lots en arrière-plan après le commit de la requête.
+EVENT_JOURNAL_ASYNC = True
+
+JOURNAL = EventJournal(max_queue=10000, batch_size=200, flush_interval_ms=50)
+
+def defer_event(event):
+    g.setdefault("pending_events", []).append(event)
+
+if EVENT_JOURNAL_ASYNC:
+    JOURNAL.start()
+    atexit.register(JOURNAL.stop)
+    order_state.EVENT_SINK = defer_event
+
 def now():
     return int(time.time())
 
+# -----------------------------
+# Pagination par curseur (keyset)
+# -----------------------------
+PAGE_SIZE = 20
+
+def parse_curseur(raw):
+    """'<timestamp>:<id_commande>' -> (timestamp, id_commande), None si absent ou invalide."""
+    if not raw:
+        return None
+    ts, _, oid = raw.partition(":")
+    try:
+        return int(ts), oid
+    except ValueError:
+        return None
+
+def keyset(col, alias="c"):
+    """
+    Filtre 'strictement avant le curseur' + tri + LIMIT pour (col DESC, id_commande DESC).
+    Retourne (sql_where, sql_tail, params) à concaténer à la requête.
+    Avec un index (..., col) l'accès reste un range scan de PAGE_SIZE lignes.
+    """
+    cur = parse_curseur(request.args.get("curseur"))
+    where, params = "", []
+    if cur:
+        where = f" AND ({alias}.{col} < %s OR ({alias}.{col} = %s AND {alias}.id_commande < %s))"
+        params = [cur[0], cur[0], cur[1]]
+    tail = f" ORDER BY {alias}.{col} DESC, {alias}.id_commande DESC LIMIT {PAGE_SIZE + 1}"
+    return where, tail, params
+
+def page(rows, col):
+    """
+    Coupe la ligne sentinelle et calcule le curseur de la page suivante.
+    Colonne NULL : pas de curseur (le keyset ne sait pas repartir d'un NULL,
+    la requête doit donc exclure ces lignes).
+    """
+    if len(rows) <= PAGE_SIZE:
+        return rows, None
+    rows = rows[:PAGE_SIZE]
+    last = rows[-1]
+    if last[col] is None:
+        return rows, None
+    return rows, f"{last[col]}:{last['id_commande']}"
+
+# Commandes clôturées anciennes déplacées dans commande_archive (cf. archive.py)
+CLOSED_STATUTS = ("LIVREE", "ANNULEE")
+LIVE_STATUTS = ("CREEE", "ANONCEE", "ASSIGNEE", "EN_LIVRAISON")
+
+def with_archive(select, where, tail, params, col):
+    """
+    Même liste paginée sur commande et commande_archive (UNION ALL).
+    `select` nomme la table {commande} (alias c). Chaque branche garde son keyset,
+    donc ne lit que PAGE_SIZE+1 lignes via son index ; la fusion en trie au plus le double.
+    """
+    branch = select + where + tail
+    sql = (f"({branch.format(commande='commande')}) UNION ALL "
+           f"({branch.format(commande='commande_archive')}) "
+           f"ORDER BY {col} DESC, id_commande DESC LIMIT {PAGE_SIZE + 1}")
+    return sql, params + params
+
+# -----------------------------
+# Compteurs matérialisés (triggers de sql.txt, réparés par counters.py)
+# -----------------------------
+# Lecture par clé primaire : O(nombre de statuts), indépendant du volume de commandes.
+def restaurant_counts(cur, id_restaurant):
+    """{statut: nb} des commandes vivantes du restaurant."""
+    cur.execute("SELECT statut, nb FROM compteur_restaurant WHERE id_restaurant=%s", (id_restaurant,))
+    return {r["statut"]: r["nb"] for r in cur.fetchall()}
+
+def zone_count(cur, zone, statut):
+    cur.execute("SELECT nb FROM compteur_zone WHERE zone=%s AND statut=%s", (zone, statut))
+    row = cur.fetchone()
+    return row["nb"] if row else 0
+
+# -----------------------------
+# Création de commande (ensembliste)
+# -----------------------------
+def insert_commande(cur, id_commande, id_client, id_restaurant, zone, adresse, montant_total_client, panier):
+    """
+    Crée l'en-tête et toutes les lignes en deux instructions :
+      - l'en-tête porte le sous-total calculé une seule fois ici,
+      - les lignes partent en un seul INSERT multi-lignes (executemany).
+    Aucun trigger AFTER INSERT ne ré-agrège la commande (cf. sql.txt).
+    """
+    lignes = [
+        (id_commande, it.get("id_plat"), int(it["qty"]), Decimal(str(it["pu"])))
+        for it in panier
+    ]
+    sous_total = sum((q * pu for _, _, q, pu in lignes), Decimal("0.00"))
+
+    cur.execute(
+        """
+        INSERT INTO commande(
+          id_commande, id_client, id_restaurant, zone,
+          livraison_adresse, remuneration, statut, date_creation,
+          montant_total_client, sous_total
+        ) VALUES (%s,%s,%s,%s,%s,%s,'CREEE',UNIX_TIMESTAMP(),%s,%s)
+        """,
+        (id_commande, id_client, id_restaurant, zone, adresse, 0.00, montant_total_client, sous_total),
+    )
+    # mysql.connector réécrit executemany(INSERT ... VALUES) en un INSERT multi-lignes
+    cur.executemany(
+        """
+        INSERT INTO commande_ligne (id_commande, id_plat, quantite, prix_unitaire)
+        VALUES (%s,%s,%s,%s)
+        """,
+        lignes,
+    )
+    return sous_total
+
+# -----------------------------
+# Détail de commande (1 aller-retour + cache court)
+# -----------------------------
+# Invalidé après chaque transition (publish/assign/cancel/interet/demarrer/terminer)
+ORDER_CACHE = OrderCache(ttl=2.0)
+
+ORDER_DETAILS_SQL = """
+    SELECT o.*, o.montant_total_client - o.sous_total AS frais_livraison
+    FROM (
+      SELECT c.*,
+        (SELECT JSON_ARRAYAGG(JSON_OBJECT(
+                  'nom', p.nom, 'quantite', cl.quantite, 'prix_unitaire', cl.prix_unitaire))
+           FROM commande_ligne{archive} cl
+           JOIN plat p ON p.id_plat = cl.id_plat
+          WHERE cl.id_commande = c.id_commande) AS lignes_json,
+        (SELECT JSON_ARRAYAGG(JSON_OBJECT(
+                  'id_livreur', i.id_livreur, 'ts', i.ts,
+                  'temps_estime', i.temps_estime, 'commentaire', i.commentaire))
+           FROM interet{archive} i
+          WHERE i.id_commande = c.id_commande) AS interets_json
+      FROM commande{archive} c
+      WHERE c.id_commande = %s
+    ) o
+"""
+
+def load_order_details(order_id):
+    """
+    Commande + lignes + intérêts + sous-total + frais en une seule requête
+    (JSON_ARRAYAGG). Retourne le contexte du template, ou None si introuvable.
+    Une commande absente du live est cherchée dans les tables d'archive.
+    """
+    conn, cur = get_cursor()
+    for archive in ("", "_archive"):
+        cur.execute(ORDER_DETAILS_SQL.format(archive=archive), (order_id,))
+        order = cur.fetchone()
+        if order:
+            break
+    else:
+        return None
+
+    lignes = json.loads(order.pop("lignes_json") or "[]")
+    interets = json.loads(order.pop("interets_json") or "[]")
+    interets.sort(key=lambda i: i.get("ts") or 0, reverse=True)  # JSON_ARRAYAGG ne garantit pas l'ordre
+
+    sous_total = order.get("sous_total")    # maintenu par les triggers de commande_ligne
+    total_client = order.get("montant_total_client")
+    frais_livraison = order.pop("frais_livraison")
+
+    # On passe des strings formatées pour éviter les soucis d'affichage/locale
+    def fmt(x):
+        return f"{x:.2f}" if x is not None else None
+
+    return {
+        "order": order,
+        "lignes": lignes,
+        "interets": interets,
+        "sous_total_str": fmt(sous_total),
+        "frais_livraison_str": fmt(frais_livraison),
+        "total_client_str": fmt(total_client),
+    }
+
 # -----------------------------
 # Auth routes
 # -----------------------------
@@ -85,7 +338,6 @@ def login():
         conn, cur = get_cursor()
         cur.execute(f"SELECT {col_list} FROM {meta['table']} WHERE username=%s AND password=%s", (username, password))
         u = cur.fetchone()
-        conn.close()
 
         if not u:
             flash("Identifiants invalides.")
@@ -118,31 +370,35 @@ def logout():
 @login_required("CLIENT")
 def client_restaurants():
     q = (request.args.get("q") or "").strip()
+    toks = tokens(q)
     conn, cur = get_cursor()
-    try:
-        if q:
-            cur.execute("SELECT * FROM restaurant WHERE nom LIKE %s OR zone LIKE %s", (f"%{q}%", f"%{q}%"))
-        else:
-            cur.execute("SELECT * FROM restaurant")
-        rows = cur.fetchall()
-    finally:
-        conn.close()
+    if toks:
+        # Index FULLTEXT ngram créé sans stopwords (cf. sql.txt) : +tok* = tous les tokens requis, en préfixe ;
+        # collation utf8mb4_unicode_ci => insensible aux accents ; tri par pertinence.
+        against = " ".join(f"+{t}*" for t in toks)
+        cur.execute("""
+            SELECT r.*, MATCH(r.nom, r.zone) AGAINST (%s IN BOOLEAN MODE) AS score
+            FROM restaurant r
+            WHERE MATCH(r.nom, r.zone) AGAINST (%s IN BOOLEAN MODE)
+            ORDER BY score DESC, r.nom
+            LIMIT %s
+        """, (against, against, SEARCH_LIMIT))
+    else:
+        cur.execute("SELECT * FROM restaurant")
+    rows = cur.fetchall()
     return render_template("client/restaurants.html", restaurants=rows)
 
 @app.route("/client/restaurant/<string:restaurant_id>")
 @login_required("CLIENT")
 def client_restaurant_menu(restaurant_id):
     conn, cur = get_cursor()
-    try:
-        cur.execute("SELECT * FROM restaurant WHERE id_restaurant=%s", (restaurant_id,))
-        rest = cur.fetchone()
-        if not rest:
-            flash("Restaurant introuvable.")
-            return redirect(url_for("client_restaurants"))
-        cur.execute("SELECT * FROM plat WHERE id_restaurant=%s AND (disponible=1 OR disponible IS NULL)", (restaurant_id,))
-        menu = cur.fetchall()
-    finally:
-        conn.close()
+    cur.execute("SELECT * FROM restaurant WHERE id_restaurant=%s", (restaurant_id,))
+    rest = cur.fetchone()
+    if not rest:
+        flash("Restaurant introuvable.")
+        return redirect(url_for("client_restaurants"))
+    cur.execute("SELECT * FROM plat WHERE id_restaurant=%s AND (disponible=1 OR disponible IS NULL)", (restaurant_id,))
+    menu = cur.fetchall()
     return render_template("client/restaurant_menu.html", restaurant=rest, menu=menu)
 
 @app.route("/client/add_line", methods=["POST"])
@@ -285,45 +541,23 @@ def client_cart():
         print(f"  - Total client: {montant_total_client} €")
         print(f"  - Articles: {len(panier)}")
 
-        new_id = f"cmd_{int(time.time()) % 100000000:08d}"
+        new_id = new_order_id()
 
         conn, cur = get_cursor()
         try:
-            cur.execute(
-                """
-                INSERT INTO commande(
-                  id_commande, id_client, id_restaurant, zone,
-                  livraison_adresse, remuneration, statut, date_creation, montant_total_client
-                ) VALUES (%s,%s,%s,%s,%s,%s,'CREEE',UNIX_TIMESTAMP(),%s)
-                """,
-                (
-                    new_id,
-                    session["user"]["id"],
-                    id_restaurant,
-                    zone,
-                    adresse,
-                    0.00,
-                    montant_total_client,
-                ),
+            insert_commande(
+                cur, new_id, session["user"]["id"], id_restaurant, zone,
+                adresse, montant_total_client, panier,
             )
-
-            for it in panier:
-                cur.execute(
-                    """
-                    INSERT INTO commande_ligne (id_commande, id_plat, quantite, prix_unitaire)
-                    VALUES (%s,%s,%s,%s)
-                    """,
-                    (new_id, it.get("id_plat"), int(it["qty"]), float(it["pu"]))
-                )
-
-            conn.commit()
+            order_state.log_event(cur, new_id, "CLIENT", session["user"]["id"], "CREATION",
+                                  f"Commande créée par {session['user'].get('nom') or session['user']['username']}")
+            commit()
             print(f"✅ Commande {new_id} créée avec total: {montant_total_client} €")
         except Exception as e:
+            rollback()
             print(f"❌ Erreur création commande: {str(e)}")
             flash(f"Erreur lors de la création de la commande: {str(e)}", "error")
             return redirect(url_for("client_cart"))
-        finally:
-            conn.close()
 
         session["panier"] = []
         flash(f"Commande {new_id} créée avec succès pour {montant_total_client} €.")
@@ -359,33 +593,23 @@ def client_remove_line():
 @login_required("CLIENT")
 def client_orders():
     conn, cur = get_cursor()
-    cur.execute("SELECT * FROM commande WHERE id_client=%s ORDER BY date_creation DESC", (session["user"]["id"],))
-    rows = cur.fetchall()
-    conn.close()
-    return render_template("client/orders.html", commandes=rows)
+    where, tail, params = keyset("date_creation")
+    cur.execute(*with_archive("SELECT c.* FROM {commande} c WHERE c.id_client=%s", where, tail,
+                              [session["user"]["id"]] + params, "date_creation"))
+    rows, next_cursor = page(cur.fetchall(), "date_creation")
+    return render_template("client/orders.html", commandes=rows, next_cursor=next_cursor)
 
 @app.route("/client/cancel/<string:order_id>", methods=["POST"])
 @login_required("CLIENT")
 def client_cancel(order_id):
     motif = request.form.get("motif") or "Annulation par le client"
     conn, cur = get_cursor()
-    try:
-        cur.execute("SELECT statut FROM commande WHERE id_commande=%s AND id_client=%s", (order_id, session["user"]["id"]))
-        cmd = cur.fetchone()
-        if not cmd:
-            flash("Commande introuvable ou non autorisée.")
-        elif cmd["statut"] in ("CREEE", "ANONCEE"):
-            cur.execute("""
-                UPDATE commande SET statut='ANNULEE', annule_par='CLIENT',
-                    motif_annulation=%s, date_cloture=UNIX_TIMESTAMP()
-                WHERE id_commande=%s
-            """, (motif, order_id))
-            conn.commit()
-            flash("Commande annulée.")
-        else:
-            flash("Impossible d’annuler cette commande.")
-    finally:
-        conn.close()
+    if order_state.transition(cur, order_id, "annuler_client", session["user"]["id"], motif, details=motif):
+        commit()
+        ORDER_CACHE.invalidate(order_id)
+        flash("Commande annulée.")
+    else:
+        flash("Impossible d’annuler cette commande.")
     return redirect(url_for("client_orders"))
 
 # -----------------------------
@@ -396,68 +620,33 @@ def client_cancel(order_id):
 def restaurant_dashboard():
     statut = request.args.get("statut", "").strip()
     conn, cur = get_cursor()
-    try:
-        if statut:
-            cur.execute("SELECT * FROM commande WHERE id_restaurant=%s AND statut=%s ORDER BY date_creation DESC",
-                        (session["user"]["id"], statut))
-        else:
-            cur.execute("SELECT * FROM commande WHERE id_restaurant=%s ORDER BY date_creation DESC",
-                        (session["user"]["id"],))
-        rows = cur.fetchall()
-    finally:
-        conn.close()
-    return render_template("restaurant/dashboard.html", orders=rows)
+    where, tail, params = keyset("date_creation")
+    if statut and statut not in CLOSED_STATUTS:
+        # statuts vivants : jamais archivés
+        cur.execute("SELECT c.* FROM commande c WHERE c.id_restaurant=%s AND c.statut=%s" + where + tail,
+                    [session["user"]["id"], statut] + params)
+    elif statut:
+        cur.execute(*with_archive("SELECT c.* FROM {commande} c WHERE c.id_restaurant=%s AND c.statut=%s",
+                                  where, tail, [session["user"]["id"], statut] + params, "date_creation"))
+    else:
+        cur.execute(*with_archive("SELECT c.* FROM {commande} c WHERE c.id_restaurant=%s", where, tail,
+                                  [session["user"]["id"]] + params, "date_creation"))
+    rows, next_cursor = page(cur.fetchall(), "date_creation")
+    return render_template("restaurant/dashboard.html", orders=rows, next_cursor=next_cursor,
+                           compteurs=restaurant_counts(cur, session["user"]["id"]))
 
 @app.route("/restaurant/order/<string:order_id>")
 @login_required("RESTAURANT")
 def restaurant_order_details(order_id):
-    conn, cur = get_cursor()
-    try:
-        cur.execute("SELECT * FROM commande WHERE id_commande=%s", (order_id,))
-        order = cur.fetchone()
-        if not order:
+    details = ORDER_CACHE.get(order_id)
+    if details is None:
+        gen = ORDER_CACHE.generation(order_id)
+        details = load_order_details(order_id)
+        if details is None:
             flash("Commande introuvable.")
             return redirect(url_for("restaurant_dashboard"))
-
-        cur.execute("""
-            SELECT p.nom, cl.quantite, cl.prix_unitaire
-            FROM commande_ligne cl
-            JOIN plat p ON p.id_plat = cl.id_plat
-            WHERE cl.id_commande=%s
-        """, (order_id,))
-        lignes = cur.fetchall()
-
-        cur.execute("SELECT * FROM interet WHERE id_commande=%s ORDER BY ts DESC", (order_id,))
-        interets = cur.fetchall()
-
-        # --- Calculs côté serveur (fiables) ---
-        # attention: quantite est int, prix_unitaire souvent Decimal -> normaliser en Decimal
-        sous_total = Decimal("0.00")
-        for l in lignes:
-            q = int(l["quantite"])
-            pu = Decimal(str(l["prix_unitaire"]))
-            sous_total += pu * q
-
-        mtc = order.get("montant_total_client")
-        total_client = Decimal(str(mtc)) if mtc is not None else None
-        frais_livraison = (total_client - sous_total) if total_client is not None else None
-
-    finally:
-        conn.close()
-
-    # On passe des strings formatées pour éviter les soucis d'affichage/locale
-    def fmt(x):
-        return f"{x:.2f}" if x is not None else None
-
-    return render_template(
-        "restaurant/order_details.html",
-        order=order,
-        lignes=lignes,
-        interets=interets,
-        sous_total_str=fmt(sous_total),
-        frais_livraison_str=fmt(frais_livraison),
-        total_client_str=fmt(total_client),
-    )
+        ORDER_CACHE.put(order_id, details, gen)
+    return render_template("restaurant/order_details.html", **details)
     
 @app.route("/restaurant/order/<string:order_id>/publish", methods=["POST"])
 @login_required("RESTAURANT")
@@ -467,13 +656,13 @@ def restaurant_publish(order_id):
         flash("Rémunération requise.")
         return redirect(url_for("restaurant_order_details", order_id=order_id))
     conn, cur = get_cursor()
-    try:
-        cur.execute("UPDATE commande SET remuneration=%s, statut='ANONCEE', date_publiee=UNIX_TIMESTAMP() WHERE id_commande=%s",
-                    (remuneration, order_id))
-        conn.commit()
-    finally:
-        conn.close()
-    flash("Commande publiée.")
+    if order_state.transition(cur, order_id, "publier", session["user"]["id"], remuneration,
+                              details=f"Rémunération {remuneration} €"):
+        commit()
+        ORDER_CACHE.invalidate(order_id)
+        flash("Commande publiée.")
+    else:
+        flash("Impossible de publier cette commande.")
     return redirect(url_for("restaurant_order_details", order_id=order_id))
 
 @app.route("/restaurant/order/<string:order_id>/assign", methods=["POST"])
@@ -484,13 +673,13 @@ def restaurant_assign(order_id):
         flash("Aucun livreur sélectionné.")
         return redirect(url_for("restaurant_order_details", order_id=order_id))
     conn, cur = get_cursor()
-    try:
-        cur.execute("UPDATE commande SET id_livreur_assigne=%s, statut='ASSIGNEE', date_assignee=UNIX_TIMESTAMP() WHERE id_commande=%s",
-                    (livreur_id, order_id))
-        conn.commit()
-    finally:
-        conn.close()
-    flash("Livreur assigné.")
+    if order_state.transition(cur, order_id, "assigner", session["user"]["id"], livreur_id,
+                              details=f"Livreur {livreur_id}"):
+        commit()
+        ORDER_CACHE.invalidate(order_id)
+        flash("Livreur assigné.")
+    else:
+        flash("Impossible d’assigner un livreur à cette commande.")
     return redirect(url_for("restaurant_order_details", order_id=order_id))
 
 @app.route("/restaurant/order/<string:order_id>/cancel", methods=["POST"])
@@ -498,16 +687,12 @@ def restaurant_assign(order_id):
 def restaurant_cancel(order_id):
     motif = request.form.get("motif") or "Annulation par le restaurant"
     conn, cur = get_cursor()
-    try:
-        cur.execute("""
-            UPDATE commande SET statut='ANNULEE', annule_par='RESTAURANT',
-                motif_annulation=%s, date_cloture=UNIX_TIMESTAMP()
-            WHERE id_commande=%s
-        """, (motif, order_id))
-        conn.commit()
-    finally:
-        conn.close()
-    flash("Commande annulée.")
+    if order_state.transition(cur, order_id, "annuler_restaurant", session["user"]["id"], motif, details=motif):
+        commit()
+        ORDER_CACHE.invalidate(order_id)
+        flash("Commande annulée.")
+    else:
+        flash("Impossible d’annuler cette commande.")
     return redirect(url_for("restaurant_dashboard"))
 
 # -----------------------------
@@ -522,93 +707,91 @@ def livreur_dashboard():
 @login_required("LIVREUR")
 def livreur_annonces():
     conn, cur = get_cursor()
+    where, tail, params = keyset("date_creation")
+    # interesse : EXISTS sur le préfixe (id_commande, id_livreur) de la clé primaire d'interet
+    # (plusieurs lignes possibles par livreur : une jointure dupliquerait la commande)
     cur.execute("""
-        SELECT c.*, r.nom AS restaurant_nom
+        SELECT c.*, r.nom AS restaurant_nom,
+               EXISTS(SELECT 1 FROM interet i
+                      WHERE i.id_commande=c.id_commande AND i.id_livreur=%s) AS interesse
         FROM commande c
         JOIN restaurant r ON r.id_restaurant=c.id_restaurant
         WHERE c.zone=%s AND c.statut='ANONCEE'
-        ORDER BY c.date_creation DESC
-    """, (session["user"]["zone"],))
-    rows = cur.fetchall()
-    conn.close()
-    return render_template("livreur/annonces.html", orders=rows, zone=session["user"]["zone"])
+    """ + where + tail, [session["user"]["id"], session["user"]["zone"]] + params)
+    rows, next_cursor = page(cur.fetchall(), "date_creation")
+    return render_template("livreur/annonces.html", orders=rows, zone=session["user"]["zone"], next_cursor=next_cursor,
+                           nb_annonces=zone_count(cur, session["user"]["zone"], "ANONCEE"))
 
 @app.route("/livreur/accepter/<string:order_id>", methods=["POST"])
 @login_required("LIVREUR")
 def livreur_accepter(order_id):
-    conn, cur = get_cursor()
+    temps_estime = (request.form.get("temps_estime") or "").strip()
     try:
-        cur.execute("SELECT * FROM interet WHERE id_commande=%s AND id_livreur=%s", (order_id, session["user"]["id"]))
-        if cur.fetchone():
-            flash("Vous avez déjà accepté cette course.")
-        else:
-            cur.execute("""
-                INSERT INTO interet (id_commande, id_livreur, ts, temps_estime, commentaire)
-                VALUES (%s, %s, UNIX_TIMESTAMP(), %s, %s)
-            """, (order_id, session["user"]["id"], request.form.get("temps_estime"), request.form.get("commentaire")))
-            conn.commit()
-            flash("Course acceptée.")
-    finally:
-        conn.close()
+        temps_estime = int(temps_estime) if temps_estime else None
+    except ValueError:
+        flash("Temps estimé invalide (nombre de minutes attendu).")
+        return redirect(url_for("livreur_annonces"))
+    conn, cur = get_cursor()
+    if order_state.add_interest(cur, order_id, session["user"]["id"],
+                                temps_estime, request.form.get("commentaire")):
+        commit()
+        ORDER_CACHE.invalidate(order_id)
+        flash("Course acceptée.")
+    else:
+        flash("Vous avez déjà accepté cette course, ou elle n’est plus disponible.")
     return redirect(url_for("livreur_annonces"))
 
 @app.route("/livreur/demarrer/<string:order_id>", methods=["POST"])
 @login_required("LIVREUR")
 def livreur_demarrer(order_id):
     conn, cur = get_cursor()
-    try:
-        cur.execute("UPDATE commande SET statut='EN_LIVRAISON', date_assignee=UNIX_TIMESTAMP() WHERE id_commande=%s AND id_livreur_assigne=%s",
-                    (order_id, session["user"]["id"]))
-        conn.commit()
+    if order_state.transition(cur, order_id, "demarrer", session["user"]["id"]):
+        commit()
+        ORDER_CACHE.invalidate(order_id)
         flash("Livraison démarrée.")
-    finally:
-        conn.close()
+    else:
+        flash("Impossible de démarrer cette livraison.")
     return redirect(url_for("livreur_mes_courses"))
 
 @app.route("/livreur/terminer/<string:order_id>", methods=["POST"])
 @login_required("LIVREUR")
 def livreur_terminer(order_id):
     conn, cur = get_cursor()
-    try:
-        cur.execute("""
-            UPDATE commande SET statut='LIVREE', date_cloture=UNIX_TIMESTAMP(), livree_par_livreur=%s
-            WHERE id_commande=%s AND id_livreur_assigne=%s
-        """, (session["user"]["id"], order_id, session["user"]["id"]))
-        conn.commit()
+    if order_state.transition(cur, order_id, "livrer", session["user"]["id"], session["user"]["id"]):
+        commit()
+        ORDER_CACHE.invalidate(order_id)
         flash("Commande livrée.")
-    finally:
-        conn.close()
+    else:
+        flash("Impossible de terminer cette livraison.")
     return redirect(url_for("livreur_mes_courses"))
 
 @app.route("/livreur/mes_courses")
 @login_required("LIVREUR")
 def livreur_mes_courses():
     conn, cur = get_cursor()
+    where, tail, params = keyset("date_creation")
     cur.execute("""
         SELECT c.*, r.nom AS restaurant_nom
         FROM commande c
         JOIN restaurant r ON r.id_restaurant=c.id_restaurant
         WHERE c.id_livreur_assigne=%s
-        ORDER BY c.date_creation DESC
-    """, (session["user"]["id"],))
-    rows = cur.fetchall()
-    conn.close()
-    return render_template("livreur/mes_courses.html", orders=rows)
+    """ + where + tail, [session["user"]["id"]] + params)
+    rows, next_cursor = page(cur.fetchall(), "date_creation")
+    return render_template("livreur/mes_courses.html", orders=rows, next_cursor=next_cursor)
 
 @app.route("/livreur/historique")
 @login_required("LIVREUR")
 def livreur_historique():
     conn, cur = get_cursor()
-    cur.execute("""
+    where, tail, params = keyset("date_cloture")
+    cur.execute(*with_archive("""
         SELECT c.*, r.nom AS restaurant_nom
-        FROM commande c
+        FROM {commande} c
         JOIN restaurant r ON r.id_restaurant=c.id_restaurant
-        WHERE c.livree_par_livreur=%s
-        ORDER BY c.date_cloture DESC
-    """, (session["user"]["id"],))
-    rows = cur.fetchall()
-    conn.close()
-    return render_template("livreur/historique.html", orders=rows)
+        WHERE c.livree_par_livreur=%s AND c.date_cloture IS NOT NULL
+    """, where, tail, [session["user"]["id"]] + params, "date_cloture"))
+    rows, next_cursor = page(cur.fetchall(), "date_cloture")
+    return render_template("livreur/historique.html", orders=rows, next_cursor=next_cursor)
 
 @app.post("/livreur/interet/<string:order_id>")
 @login_required("LIVREUR")
@@ -617,7 +800,15 @@ def livreur_interet(order_id):
     if action == "ajouter":
         # Reuse existing accepter logic
         return livreur_accepter(order_id)
-    # optional: support "retirer" by deleting from `interet` table
+    if action == "retirer":
+        conn, cur = get_cursor()
+        if order_state.remove_interest(cur, order_id, session["user"]["id"]):
+            commit()
+            ORDER_CACHE.invalidate(order_id)
+            flash("Intérêt retiré.")
+        else:
+            flash("Aucun intérêt à retirer pour cette commande.")
+        return redirect(url_for("livreur_annonces"))
     flash("Opération non supportée.", "warning")
     return redirect(url_for("livreur_annonces"))
 
@@ -631,7 +822,9 @@ def order_json(oid):
     conn, cur = get_cursor()
     cur.execute("SELECT * FROM commande WHERE id_commande=%s", (oid,))
     o = cur.fetchone()
-    conn.close()
+    if not o:
+        cur.execute("SELECT * FROM commande_archive WHERE id_commande=%s", (oid,))
+        o = cur.fetchone()
     if not o:
         return jsonify({"error": "Commande introuvable"}), 404
     return jsonify(o)
@@ -641,6 +834,55 @@ def order_json(oid):
 def order_json_alias(oid):
     return order_json(oid)  # same payload as /json
 
+# -----------------------------
+# SSE EVENTS — commande_evenement
+# -----------------------------
+# Un seul lecteur de commande_evenement par processus, diffusé aux clients SSE (common.event_hub)
+EVENT_HUB = EventHub(event_feed.event_source(), name="sql-event-hub", id_key=event_feed.event_id_key)
+
+def order_parties(oid):
+    """Client, restaurant et livreur assigné d'une commande (contrôle de ?order= sur /events)."""
+    conn, cur = get_cursor()
+    cur.execute("SELECT id_client, id_restaurant, id_livreur_assigne FROM commande WHERE id_commande=%s", (oid,))
+    return cur.fetchone()
+
+@app.route("/events")
+def events():
+    """
+    SSE des événements de commande, limités aux portées de l'utilisateur connecté,
+    éventuellement restreintes par ?zone=&restaurant=&client=&livreur=&order= (common.event_scopes).
+    Un seul lecteur de commande_evenement par processus (event_feed), diffusé par EVENT_HUB.
+    Last-Event-ID (ou ?last_id=) = id commande_evenement à partir duquel rejouer.
+    """
+    user = session.get("user")
+    if not user:
+        return Response("Connexion requise", status=401)
+    scopes = requested_scopes(request.args, user, order_parties)
+    if not scopes:
+        return Response("Portée non autorisée", status=403)
+    sub = EVENT_HUB.subscribe(scopes)
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_id")
+    replay = event_feed.replay_events(last_id, scopes, EVENT_HUB.last_id) if last_id else ()
+    return Response(EVENT_HUB.stream(sub, replay), mimetype="text/event-stream")
+
+@app.route("/events/metrics")
+def events_metrics():
+    """Clients SSE connectés, événements diffusés / perdus, clients coupés."""
+    return jsonify(EVENT_HUB.stats())
+
+@app.route("/metrics/db")
+def metrics_db():
+    """Compteurs du pool MySQL (emprunts, attente, pool épuisé, reconnexions)."""
+    return jsonify(config.pool_stats())
+
+@app.route("/metrics")
+def metrics():
+    return jsonify({
+        "db_pool": config.pool_stats(),
+        "order_cache": ORDER_CACHE.stats(),
+        "event_journal": JOURNAL.stats(),
+    })
+
 
 # -----------------------------
 # Run
@@ -0,0 +1,79 @@
+# archive.py
+# Archivage des commandes clôturées (LIVREE / ANNULEE) hors de la table chaude `commande`.
+#
+#   python archive.py                       # commandes clôturées depuis plus de 30 jours
+#   python archive.py --jours 7 --lot 200 --pause 0.5
+#   python archive.py --dry-run             # compte seulement
+#
+# Chaque lot est une transaction courte :
+#   1. SELECT ... FOR UPDATE des id_commande clôturés avant la date limite
+#      (range scan sur idx_cmd_statut_cloture, du plus ancien au plus récent) ;
+#   2. INSERT ... SELECT vers commande_archive, commande_ligne_archive,
+#      interet_archive et commande_evenement_archive ;
+#   3. DELETE FROM commande : ON DELETE CASCADE supprime lignes, intérêts et
+#      événements (les suppressions en cascade ne déclenchent pas trg_ligne_ad).
+# Une pause entre deux lots laisse passer le trafic des dashboards.
+
+import time, argparse
+
+import config
+
+ARCHIVE_CONFIG = {
+    "age_jours": 30,      # âge minimal (depuis date_cloture) avant archivage
+    "lot": 500,           # commandes par transaction
+    "pause": 0.2,         # s entre deux lots
+}
+
+CLOSED_STATUTS = ("LIVREE", "ANNULEE")
+CHILD_TABLES = ("commande_ligne", "interet", "commande_evenement")
+
+def select_batch(cur, statut, cutoff, limit, lock=True):
+    cur.execute(
+        "SELECT id_commande FROM commande "
+        "WHERE statut=%s AND date_cloture < %s "
+        "ORDER BY date_cloture LIMIT %s" + (" FOR UPDATE" if lock else ""),
+        (statut, cutoff, limit),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+def archive_batch(cur, ids):
+    """Copie les commandes `ids` et leurs lignes filles en archive puis les retire du live."""
+    marks = ", ".join(["%s"] * len(ids))
+    cur.execute(f"INSERT INTO commande_archive SELECT * FROM commande WHERE id_commande IN ({marks})", ids)
+    for table in CHILD_TABLES:
+        cur.execute(f"INSERT INTO {table}_archive SELECT * FROM {table} WHERE id_commande IN ({marks})", ids)
+    cur.execute(f"DELETE FROM commande WHERE id_commande IN ({marks})", ids)
+    return cur.rowcount
+
+def archive(age_jours, lot, pause, dry_run=False):
+    cutoff = int(time.time()) - age_jours * 86400
+    total = 0
+    for statut in CLOSED_STATUTS:
+        while True:
+            start = time.monotonic()
+            with config.get_cursor() as (con, cur):
+                ids = select_batch(cur, statut, cutoff, lot, lock=not dry_run)
+                if ids and not dry_run:
+                    archive_batch(cur, ids)
+            if not ids:
+                break
+            total += len(ids)
+            ms = (time.monotonic() - start) * 1000
+            print(f"📦 {statut}: {len(ids)} commandes {'à archiver' if dry_run else 'archivées'} ({ms:.0f} ms)")
+            if dry_run or len(ids) < lot:
+                break
+            time.sleep(pause)
+    print(f"✅ Archivage terminé : {total} commandes ({'dry-run' if dry_run else 'déplacées'})")
+    return total
+
+def main():
+    ap = argparse.ArgumentParser(description="Déplace les commandes clôturées anciennes vers les tables *_archive.")
+    ap.add_argument("--jours", type=int, default=ARCHIVE_CONFIG["age_jours"], help="Âge minimal depuis la clôture")
+    ap.add_argument("--lot", type=int, default=ARCHIVE_CONFIG["lot"], help="Commandes par transaction")
+    ap.add_argument("--pause", type=float, default=ARCHIVE_CONFIG["pause"], help="Secondes entre deux lots")
+    ap.add_argument("--dry-run", action="store_true", help="Compte le premier lot sans rien déplacer")
+    args = ap.parse_args()
+    archive(args.jours, args.lot, args.pause, dry_run=args.dry_run)
+
+if __name__ == "__main__":
+    main()
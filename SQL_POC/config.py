@@ -1,7 +1,10 @@
 # config.py
 # Connexion MySQL SANS .env
 
+import time, threading
 import mysql.connector
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
 from contextlib import contextmanager
 
 # >>> Modifie ici tes identifiants si besoin <<<
@@ -14,6 +17,121 @@ DB_CONFIG = {
     "autocommit": False,
 }
 
+# >>> Pool de connexions (partagé par tous les threads Flask) <<<
+POOL_CONFIG = {
+    "pool_name": "ubereats",
+    "pool_size": 10,               # max 32 (limite mysql.connector)
+    "acquire_timeout": 2.0,        # s d'attente max quand le pool est vide
+    "retry_delay": 0.01,           # s entre deux tentatives d'emprunt
+    "health_check_interval": 30,   # s d'inactivité avant un ping de contrôle
+    "reconnect_attempts": 3,
+    "reconnect_delay": 0.2,
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+_last_check = {}                   # id(connexion physique) -> dernier usage
+_stats_lock = threading.Lock()
+_stats = {
+    "acquired": 0,                 # emprunts réussis
+    "released": 0,
+    "in_use": 0,
+    "peak_in_use": 0,
+    "exhausted": 0,                # emprunts ayant trouvé le pool vide
+    "timeouts": 0,                 # emprunts abandonnés après acquire_timeout
+    "health_checks": 0,
+    "reconnects": 0,
+    "wait_ms_total": 0.0,
+    "wait_ms_max": 0.0,
+}
+
+def _bump(**deltas):
+    with _stats_lock:
+        for k, v in deltas.items():
+            _stats[k] += v
+        _stats["peak_in_use"] = max(_stats["peak_in_use"], _stats["in_use"])
+
+def get_pool():
+    """Crée le pool à la première utilisation (lazy, thread-safe)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pooling.MySQLConnectionPool(
+                    pool_name=POOL_CONFIG["pool_name"],
+                    pool_size=POOL_CONFIG["pool_size"],
+                    pool_reset_session=True,
+                    **DB_CONFIG,
+                )
+    return _pool
+
+def _health_check(con):
+    """Ping (avec reconnexion) seulement si la connexion est restée inactive."""
+    key = id(getattr(con, "_cnx", con))
+    last = _last_check.get(key, 0.0)
+    if time.monotonic() - last < POOL_CONFIG["health_check_interval"]:
+        return
+    _bump(health_checks=1)
+    try:
+        con.ping(reconnect=False)
+    except mysql.connector.Error:
+        _bump(reconnects=1)
+        con.reconnect(attempts=POOL_CONFIG["reconnect_attempts"], delay=POOL_CONFIG["reconnect_delay"])
+    _last_check[key] = time.monotonic()
+
+def acquire():
+    """
+    Emprunte une connexion au pool.
+    Attend au plus POOL_CONFIG["acquire_timeout"] secondes si le pool est vide,
+    puis lève PoolError.
+    """
+    pool = get_pool()
+    start = time.monotonic()
+    deadline = start + POOL_CONFIG["acquire_timeout"]
+    exhausted = False
+    while True:
+        try:
+            con = pool.get_connection()
+            break
+        except PoolError:
+            if not exhausted:
+                exhausted = True
+                _bump(exhausted=1)
+            if time.monotonic() >= deadline:
+                _bump(timeouts=1)
+                raise
+            time.sleep(POOL_CONFIG["retry_delay"])
+    waited_ms = (time.monotonic() - start) * 1000
+    with _stats_lock:
+        _stats["wait_ms_max"] = max(_stats["wait_ms_max"], waited_ms)
+    _bump(acquired=1, in_use=1, wait_ms_total=waited_ms)
+    try:
+        _health_check(con)
+    except Exception:
+        release(con)
+        raise
+    return con
+
+def release(con, commit: bool = False):
+    """Commit (ou rollback) puis rend la connexion au pool."""
+    try:
+        if commit:
+            con.commit()
+        else:
+            con.rollback()
+    finally:
+        _last_check[id(getattr(con, "_cnx", con))] = time.monotonic()
+        con.close()  # PooledMySQLConnection.close() -> retour au pool
+        _bump(released=1, in_use=-1)
+
+def pool_stats():
+    """Instantané des compteurs du pool (pour /metrics)."""
+    with _stats_lock:
+        out = dict(_stats)
+    out["pool_size"] = POOL_CONFIG["pool_size"]
+    out["wait_ms_avg"] = round(out["wait_ms_total"] / out["acquired"], 3) if out["acquired"] else 0.0
+    return out
+
 def connect():
     """Retourne une connexion mysql.connector."""
     return mysql.connector.connect(**DB_CONFIG)
@@ -25,16 +143,14 @@ def get_cursor(dictionary: bool = False):
       with get_cursor(dictionary=True) as (con, cur):
           cur.execute("SELECT ...")
           rows = cur.fetchall()
-    Commit auto si OK, rollback sinon.
+    Commit auto si OK, rollback sinon. La connexion vient du pool.
     """
-    con = connect()
+    con = acquire()
     cur = con.cursor(dictionary=dictionary)
+    ok = False
     try:
         yield con, cur
-        con.commit()
-    except Exception:
-        con.rollback()
-        raise
+        ok = True
     finally:
         cur.close()
-        con.close()
+        release(con, commit=ok)
@@ -0,0 +1,85 @@
+# counters.py
+# Réconciliation des compteurs matérialisés compteur_restaurant / compteur_zone.
+#
+#   python counters.py                 # un passage
+#   python counters.py --loop 300      # toutes les 5 minutes
+#
+# Les triggers de sql.txt maintiennent les compteurs en delta ; ce job recalcule
+# les valeurs attendues (GROUP BY sur commande) et répare la dérive éventuelle
+# (données importées sans triggers, correction manuelle, ...).
+#
+# 1. Détection : lecture cohérente (sans verrou) des écarts compteur <> COUNT(*).
+# 2. Réparation, clé par clé, en transaction courte : recomptage en lecture
+#    verrouillante (FOR SHARE pose des next-key locks sur la plage (clé, statut)
+#    des index idx_cmd_rest_statut_date / idx_cmd_zone_statut_date), puis écriture.
+#    Une transition concurrente attend donc la fin de la réparation et applique
+#    son delta par-dessus : aucune mise à jour perdue.
+
+import time, argparse
+
+import config
+
+# table de compteurs -> colonne de regroupement dans commande
+COUNTERS = {
+    "compteur_restaurant": "id_restaurant",
+    "compteur_zone": "zone",
+}
+
+def find_drift(cur, table, key):
+    """[(clé, statut, stocké, attendu)] des compteurs faux ou manquants."""
+    cur.execute(f"""
+        SELECT t.k, t.statut, COALESCE(x.nb, 0), t.attendu
+        FROM (
+          SELECT {key} AS k, statut, COUNT(*) AS attendu
+          FROM commande WHERE {key} IS NOT NULL
+          GROUP BY {key}, statut
+        ) t
+        LEFT JOIN {table} x ON x.{key} = t.k AND x.statut = t.statut
+        WHERE x.nb IS NULL OR x.nb <> t.attendu
+        UNION ALL
+        SELECT x.{key}, x.statut, x.nb, 0
+        FROM {table} x
+        WHERE x.nb <> 0
+          AND NOT EXISTS (SELECT 1 FROM commande c WHERE c.{key} = x.{key} AND c.statut = x.statut)
+    """)
+    return cur.fetchall()
+
+def repair(cur, table, key, k, statut):
+    """Recompte (k, statut) sous verrou et réécrit le compteur. Retourne la valeur écrite."""
+    cur.execute(
+        f"SELECT COUNT(*) FROM commande WHERE {key}=%s AND statut=%s FOR SHARE",
+        (k, statut),
+    )
+    (nb,) = cur.fetchone()
+    cur.execute(
+        f"INSERT INTO {table} ({key}, statut, nb) VALUES (%s, %s, %s) "
+        f"ON DUPLICATE KEY UPDATE nb = VALUES(nb)",
+        (k, statut, nb),
+    )
+    return nb
+
+def reconcile():
+    repaired = 0
+    for table, key in COUNTERS.items():
+        with config.get_cursor() as (con, cur):
+            drift = find_drift(cur, table, key)
+        for k, statut, stocke, attendu in drift:
+            with config.get_cursor() as (con, cur):
+                nb = repair(cur, table, key, k, statut)
+            repaired += 1
+            print(f"🔧 {table} {k}/{statut}: {stocke} -> {nb} (attendu {attendu} à la détection)")
+    print(f"✅ Compteurs vérifiés : {repaired} corrigé(s)")
+    return repaired
+
+def main():
+    ap = argparse.ArgumentParser(description="Vérifie et répare les compteurs (restaurant, statut) / (zone, statut).")
+    ap.add_argument("--loop", type=float, default=0, help="Relance toutes les N secondes (0 = un seul passage)")
+    args = ap.parse_args()
+    while True:
+        reconcile()
+        if not args.loop:
+            break
+        time.sleep(args.loop)
+
+if __name__ == "__main__":
+    main()
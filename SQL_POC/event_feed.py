@@ -0,0 +1,140 @@
+# event_feed.py
+# Flux /events du POC SQL : lecture incrémentale de commande_evenement.
+#
+# Équivalent MySQL du stream Redis et des change streams Mongo : UN lecteur par
+# processus (event_source, source de common.event_hub.EventHub) relit toutes les
+# POLL_INTERVAL s les événements d'id > dernier id lu (clé primaire, parcours de
+# plage) ; le hub les répartit entre les clients SSE selon leurs portées
+# (common.event_scopes). La charge MySQL suit le volume d'événements, pas le
+# nombre de navigateurs connectés.
+# L'id d'événement sert de Last-Event-ID : une reconnexion rejoue une fois
+# (replay_events, filtré par les portées du client via la jointure sur commande)
+# ce qu'elle a manqué, puis reprend le flux partagé.
+# Les événements passent par le journal asynchrone (event_journal.py) : ils
+# apparaissent quelques dizaines de ms après le commit.
+#
+# Ids AUTO_INCREMENT et transactions concurrentes (thread du journal de chaque
+# processus, écriture de débordement dans commit(), repli ligne à ligne) : un id
+# peut être validé APRÈS un id plus grand. Le lecteur n'avance donc son curseur que
+# sur des ids contigus ; au-delà d'un trou, les événements sont retenus jusqu'à ce
+# que le trou se comble ou GAP_GRACE s (id jamais validé : rollback, ligne refusée).
+# Les ids diffusés sont ainsi croissants et sans trou rattrapable : le rattrapage
+# Last-Event-ID s'arrête au dernier id diffusé par le hub (le flux fournit la suite).
+
+import time
+
+import config
+
+POLL_INTERVAL = 1.0        # secondes entre deux lectures sans résultat
+BATCH = 100
+GAP_GRACE = 2.0            # secondes d'attente d'un id manquant avant de le sauter
+
+SCOPE_COLUMNS = {
+    "zone": "c.zone",
+    "id_restaurant": "c.id_restaurant",
+    "id_client": "c.id_client",
+    "id_livreur_assigne": "c.id_livreur_assigne",
+    "id": "c.id_commande",
+}
+
+# type commande_evenement -> (event, channel) du schéma commun
+EVENT_TYPES = {
+    "CREATION": ("created", "orders.created"),
+    "PUBLICATION": ("published", "orders.published"),
+    "ASSIGNATION": ("assigned", "orders.assigned"),
+    "ANNULATION": ("cancelled", "orders.cancelled"),
+    "DEPART_LIVRAISON": ("delivery_started", "orders.updated"),
+    "LIVRAISON": ("delivered", "orders.updated"),
+    "INTERET": ("interest", "orders.updated"),
+}
+
+FEED_SQL = """
+    SELECT e.id, e.id_commande, e.ts, e.type, e.acteur_role, e.acteur_id, e.details,
+           c.statut, c.zone, c.id_client, c.id_restaurant, c.id_livreur_assigne
+    FROM commande_evenement e
+    JOIN commande c ON c.id_commande = e.id_commande
+    WHERE e.id > %s {upto} {scope}
+    ORDER BY e.id
+    LIMIT %s
+"""
+
+def scope_clause(scopes):
+    """(fragment SQL, paramètres) : au moins une portée du client."""
+    if not scopes:
+        return "", []
+    ors = " OR ".join(f"{SCOPE_COLUMNS[field]}=%s" for field, _ in scopes)
+    return f"AND ({ors})", [value for _, value in scopes]
+
+def to_event(row):
+    ev, channel = EVENT_TYPES.get(row["type"], ("updated", "orders.updated"))
+    return {
+        "id": str(row["id"]),
+        "event": ev,
+        "channel": channel,
+        "payload": {
+            "id": row["id_commande"],
+            "statut": row["statut"],
+            "zone": row["zone"],
+            "id_client": row["id_client"],
+            "id_restaurant": row["id_restaurant"],
+            "id_livreur_assigne": row["id_livreur_assigne"],
+            "acteur": row["acteur_id"],
+            "details": row["details"],
+        },
+        "ts": int(row["ts"]),
+    }
+
+def last_event_id():
+    with config.get_cursor() as (con, cur):
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM commande_evenement")
+        return int(cur.fetchone()[0])
+
+def fetch_events(after_id, scopes=None, limit=BATCH, upto=None):
+    """Événements d'id > after_id (et <= upto, dans les portées si données) ; la connexion est rendue au pool aussitôt."""
+    scope, params = scope_clause(scopes)
+    bound, bound_params = ("AND e.id <= %s", [upto]) if upto is not None else ("", [])
+    with config.get_cursor(dictionary=True) as (con, cur):
+        cur.execute(FEED_SQL.format(upto=bound, scope=scope), [after_id, *bound_params, *params, limit])
+        return [to_event(r) for r in cur.fetchall()]
+
+def event_id_key(event_id):
+    return int(event_id)
+
+def replay_events(after_id, scopes, upto=None, limit=1000):
+    """
+    Rattrapage d'un client SSE qui revient avec Last-Event-ID, jusqu'au dernier id
+    diffusé par le hub (`upto`) ; id mal formé : rien.
+    """
+    try:
+        cursor = int(after_id)
+        upto = int(upto) if upto is not None else None
+    except (TypeError, ValueError):
+        return []
+    return fetch_events(cursor, scopes, limit, upto)
+
+def event_source():
+    """
+    Source pour EventHub : tous les événements depuis last_id (ou le dernier en base),
+    dans l'ordre des ids, le curseur n'avançant que sur des ids contigus (cf. en-tête).
+    """
+    def source(last_id):
+        cursor = int(last_id) if last_id else last_event_id()
+        held = {}                  # id -> événement lu au-delà d'un trou
+        gap_since = None
+        while True:
+            events = fetch_events(cursor)
+            for e in events:
+                held[int(e["id"])] = e
+            while held:
+                nxt = min(held)
+                if nxt != cursor + 1:
+                    gap_since = gap_since or time.monotonic()
+                    if time.monotonic() - gap_since < GAP_GRACE:
+                        break          # trou : on relira à partir du même curseur
+                    print(f"⚠️ Journal: ids {cursor + 1}..{nxt - 1} absents après {GAP_GRACE}s, ignorés")
+                gap_since = None
+                cursor = nxt
+                yield held.pop(nxt)
+            if len(events) < BATCH or held:
+                time.sleep(POLL_INTERVAL if not held else min(POLL_INTERVAL, GAP_GRACE / 4))
+    return source
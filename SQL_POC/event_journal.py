@@ -0,0 +1,159 @@
+# event_journal.py
+# Écriture asynchrone et groupée du journal commande_evenement.
+
+import time, queue, threading
+from mysql.connector.errors import DataError, IntegrityError
+
+import config
+
+INSERT_EVENTS_SQL = """
+    INSERT INTO commande_evenement (id_commande, ts, acteur_role, acteur_id, type, details)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+def insert_events(cur, events):
+    """Insertion multi-lignes (executemany est réécrit en un seul INSERT)."""
+    cur.executemany(INSERT_EVENTS_SQL, events)
+
+class EventJournal:
+    """
+    Les routes déposent des événements (tuples id_commande, ts, acteur_role,
+    acteur_id, type, details) dans une file bornée ; un thread les écrit par lots
+    toutes les `flush_interval_ms` ms ou dès `batch_size` événements.
+
+    Contre-pression : submit() attend au plus `put_timeout` s quand la file est
+    pleine puis renvoie False, l'appelant écrit alors l'événement lui-même.
+
+    Lot en échec (`max_retries` essais, ou tout de suite si une ligne est invalide :
+    clé étrangère, donnée hors format) : réécrit ligne par ligne, seules les
+    lignes refusées sont perdues et comptées dans `dropped`.
+    stop() (enregistré via atexit) vide la file avant de rendre la main.
+    """
+
+    def __init__(self, max_queue=10000, batch_size=200, flush_interval_ms=50,
+                 put_timeout=0.05, max_retries=3):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self._q = queue.Queue(maxsize=max_queue)
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "rejected": 0,          # file pleine -> écriture synchrone par l'appelant
+            "flushed": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "dropped": 0,           # événements refusés un à un après l'échec du lot
+            "flush_ms_last": 0.0,
+            "flush_ms_max": 0.0,
+            "flush_ms_total": 0.0,
+        }
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="event-journal", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, event) -> bool:
+        if self._stopping.is_set():
+            return False
+        try:
+            self._q.put(event, timeout=self.put_timeout)
+        except queue.Full:
+            self._bump(rejected=1)
+            return False
+        self._bump(enqueued=1)
+        return True
+
+    def stop(self, timeout=5.0):
+        """Arrête le thread après avoir écrit tout ce qui reste dans la file."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+        out["queue_depth"] = self._q.qsize()
+        out["flush_ms_avg"] = round(out["flush_ms_total"] / out["batches"], 3) if out["batches"] else 0.0
+        return out
+
+    # --- interne ---
+    def _bump(self, **deltas):
+        with self._lock:
+            for k, v in deltas.items():
+                self._stats[k] += v
+
+    def _run(self):
+        while True:
+            try:
+                first = self._q.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        for attempt in range(1, self.max_retries + 1):
+            start = time.monotonic()
+            try:
+                with config.get_cursor() as (con, cur):
+                    insert_events(cur, batch)
+            except (IntegrityError, DataError) as e:
+                # ligne invalide : inutile de rejouer le lot entier
+                self._bump(failed_batches=1)
+                print(f"❌ Journal: lot refusé ({len(batch)} évts): {e}")
+                break
+            except Exception as e:
+                self._bump(failed_batches=1)
+                print(f"❌ Journal: échec écriture lot ({len(batch)} évts, essai {attempt}): {e}")
+                time.sleep(0.1 * attempt)
+                continue
+            self._record(len(batch), (time.monotonic() - start) * 1000)
+            return
+        self._flush_rows(batch)
+
+    def _flush_rows(self, batch):
+        """Repli ligne par ligne (un commit par ligne) : seules les lignes refusées sont perdues."""
+        start = time.monotonic()
+        written = 0
+        try:
+            with config.get_cursor() as (con, cur):
+                for event in batch:
+                    try:
+                        cur.execute(INSERT_EVENTS_SQL, event)
+                        con.commit()
+                        written += 1
+                    except (IntegrityError, DataError) as e:
+                        con.rollback()
+                        print(f"❌ Journal: événement ignoré {event[:2]}: {e}")
+        except Exception as e:
+            print(f"❌ Journal: repli ligne à ligne interrompu ({written}/{len(batch)} écrits): {e}")
+        dropped = len(batch) - written
+        if written:
+            self._record(written, (time.monotonic() - start) * 1000)
+        if dropped:
+            self._bump(dropped=dropped)
+
+    def _record(self, n, ms):
+        with self._lock:
+            self._stats["flushed"] += n
+            self._stats["batches"] += 1
+            self._stats["flush_ms_last"] = ms
+            self._stats["flush_ms_total"] += ms
+            self._stats["flush_ms_max"] = max(self._stats["flush_ms_max"], ms)
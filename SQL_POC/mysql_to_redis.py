@@ -1,9 +1,14 @@
 # mysql_to_redis.py
-import json, argparse, time
+import os, sys, json, argparse, time
 from decimal import Decimal
 import mysql.connector
 from redis import Redis
 
+# Index secondaires partagés avec redis_poc.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "REDIS_POC")))
+from redis_indexes import index_order, INDEX_PATTERNS
+from redis_orders import k_order_events as k_events, fields_from_document, interets_from_document, store_order
+
 # ---------- CONFIG ----------
 MYSQL_CFG = dict(
     host="127.0.0.1",
@@ -14,14 +19,6 @@ MYSQL_CFG = dict(
 )
 REDIS_CFG = dict(host="127.0.0.1", port=6379, decode_responses=True)
 
-# ---------- Helpers clés ----------
-def k_order(order_id): return f"order:{order_id}"
-def k_events(order_id): return f"order:{order_id}:events"
-def k_zone_annonces(zone): return f"zone:{zone}:annonces"
-def k_interest_by_order(order_id): return f"interest:by_order:{order_id}"
-def k_interest_by_courier(livreur): return f"interest:by_courier:{livreur}"
-def k_courier_assigned(livreur): return f"courier:{livreur}:assigned"
-
 def to_float(x):
     if isinstance(x, Decimal): return float(x)
     return float(x) if x is not None else None
@@ -132,22 +129,13 @@ def stream_events_from_sql(r: Redis, cnx, order_id):
     cur.close()
 
 def rebuild_indexes_for_order(r: Redis, agg: dict):
-    oid = agg["id"]
-    # Annonces par zone
-    if agg["statut"] == "ANONCEE" and agg.get("zone"):
-        score = agg["timestamps"]["publiee"] or agg["timestamps"]["creation"] or int(time.time())
-        r.zadd(k_zone_annonces(agg["zone"]), {oid: score})
-    # Intérêts
-    for liv in (agg.get("interets") or {}).keys():
-        r.sadd(k_interest_by_order(oid), liv)
-        r.sadd(k_interest_by_courier(liv), oid)
-    # Courses assignées (utile pour la vue livreur)
-    if agg.get("livreur_assigne") and agg["timestamps"].get("assignee"):
-        r.zadd(k_courier_assigned(agg["livreur_assigne"]), {oid: agg["timestamps"]["assignee"]})
+    # Client, restaurant (+statut), annonces par zone, courses du livreur ;
+    # les intérêts sont dans order:{id}:interets (store_order)
+    index_order(r, fields_from_document(agg))
 
 def flush_poc_keys(r: Redis):
     # Supprimer uniquement nos préfixes POC
-    patterns = ["order:*", "zone:*:annonces", "interest:by_order:*", "interest:by_courier:*", "courier:*:assigned"]
+    patterns = ["order:*", *INDEX_PATTERNS, "interest:by_order:*", "interest:by_courier:*"]   # + anciens ensembles d'intérêts
     for pat in patterns:
         cursor = 0
         while True:
@@ -194,7 +182,8 @@ def main():
     if not args.no_redis:
         pipe = r.pipeline()
         for agg in out:
-            pipe.set(k_order(agg["id"]), json.dumps(agg, ensure_ascii=False))
+            # hash order:{id} + lignes + intérêts ; les événements sont rejoués par stream_events_from_sql
+            store_order(pipe, fields_from_document(agg), agg.get("lignes"), interets=interets_from_document(agg))
         pipe.execute()
         print("✅ Agrégats chargés dans Redis")
 
@@ -0,0 +1,69 @@
+# order_cache.py
+# Cache mémoire (par processus) des détails de commande, à durée de vie courte.
+
+import time, threading
+
+class OrderCache:
+    """
+    Cache TTL par id_commande, invalidé à chaque transition de statut.
+
+    Un compteur de génération par commande évite de remettre en cache une
+    lecture commencée avant une invalidation :
+        gen = cache.generation(oid)
+        ... lecture MySQL ...
+        cache.put(oid, valeur, gen)   # ignoré si invalidate(oid) a eu lieu entre-temps
+    """
+
+    def __init__(self, ttl: float = 2.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = {}          # oid -> (expire_at, valeur)
+        self._gen = {}           # oid -> génération
+        self._epoch = 0          # incrémenté quand _gen est vidé (borne mémoire)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "stale_puts": 0}
+
+    def generation(self, oid):
+        with self._lock:
+            return (self._epoch, self._gen.get(oid, 0))
+
+    def get(self, oid):
+        with self._lock:
+            entry = self._data.get(oid)
+            if entry and entry[0] > time.monotonic():
+                self._stats["hits"] += 1
+                return entry[1]
+            if entry:
+                del self._data[oid]
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, oid, value, gen):
+        with self._lock:
+            if (self._epoch, self._gen.get(oid, 0)) != gen:
+                self._stats["stale_puts"] += 1
+                return
+            if len(self._data) >= self.max_entries:
+                self._evict()
+            self._data[oid] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, oid):
+        with self._lock:
+            self._data.pop(oid, None)
+            if len(self._gen) >= 4 * self.max_entries:
+                self._gen.clear()
+                self._epoch += 1
+            self._gen[oid] = self._gen.get(oid, 0) + 1
+            self._stats["invalidations"] += 1
+
+    def _evict(self):
+        now = time.monotonic()
+        for oid in [k for k, (exp, _) in self._data.items() if exp <= now]:
+            del self._data[oid]
+        if len(self._data) >= self.max_entries:
+            # toujours plein : on retire la plus proche de l'expiration
+            del self._data[min(self._data, key=lambda k: self._data[k][0])]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._data), ttl=self.ttl)
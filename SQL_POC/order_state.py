@@ -0,0 +1,110 @@
+# order_state.py
+# Machine à états des commandes (POC SQL).
+#
+#   CREEE -> ANONCEE -> ASSIGNEE -> EN_LIVRAISON -> LIVREE
+#     \________\___________\______________________> ANNULEE
+#
+# Chaque transition est UN seul UPDATE gardé par le statut courant et par le
+# propriétaire (WHERE statut IN (...) AND <owner>=%s) : pas de SELECT préalable,
+# pas de fenêtre de course. rowcount == 1 <=> transition effectuée.
+# L'événement correspondant (commande_evenement) est écrit dans la même transaction,
+# ou confié à EVENT_SINK (journal asynchrone, cf. event_journal.py) s'il est défini.
+
+import time
+
+from event_journal import INSERT_EVENTS_SQL
+
+# None => INSERT immédiat ; sinon callable(event) appelé à la place
+EVENT_SINK = None
+
+TRANSITIONS = {
+    # action: statuts source, statut cible, rôle acteur, colonne propriétaire, SET additionnel, type d'événement
+    "publier": {
+        "from": ("CREEE",), "to": "ANONCEE", "role": "RESTAURANT", "owner": "id_restaurant",
+        "set": "remuneration=%s, date_publiee=UNIX_TIMESTAMP()", "event": "PUBLICATION",
+    },
+    "assigner": {
+        "from": ("ANONCEE",), "to": "ASSIGNEE", "role": "RESTAURANT", "owner": "id_restaurant",
+        "set": "id_livreur_assigne=%s, date_assignee=UNIX_TIMESTAMP()", "event": "ASSIGNATION",
+    },
+    "demarrer": {
+        "from": ("ASSIGNEE",), "to": "EN_LIVRAISON", "role": "LIVREUR", "owner": "id_livreur_assigne",
+        "set": "", "event": "DEPART_LIVRAISON",
+    },
+    "livrer": {
+        "from": ("EN_LIVRAISON",), "to": "LIVREE", "role": "LIVREUR", "owner": "id_livreur_assigne",
+        "set": "date_cloture=UNIX_TIMESTAMP(), livree_par_livreur=%s", "event": "LIVRAISON",
+    },
+    "annuler_client": {
+        "from": ("CREEE", "ANONCEE"), "to": "ANNULEE", "role": "CLIENT", "owner": "id_client",
+        "set": "annule_par='CLIENT', motif_annulation=%s, date_cloture=UNIX_TIMESTAMP()", "event": "ANNULATION",
+    },
+    "annuler_restaurant": {
+        "from": ("CREEE", "ANONCEE", "ASSIGNEE"), "to": "ANNULEE", "role": "RESTAURANT", "owner": "id_restaurant",
+        "set": "annule_par='RESTAURANT', motif_annulation=%s, date_cloture=UNIX_TIMESTAMP()", "event": "ANNULATION",
+    },
+}
+
+def log_event(cur, id_commande, acteur_role, acteur_id, type_, details=None):
+    """Ajoute une ligne au journal commande_evenement (transaction courante ou EVENT_SINK)."""
+    event = (id_commande, int(time.time()), acteur_role, acteur_id, type_, (details or "")[:255])
+    if EVENT_SINK is not None:
+        EVENT_SINK(event)
+    else:
+        cur.execute(INSERT_EVENTS_SQL, event)
+
+def transition(cur, id_commande, action, acteur_id, *set_params, details=None):
+    """
+    Applique `action` si la commande est dans un statut source et appartient à acteur_id.
+    set_params : valeurs des %s du SET additionnel (ex. rémunération, motif).
+    Retourne True si la transition a eu lieu, False sinon (statut ou propriétaire invalide).
+    """
+    t = TRANSITIONS[action]
+    set_sql = "statut=%s" + (", " + t["set"] if t["set"] else "")
+    sources = ", ".join(["%s"] * len(t["from"]))
+    cur.execute(
+        f"UPDATE commande SET {set_sql} "
+        f"WHERE id_commande=%s AND {t['owner']}=%s AND statut IN ({sources})",
+        (t["to"], *set_params, id_commande, acteur_id, *t["from"]),
+    )
+    if cur.rowcount != 1:
+        return False
+    log_event(cur, id_commande, t["role"], acteur_id, t["event"], details)
+    return True
+
+def add_interest(cur, id_commande, id_livreur, temps_estime=None, commentaire=None):
+    """
+    Intérêt d'un livreur, seulement si la commande est ANONCEE (INSERT ... SELECT gardé).
+    ON DUPLICATE KEY : un second clic ne crée rien (rowcount 0), sans SELECT préalable.
+    Retourne True si l'intérêt vient d'être enregistré.
+    """
+    cur.execute(
+        """
+        INSERT INTO interet (id_commande, id_livreur, ts, temps_estime, commentaire)
+        SELECT c.id_commande, %s, UNIX_TIMESTAMP(), %s, %s
+        FROM commande c
+        WHERE c.id_commande=%s AND c.statut='ANONCEE'
+        ON DUPLICATE KEY UPDATE interet.id_livreur = interet.id_livreur
+        """,
+        (id_livreur, temps_estime, commentaire, id_commande),
+    )
+    if cur.rowcount != 1:
+        return False
+    log_event(cur, id_commande, "LIVREUR", id_livreur, "INTERET",
+              f"ETA {temps_estime} min" if temps_estime else None)
+    return True
+
+def remove_interest(cur, id_commande, id_livreur):
+    """Retire l'intérêt d'un livreur tant que la commande est encore ANONCEE."""
+    cur.execute(
+        """
+        DELETE i FROM interet i
+        JOIN commande c ON c.id_commande = i.id_commande
+        WHERE i.id_commande=%s AND i.id_livreur=%s AND c.statut='ANONCEE'
+        """,
+        (id_commande, id_livreur),
+    )
+    if cur.rowcount != 1:
+        return False
+    log_event(cur, id_commande, "LIVREUR", id_livreur, "INTERET", "Intérêt retiré")
+    return True
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+"""
+Code partagé par les trois POC (SQL, Redis, MongoDB).
+Chaque backend ajoute la racine du dépôt à sys.path puis importe common.<module>.
+"""
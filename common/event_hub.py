@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Diffusion en processus des événements de commande vers les clients SSE.
+
+Un seul thread lecteur par processus (XREAD sur orders:events, change stream
+Mongo, ...) alimente le hub ; chaque client /events n'a plus qu'une file
+bornée en mémoire au lieu de sa propre connexion Redis / Mongo.
+
+  - portées (common.event_scopes) : chaque abonné est rangé sous les canaux de
+    ses portées (orders.zone.{z}, orders.restaurant.{id}, ...) ; un événement
+    n'est présenté qu'aux abonnés des canaux de son payload : le coût par
+    événement suit le nombre d'abonnés concernés, pas le nombre total.
+    Sans portée = tous les événements ;
+  - client lent : file pleine => le client est déconnecté (événement `dropped`),
+    le navigateur se reconnecte avec Last-Event-ID et rattrape depuis la source ;
+  - heartbeat : commentaire SSE toutes les `heartbeat` s sans événement ;
+  - stats() : clients connectés, événements livrés / perdus, clients coupés.
+
+Avec le serveur Flask threadé, chaque connexion SSE garde son thread ; sous
+gunicorn + gevent (monkey patching), les files et l'attente deviennent coopératives.
+"""
+
+import json, time, queue, threading
+
+from common.event_scopes import event_scopes, channel_name
+
+class Subscription:
+    def __init__(self, scopes=None, max_queue=256):
+        self.channels = {channel_name(sc) for sc in (scopes or [])}
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.closed = None          # motif de fermeture (None = active)
+
+    def matches(self, event) -> bool:
+        if not self.channels:
+            return True
+        return any(channel_name(sc) in self.channels for sc in event_scopes(event.get("payload")))
+
+    def close(self, reason):
+        """Vide la file et y dépose la fin de flux (appelé par le thread lecteur)."""
+        self.closed = reason
+        try:
+            while True:
+                self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        self.queue.put_nowait(None)
+
+def sse(event) -> str:
+    """Message SSE ; l'id (si présent) sert de Last-Event-ID à la reconnexion."""
+    event = dict(event)
+    eid = event.pop("id", None)
+    head = f"id: {eid}\n" if eid else ""
+    return f"{head}data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+class EventHub:
+    """
+    source(last_id) : générateur d'événements (dict event/channel/payload/ts, + id
+    éventuel) lu par le thread du hub. S'il lève une exception, il est relancé
+    après `retry_delay` s depuis le dernier id reçu.
+    id_key(id) : clé de tri des ids, pour ignorer en file ce qui a déjà été rejoué.
+    """
+
+    def __init__(self, source, name="event-hub", max_queue=256, heartbeat=15, retry_delay=1.0, id_key=None):
+        self.source = source
+        self.name = name
+        self.max_queue = max_queue
+        self.heartbeat = heartbeat
+        self.retry_delay = retry_delay
+        self.id_key = id_key
+        self.last_id = None
+        self._subs = set()
+        self._firehose = set()      # abonnés sans portée
+        self._by_channel = {}       # canal -> abonnés
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {
+            "events": 0,              # reçus de la source
+            "delivered": 0,           # mis en file chez un client
+            "dropped_events": 0,      # perdus pour cause de file pleine
+            "dropped_clients": 0,     # clients lents déconnectés
+            "source_errors": 0,
+        }
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                for event in self.source(self.last_id):
+                    if event.get("id"):
+                        self.last_id = event["id"]
+                    self.publish(event)
+            except Exception as e:
+                self._stats["source_errors"] += 1
+                print(f"⚠️ {self.name} : source interrompue ({e}), reprise dans {self.retry_delay}s")
+            time.sleep(self.retry_delay)
+
+    def publish(self, event):
+        self._stats["events"] += 1
+        channels = [channel_name(sc) for sc in event_scopes(event.get("payload"))]
+        with self._lock:
+            subs = set(self._firehose)
+            for ch in channels:
+                subs.update(self._by_channel.get(ch, ()))
+        for sub in subs:
+            if sub.closed:
+                continue
+            try:
+                sub.queue.put_nowait(event)
+                self._stats["delivered"] += 1
+            except queue.Full:
+                self._stats["dropped_events"] += 1
+                self._stats["dropped_clients"] += 1
+                self.unsubscribe(sub)
+                sub.close("slow_consumer")
+
+    def subscribe(self, scopes=None) -> Subscription:
+        self.start()
+        sub = Subscription(scopes, self.max_queue)
+        with self._lock:
+            self._subs.add(sub)
+            if not sub.channels:
+                self._firehose.add(sub)
+            for ch in sub.channels:
+                self._by_channel.setdefault(ch, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subs.discard(sub)
+            self._firehose.discard(sub)
+            for ch in sub.channels:
+                subs = self._by_channel.get(ch)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._by_channel[ch]
+
+    def stream(self, sub, replay=()):
+        """
+        Générateur SSE pour un abonné : d'abord `replay` (rattrapage depuis la
+        source durable), puis la file, avec heartbeat. Désabonne à la fin.
+        """
+        seen = None
+        try:
+            yield "retry: 3000\n\n"
+            for event in replay:
+                seen = event.get("id") or seen
+                if sub.matches(event):
+                    yield sse(event)
+            while True:
+                try:
+                    event = sub.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    yield f"event: dropped\ndata: {json.dumps({'reason': sub.closed})}\n\n"
+                    return
+                if seen and self.id_key and event.get("id") and self.id_key(event["id"]) <= self.id_key(seen):
+                    continue
+                yield sse(event)
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self) -> dict:
+        with self._lock:
+            clients = len(self._subs)
+            channels = len(self._by_channel)
+        return {**self._stats, "clients": clients, "channels": channels, "last_id": self.last_id,
+                "running": bool(self._thread and self._thread.is_alive())}
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Portée des flux /events : quels événements de commande un client SSE reçoit.
+
+Une portée est un couple (champ du payload, valeur) ; un événement est transmis
+s'il correspond à AU MOINS une portée du client. Le filtrage se fait côté
+serveur, dans le hub de chaque backend (common.event_hub : canaux
+orders.zone.{z}, orders.restaurant.{id}, ...) ; le rattrapage MySQL
+(Last-Event-ID) filtre en plus par clause WHERE sur commande_evenement.
+
+La portée vient de l'utilisateur connecté (cookie / session) :
+  CLIENT      -> ses commandes
+  RESTAURANT  -> les commandes du restaurant
+  LIVREUR     -> les commandes de sa zone + celles qui lui sont assignées
+Les paramètres ?zone=&restaurant=&client=&livreur= ne peuvent que la restreindre
+(sous-ensemble des portées de l'utilisateur, ex. un livreur et sa propre zone).
+?order=<id> n'est accepté que si l'utilisateur est partie à la commande (son client,
+son restaurant ou son livreur assigné), lu par le backend via order_parties(oid).
+Sans utilisateur, ou demande hors de ses portées : pas de flux (None), les
+routes /events répondent 401 / 403 ; jamais de flux complet par défaut.
+"""
+
+SCOPE_FIELDS = ("zone", "id_restaurant", "id_client", "id_livreur_assigne", "id")
+
+# paramètre de requête -> champ du payload
+SCOPE_PARAMS = {"zone": "zone", "restaurant": "id_restaurant", "client": "id_client",
+                "livreur": "id_livreur_assigne", "order": "id"}
+
+# rôle -> champ de la commande qui désigne l'utilisateur
+ROLE_FIELDS = {"CLIENT": "id_client", "RESTAURANT": "id_restaurant", "LIVREUR": "id_livreur_assigne"}
+
+def scopes_from_user(user) -> list:
+    if not user:
+        return []
+    role, uid = user.get("role"), user.get("id")
+    if role == "CLIENT":
+        return [("id_client", uid)]
+    if role == "RESTAURANT":
+        return [("id_restaurant", uid)]
+    if role == "LIVREUR":
+        scopes = [("id_livreur_assigne", uid)]
+        if user.get("zone"):
+            scopes.append(("zone", user["zone"]))
+        return scopes
+    return []
+
+def order_scope(user, oid, order_parties):
+    """("id", oid) si l'utilisateur est partie à la commande, None sinon (ou commande absente)."""
+    field = ROLE_FIELDS.get((user or {}).get("role"))
+    parties = order_parties(oid) if field and order_parties else None
+    if parties and parties.get(field) and parties.get(field) == user.get("id"):
+        return ("id", oid)
+    return None
+
+def requested_scopes(args, user, order_parties=None):
+    """
+    Portées demandées en paramètres, restreintes à celles de l'utilisateur ; sans
+    paramètre, toutes celles de l'utilisateur. None si rien n'est autorisé.
+    order_parties(oid) -> {id_client, id_restaurant, id_livreur_assigne} ou None.
+    """
+    allowed = scopes_from_user(user)
+    if not allowed:
+        return None
+    if args.get("order"):
+        scope = order_scope(user, args.get("order"), order_parties)
+        if scope:
+            allowed = allowed + [scope]
+    requested = [(field, args.get(param)) for param, field in SCOPE_PARAMS.items() if args.get(param)]
+    if not requested:
+        return allowed
+    scopes = [sc for sc in requested if sc in allowed]
+    return scopes or None
+
+def event_scopes(payload) -> list:
+    """Portées couvertes par un événement (valeurs présentes dans son payload)."""
+    payload = payload if isinstance(payload, dict) else {}
+    return [(f, payload[f]) for f in SCOPE_FIELDS if payload.get(f)]
+
+def channel_name(scope) -> str:
+    """Nom de canal d'une portée, ex. ("zone", "paris-1") -> orders.zone.paris-1."""
+    field, value = scope
+    name = "order" if field == "id" else field.replace("id_", "", 1)
+    return f"orders.{name}.{value}"
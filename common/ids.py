@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Identifiants de commande triables par date, sans collision, partagés par les 3 POC.
+
+    cmd_ + 12 caractères base32 Crockford (60 bits, tient dans VARCHAR(16))
+
+    | 41 bits : ms depuis EPOCH_MS | 7 bits : nœud | 12 bits : séquence |
+
+  - largeur fixe + alphabet trié en ASCII => ordre lexicographique = ordre de création
+    (MySQL : insertions en fin de B-tree ; Redis/Mongo : tri par id = tri par date) ;
+  - 4096 ids par milliseconde et par nœud, au-delà on attend la milliseconde suivante ;
+  - horloge qui recule : on reste sur la dernière milliseconde émise.
+41 bits de ms couvrent ~69 ans à partir de EPOCH_MS.
+
+Nœud : unique parmi les processus vivants, sinon deux processus peuvent émettre le
+même id dans la même milliseconde (Redis fusionne les deux commandes, MySQL / Mongo
+lèvent une clé dupliquée). Donc jamais tiré au hasard :
+  - variable d'environnement ORDER_NODE_ID (0..127), fixée par le déploiement ;
+  - sinon bail pris dans la base du POC (set_node_allocator : clé Redis SET NX EX,
+    ligne MySQL, document Mongo), renouvelé par un thread tant que le processus vit ;
+    un nœud abandonné (processus tué) redevient libre à l'expiration du bail ;
+  - aucun des deux, ou plus de nœud libre : RuntimeError à la création de l'id.
+"""
+
+import os, socket, threading, time
+
+EPOCH_MS = 1704067200000          # 2024-01-01T00:00:00Z
+PREFIX = "cmd_"
+
+TIMESTAMP_BITS = 41
+NODE_BITS = 7
+SEQUENCE_BITS = 12
+ID_CHARS = 12                     # 60 bits / 5 bits par caractère
+
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"   # Crockford, ordre ASCII croissant
+_MAX_SEQ = (1 << SEQUENCE_BITS) - 1
+
+NODE_COUNT = 1 << NODE_BITS
+NODE_LEASE = 300                  # s, durée d'un bail de nœud (renouvelé au tiers)
+
+_allocator = None                 # (claim, renew) enregistrés par le backend
+
+def node_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def set_node_allocator(claim, renew):
+    """
+    claim(owner, ttl) -> nœud libre réservé pour ttl s (None si aucun) ;
+    renew(node, owner, ttl) -> True si le bail est prolongé (toujours détenu).
+    """
+    global _allocator
+    _allocator = (claim, renew)
+
+def _env_node():
+    raw = os.environ.get("ORDER_NODE_ID")
+    if raw is None:
+        return None
+    node = int(raw)
+    if not 0 <= node < NODE_COUNT:
+        raise RuntimeError(f"ORDER_NODE_ID={raw} hors de 0..{NODE_COUNT - 1}")
+    return node
+
+def _claim():
+    if _allocator is None:
+        raise RuntimeError("Aucun nœud d'id de commande : fixer ORDER_NODE_ID ou enregistrer un allocateur")
+    node = _allocator[0](node_owner(), NODE_LEASE)
+    if node is None:
+        raise RuntimeError(f"Aucun nœud d'id de commande libre ({NODE_COUNT} baux actifs)")
+    print(f"🆔 Nœud d'id de commande {node} ({node_owner()}, bail {NODE_LEASE}s)")
+    return node
+
+def _encode(n: int) -> str:
+    out = []
+    for _ in range(ID_CHARS):
+        out.append(_ALPHABET[n & 31])
+        n >>= 5
+    return "".join(reversed(out))
+
+def _decode(s: str) -> int:
+    n = 0
+    for c in s.upper():
+        n = (n << 5) | _ALPHABET.index(c)
+    return n
+
+class IdGenerator:
+    def __init__(self, node, prefix=PREFIX):
+        if not 0 <= node < NODE_COUNT:
+            raise ValueError(f"Nœud {node} hors de 0..{NODE_COUNT - 1}")
+        self.node = node
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._seq = 0
+
+    def next_id(self) -> str:
+        with self._lock:
+            ms = max(int(time.time() * 1000) - EPOCH_MS, self._last_ms)
+            if ms == self._last_ms:
+                self._seq += 1
+                if self._seq > _MAX_SEQ:
+                    # séquence épuisée pour cette ms : on attend la suivante
+                    while ms <= self._last_ms:
+                        time.sleep(0.0001)
+                        ms = int(time.time() * 1000) - EPOCH_MS
+                    self._seq = 0
+            else:
+                self._seq = 0
+            self._last_ms = ms
+            n = (ms << (NODE_BITS + SEQUENCE_BITS)) | (self.node << SEQUENCE_BITS) | self._seq
+        return self.prefix + _encode(n)
+
+_default = None
+_default_lock = threading.Lock()
+
+def _renew_loop(gen):
+    """Prolonge le bail ; perdu (expiré et repris ailleurs) => nouveau nœud ; erreur => nouveau bail au prochain id."""
+    global _default
+    claim, renew = _allocator
+    while True:
+        time.sleep(NODE_LEASE / 3)
+        try:
+            if renew(gen.node, node_owner(), NODE_LEASE):
+                continue
+            print(f"⚠️ Bail du nœud {gen.node} perdu : nouveau nœud")
+            node = _claim()
+        except Exception as e:
+            print(f"❌ Nœud d'id de commande : renouvellement impossible ({e}), nouveau bail au prochain id")
+            with _default_lock:
+                _default = None
+            return
+        with gen._lock:
+            gen.node = node
+
+def new_order_id() -> str:
+    """Nouvel id de commande (générateur du processus, nœud réservé au premier appel)."""
+    global _default
+    gen = _default
+    if gen is None:
+        with _default_lock:
+            if _default is None:
+                node = _env_node()
+                leased = node is None
+                _default = IdGenerator(_claim() if leased else node)
+                if leased:
+                    threading.Thread(target=_renew_loop, args=(_default,), name="order-id-node", daemon=True).start()
+            gen = _default
+    return gen.next_id()
+
+def id_timestamp(order_id: str):
+    """Epoch (secondes, float) encodé dans un id généré ici, None pour un id ancien format."""
+    body = order_id[len(PREFIX):] if order_id.startswith(PREFIX) else order_id
+    if len(body) != ID_CHARS:
+        return None
+    try:
+        n = _decode(body)
+    except ValueError:
+        return None
+    return ((n >> (NODE_BITS + SEQUENCE_BITS)) + EPOCH_MS) / 1000
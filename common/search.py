@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Normalisation de texte pour la recherche de restaurants.
+
+Les trois backends découpent noms et requêtes de la même façon :
+  - pliage des accents et de la casse ("Crème Brûlée" -> "creme brulee"),
+  - tokens alphanumériques ("paris-1" -> ["paris", "1"]),
+  - préfixes des tokens pour la recherche "au fil de la frappe".
+"""
+
+import re
+import unicodedata
+
+SEARCH_LIMIT = 20        # nombre max de résultats renvoyés
+MAX_PREFIX_LEN = 20      # au-delà, les préfixes indexés sont tronqués
+
+_LIGATURES = str.maketrans({"œ": "oe", "Œ": "oe", "æ": "ae", "Æ": "ae", "ß": "ss"})
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def fold(text: str) -> str:
+    """Minuscules sans accents ni ligatures."""
+    text = (text or "").translate(_LIGATURES)
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+def tokens(text: str) -> list:
+    """Tokens alphanumériques pliés, dans l'ordre, sans doublons."""
+    return list(dict.fromkeys(_TOKEN_RE.findall(fold(text))))
+
+def prefixes(token: str) -> list:
+    """Tous les préfixes d'un token (1 .. MAX_PREFIX_LEN caractères)."""
+    return [token[:i] for i in range(1, min(len(token), MAX_PREFIX_LEN) + 1)]
+
+def search_terms(*texts: str) -> list:
+    """Ensemble des préfixes de tous les tokens des textes donnés (pour un index inversé)."""
+    out = {}
+    for t in texts:
+        for tok in tokens(t):
+            for p in prefixes(tok):
+                out[p] = None
+    return list(out)